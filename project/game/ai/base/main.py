@@ -78,3 +78,27 @@ class InterfaceAI(object):
         """
         Will be called after other player riichi
         """
+
+    def see_discard(self, player_seat, tile):
+        """
+        Will be called after discard of any player, including our bot
+        :param tile: 136 tile format
+        """
+
+    def see_meld(self, player_seat, meld):
+        """
+        Will be called after called meld of any player
+        """
+
+    def see_dora_indicator(self, tile):
+        """
+        Will be called after new dora indicator was revealed
+        :param tile: 136 tile format
+        """
+
+    def table_changed(self):
+        """
+        Will be called when state of all players was set directly:
+        in the start of new round (after erase_state) and after table state restore.
+        You can recalculate here AI attributes that are updated by table events
+        """
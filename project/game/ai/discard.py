@@ -23,6 +23,9 @@ class DiscardOption(object):
     valuation = None
     # how danger this tile is
     danger = None
+    # probabilities to reach tenpai and to win by self draw from monte carlo rollouts, if they were played
+    tenpai_rate = None
+    agari_rate = None
 
     def __init__(self, player, tile_to_discard, shanten, waiting, tiles_count, danger=100):
         """
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+from mahjong.constants import HONOR_INDICES
+
+from game.ai.first_version.defence.defence import DefenceTile
+
+# bits of one suit in the safe tiles mask
+SUIT_MASK = 0x1ff
+
+# danger of 1-4-7, 2-5-8 and 3-6-9 suji tiles
+SUJI_DANGER = [
+    [20, 30, 40],
+    [30, 30, 30],
+    [40, 30, 20],
+]
+
+# all indices shifted to -1
+KABE_MATRIX = [
+    {'indices': [1], 'blocked_tiles': [0]},
+    {'indices': [2], 'blocked_tiles': [0, 1]},
+    {'indices': [3], 'blocked_tiles': [1, 2]},
+    {'indices': [4], 'blocked_tiles': [2, 6]},
+    {'indices': [5], 'blocked_tiles': [6, 7]},
+    {'indices': [6], 'blocked_tiles': [7, 8]},
+    {'indices': [7], 'blocked_tiles': [8]},
+    {'indices': [1, 5], 'blocked_tiles': [3]},
+    {'indices': [2, 6], 'blocked_tiles': [4]},
+    {'indices': [3, 7], 'blocked_tiles': [5]},
+    {'indices': [1, 4], 'blocked_tiles': [2, 3]},
+    {'indices': [2, 5], 'blocked_tiles': [3, 4]},
+    {'indices': [3, 6], 'blocked_tiles': [4, 5]},
+    {'indices': [4, 7], 'blocked_tiles': [5, 6]},
+]
+
+
+class DangerMap(object):
+    """
+    Danger of each tile in 34 format against one enemy, lower is safer.
+    It is updated by table events: after a discard only suits
+    with changed safe tiles are recounted. Safe tiles can be also set
+    directly to the player, so they are checked again on each read
+    """
+    UNKNOWN = DefenceTile.DANGER
+
+    player = None
+    table = None
+
+    # genbutsu, furiten and temporary safe tiles, bit for each tile in 34 format
+    safe_mask = 0
+    # danger of suji tiles, UNKNOWN for other tiles
+    _suji_34 = None
+    # safe tiles and suji together
+    _danger = None
+
+    def __init__(self, player):
+        """
+        :param player: instance of EnemyPlayer
+        """
+        self.player = player
+        self.table = player.table
+
+        self.recalculate()
+
+    def recalculate(self):
+        self.safe_mask = self.player.all_safe_mask
+        self._suji_34 = [self.UNKNOWN] * 34
+        self._danger = [self.UNKNOWN] * 34
+
+        self._update_suji()
+
+    def update_safe_tiles(self):
+        """
+        Discard of any player can make tiles safe against the enemy (or not safe after his own discard)
+        """
+        safe_mask = self.player.all_safe_mask
+        changed_mask = safe_mask ^ self.safe_mask
+        self.safe_mask = safe_mask
+
+        for suit in range(0, 4):
+            if changed_mask >> (suit * 9) & SUIT_MASK:
+                self._update_suit(suit)
+
+    def add_dora_indicator(self):
+        # dora suji tiles are more dangerous
+        self._update_suji()
+
+    @property
+    def suji_34(self):
+        self._sync_safe_tiles()
+        return self._suji_34
+
+    @property
+    def danger(self):
+        self._sync_safe_tiles()
+        return self._danger
+
+    def is_safe(self, tile):
+        """
+        :param tile: 34 tile format
+        """
+        return self.player.all_safe_mask >> tile & 1 == 1
+
+    def _sync_safe_tiles(self):
+        if self.player.all_safe_mask != self.safe_mask:
+            self.update_safe_tiles()
+
+    def _update_suji(self):
+        for suit in range(0, 4):
+            self._update_suit(suit)
+
+    def _update_suit(self, suit):
+        base = suit * 9
+        safe = self.safe_mask >> base
+
+        # there is no suji for honors
+        if suit < 3:
+            for first in range(0, 3):
+                # 4 or 1 and 7 were discarded
+                is_suji = safe >> (first + 3) & 1 or (safe >> first & 1 and safe >> (first + 6) & 1)
+                for index in range(0, 3):
+                    tile = base + first + index * 3
+                    danger = self.UNKNOWN
+                    if is_suji:
+                        danger = SUJI_DANGER[first][index]
+                        # mark dora tiles as dangerous tiles to discard
+                        if self.table.is_dora(tile * 4):
+                            danger += 100
+                    self._suji_34[tile] = danger
+
+        for tile in range(base, min(base + 9, 34)):
+            self._danger[tile] = DefenceTile.SAFE if safe >> (tile - base) & 1 else self._suji_34[tile]
+
+
+def visible_danger(tiles_34, revealed_tiles):
+    """
+    Danger of tiles based only on visible tiles, it is the same against all enemies.
+    Impossible waits: fourth honor, pair waits: third honor.
+    Kabe: neighbour tiles are visible, so ryanmen wait is impossible
+    :param tiles_34: our hand
+    :param revealed_tiles: count of revealed tiles on the table
+    :return: list of 34 danger values
+    """
+    visible_34 = [x + y for x, y in zip(tiles_34, revealed_tiles)]
+    danger = [DangerMap.UNKNOWN] * 34
+
+    for tile in HONOR_INDICES:
+        _mark_visible_tile(danger, visible_34, tile)
+
+    for base in range(0, 27, 9):
+        # "kabe" - 4 revealed tiles
+        kabe_tiles = set([x for x in range(0, 9) if visible_34[base + x] == 4])
+        if not kabe_tiles:
+            continue
+
+        for matrix_item in KABE_MATRIX:
+            if kabe_tiles.issuperset(matrix_item['indices']):
+                for index in matrix_item['blocked_tiles']:
+                    _mark_visible_tile(danger, visible_34, base + index)
+
+    return danger
+
+
+def _mark_visible_tile(danger, visible_34, tile):
+    if visible_34[tile] == 4:
+        danger[tile] = DefenceTile.SAFE
+
+    if visible_34[tile] == 3:
+        danger[tile] = DefenceTile.ALMOST_SAFE_TILE
@@ -23,6 +23,8 @@ class DefenceTile(object):
     # 100% safe tile
     SAFE = 0
     ALMOST_SAFE_TILE = 10
+    # tile from other suit against honitsu hand
+    OTHER_SUIT_TILE = 15
     DANGER = 200
 
     # how danger this tile is
@@ -1,11 +1,36 @@
 from mahjong.tile import TilesConverter
-from mahjong.utils import plus_dora, count_tiles_by_suits, is_aka_dora
+from mahjong.utils import plus_dora, is_aka_dora, is_sou, is_man, is_pin, is_honor
+
+from game.ai.first_version.defence.danger import DangerMap
+
+# the same order as in mahjong.utils.count_tiles_by_suits
+SUITS = [is_sou, is_man, is_pin, is_honor]
 
 
 class EnemyAnalyzer(object):
+    """
+    Analyzer is created once for each enemy by the defence handler,
+    and it is updated by table events after each discard, meld, riichi and dora indicator.
+    So threat checks are not recounting all discards and melds
+    """
     player = None
+    table = None
     chosen_suit = None
-    initialized = False
+    is_threatening = False
+
+    # count of each discarded tile in 34 format
+    discards_34 = None
+    # count of discarded tiles by suits, in the SUITS order
+    discard_suits = None
+    count_of_discards = 0
+
+    meld_tiles_34 = None
+    # count of meld tiles by suits, in the SUITS order
+    meld_suits = None
+    count_of_meld_dora = 0
+
+    # danger of each tile against the enemy
+    danger_map = None
 
     def __init__(self, player):
         """
@@ -13,11 +38,51 @@ class EnemyAnalyzer(object):
         """
         self.player = player
         self.table = player.table
+        self.danger_map = DangerMap(player)
 
-        self.chosen_suit = None
+        self.recalculate()
+
+    def recalculate(self):
+        """
+        Calculate everything from the player state,
+        it is needed after a new round or when the player state was changed directly
+        """
+        self.discards_34 = [0] * 34
+        self.discard_suits = [0] * 4
+        self.count_of_discards = 0
+        for tile in self.player.discards:
+            self._add_discard(tile.value)
+
+        self._update_melds()
+        self._update_threat()
+        self.danger_map.recalculate()
+
+    def add_discarded_tile(self, tile):
+        """
+        :param tile: 136 tile format
+        """
+        # the same as in the player, sometimes tile is empty
+        if tile:
+            self._add_discard(tile)
+            self._update_threat()
+
+    def update_safe_tiles(self):
+        """
+        It is called after discard of each player, including our discards
+        """
+        self.danger_map.update_safe_tiles()
+
+    def add_called_meld(self):
+        self._update_melds()
+        self._update_threat()
 
-        # we need it to determine user's chosen suit
-        self.initialized = self.is_threatening
+    def add_called_riichi(self):
+        self._update_threat()
+
+    def add_dora_indicator(self):
+        self._update_meld_dora()
+        self._update_threat()
+        self.danger_map.add_dora_indicator()
 
     @property
     def is_dealer(self):
@@ -42,35 +107,50 @@ class EnemyAnalyzer(object):
 
         return False
 
-    @property
-    def is_threatening(self):
+    def _add_discard(self, tile):
+        tile //= 4
+        self.discards_34[tile] += 1
+        self.discard_suits[_suit_index(tile)] += 1
+        self.count_of_discards += 1
+
+    def _update_melds(self):
+        self.meld_tiles_34 = TilesConverter.to_34_array(self.player.meld_tiles)
+        self.meld_suits = [0] * 4
+        for tile in range(0, 34):
+            self.meld_suits[_suit_index(tile)] += self.meld_tiles_34[tile]
+
+        self._update_meld_dora()
+
+    def _update_meld_dora(self):
+        meld_tiles = self.player.meld_tiles
+        dora_count = sum([plus_dora(x, self.table.dora_indicators) for x in meld_tiles])
+        # aka dora
+        dora_count += sum([1 for x in meld_tiles if is_aka_dora(x, self.table.has_open_tanyao)])
+        self.count_of_meld_dora = dora_count
+
+    def _update_threat(self):
         """
         Should we fold against this player or not
-        :return: boolean
         """
+        self.chosen_suit = None
+        self.is_threatening = self._is_threatening()
+
+    def _is_threatening(self):
         if self.player.in_riichi:
             return True
 
-        discards = self.player.discards
-        discards_34 = TilesConverter.to_34_array([x.value for x in discards])
-
         is_honitsu_open_sets, open_hand_suit = False, None
-        is_honitsu_discards, discard_suit = self._is_honitsu_discards(discards_34)
+        is_honitsu_discards, discard_suit = self._is_honitsu_discards()
 
-        meld_tiles = self.player.meld_tiles
-        meld_tiles_34 = TilesConverter.to_34_array(meld_tiles)
-        if meld_tiles:
-            dora_count = sum([plus_dora(x, self.table.dora_indicators) for x in meld_tiles])
-            # aka dora
-            dora_count += sum([1 for x in meld_tiles if is_aka_dora(x, self.table.has_open_tanyao)])
+        if self.player.melds:
             # enemy has a lot of dora tiles in his opened sets
             # so better to fold against him
-            if dora_count >= 3 and len(self.player.discards) > 8:
+            if self.count_of_meld_dora >= 3 and self.count_of_discards > 8:
                 return True
 
             # check that user has a discard and melds that looks like honitsu
-            if len(self.player.discards) >= 10:
-                is_honitsu_open_sets, open_hand_suit = self._is_honitsu_open_sets(meld_tiles_34)
+            if self.count_of_discards >= 10:
+                is_honitsu_open_sets, open_hand_suit = self._is_honitsu_open_sets()
 
         if is_honitsu_open_sets:
             # for 2 opened melds we had to check discard, to be sure
@@ -85,52 +165,54 @@ class EnemyAnalyzer(object):
 
         return False
 
-    def _is_honitsu_open_sets(self, meld_tiles_34):
+    def _is_honitsu_open_sets(self):
         """
         Check that user opened all sets with same suit
-        :param meld_tiles_34:
         :return:
         """
-        total_sets = sum(meld_tiles_34) // 3
+        total_sets = sum(self.meld_suits) // 3
         if total_sets < 2:
             return False, None
 
-        result = count_tiles_by_suits(meld_tiles_34)
-
-        suits = [x for x in result if x['name'] != 'honor']
-        suits = sorted(suits, key=lambda x: x['count'], reverse=True)
+        suits = sorted(range(0, 3), key=lambda x: self.meld_suits[x], reverse=True)
 
         # for honitsu we can have tiles only in one suit
-        if suits[1]['count'] == 0 and suits[2]['count'] == 0:
-            return True, suits[0]['function']
+        if self.meld_suits[suits[1]] == 0 and self.meld_suits[suits[2]] == 0:
+            return True, SUITS[suits[0]]
 
         return False, None
 
-    def _is_honitsu_discards(self, discards_34):
+    def _is_honitsu_discards(self):
         """
         Check that user opened all sets with same suit
-        :param discards_34:
         :return:
         """
-        total_discards = sum(discards_34)
+        total_discards = self.count_of_discards
 
         # there is no sense to analyze earlier discards
         if total_discards < 6:
             return False, None
 
-        result = count_tiles_by_suits(discards_34)
-
-        honors = [x for x in result if x['name'] == 'honor'][0]
-        suits = [x for x in result if x['name'] != 'honor']
-        suits = sorted(suits, key=lambda x: x['count'], reverse=False)
+        suits = sorted(range(0, 3), key=lambda x: self.discard_suits[x])
 
-        less_suit = suits[0]['count']
+        less_suit = self.discard_suits[suits[0]]
         percentage_of_less_suit = (less_suit / total_discards) * 100
-        percentage_of_honor_tiles = (honors['count'] / total_discards) * 100
+        percentage_of_honor_tiles = (self.discard_suits[3] / total_discards) * 100
 
         # there is not too much one suit + honor tiles in the discard
         # so we can tell that user trying to collect honitsu
         if percentage_of_less_suit <= 20 and percentage_of_honor_tiles <= 30:
-            return True, suits[0]['function']
+            return True, SUITS[suits[0]]
 
         return False, None
+
+
+def _suit_index(tile):
+    """
+    :param tile: 34 tile format
+    :return: index in SUITS
+    """
+    if tile >= 27:
+        return 3
+    # man, pin and sou are going one by one in the 34 format
+    return [1, 2, 0][tile // 9]
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 from mahjong.constants import HONOR_INDICES
 
+from game.ai.first_version.defence.danger import visible_danger
 from game.ai.first_version.defence.defence import Defence, DefenceTile
 
 
@@ -11,13 +12,5 @@ class ImpossibleWait(Defence):
         Impossible waits: fourth honor
         Pair waits: third honor
         """
-
-        results = []
-        for x in HONOR_INDICES:
-            if self.player.total_tiles(x, self.defence.hand_34) == 4:
-                results.append(DefenceTile(x, DefenceTile.SAFE))
-
-            if self.player.total_tiles(x, self.defence.hand_34) == 3:
-                results.append(DefenceTile(x, DefenceTile.ALMOST_SAFE_TILE))
-
-        return results
+        danger = visible_danger(self.defence.hand_34, self.table.revealed_tiles)
+        return [DefenceTile(x, danger[x]) for x in HONOR_INDICES if danger[x] != DefenceTile.DANGER]
@@ -1,12 +1,14 @@
 from mahjong.tile import TilesConverter
 from mahjong.utils import plus_dora, is_honor, is_aka_dora
 
+from game.ai.first_version.defence.danger import DangerMap, visible_danger
 from game.ai.first_version.defence.defence import DefenceTile
 from game.ai.first_version.defence.enemy_analyzer import EnemyAnalyzer
 from game.ai.first_version.defence.impossible_wait import ImpossibleWait
 from game.ai.first_version.defence.kabe import Kabe
 from game.ai.first_version.defence.suji import Suji
 from game.ai.discard import DiscardOption
+from utils.latency import measure
 
 import logging
 import copy
@@ -41,6 +43,9 @@ class DefenceHandler(object):
     hand_34 = None
     closed_hand_34 = None
 
+    # EnemyAnalyzer for each enemy, they are updated by table events
+    _enemy_analyzers = None
+
     def __init__(self, player):
         self.table = player.table
         self.player = player
@@ -51,9 +56,54 @@ class DefenceHandler(object):
 
         self.hand_34 = None
         self.closed_hand_34 = None
+        self._enemy_analyzers = None
 
         self.threatening_players = []
 
+    def add_discarded_tile(self, player_seat, tile):
+        """
+        :param tile: 136 tile format
+        """
+        # analyzers were not created yet, they will be calculated from the players state
+        if self._enemy_analyzers is None:
+            return
+
+        if player_seat:
+            self.get_enemy_analyzer(player_seat).add_discarded_tile(tile)
+
+        # any discard can change safe tiles against all enemies
+        for analyzer in self._enemy_analyzers:
+            analyzer.update_safe_tiles()
+
+    def add_called_meld(self, player_seat):
+        if self._enemy_analyzers is not None and player_seat:
+            self.get_enemy_analyzer(player_seat).add_called_meld()
+
+    def add_called_riichi(self, player_seat):
+        if self._enemy_analyzers is not None:
+            self.get_enemy_analyzer(player_seat).add_called_riichi()
+
+    def add_dora_indicator(self):
+        for analyzer in self._enemy_analyzers or []:
+            analyzer.add_dora_indicator()
+
+    def recalculate(self):
+        """
+        It is needed after a new round or direct changes of players state
+        """
+        for analyzer in self._enemy_analyzers or []:
+            analyzer.recalculate()
+
+    def get_enemy_analyzer(self, player_seat):
+        return self.enemy_analyzers[player_seat - 1]
+
+    @property
+    def enemy_analyzers(self):
+        # our AI is created before enemy players, so analyzers are created on the first use
+        if self._enemy_analyzers is None:
+            self._enemy_analyzers = [EnemyAnalyzer(x) for x in self.table.players[1:]]
+        return self._enemy_analyzers
+
     def get_rank_ev(self, hand_value, lose_estimation, win_lose_ratio):
         raw_ranking = [[p.name, p.scores] for p in self.table.get_players_sorted_by_scores()]
         player_name = self.player.name
@@ -99,6 +149,26 @@ class DefenceHandler(object):
 
         return rank_ev
 
+    def get_win_lose_ratio(self, hand_shape, hand_index, shanten, wanted_tiles_count, waiting):
+        """
+        How often we will deal in for each our win, if we push the hand.
+        Rates are taken from the table built on self-play games,
+        for the missing table or not enough games we use COUNTER_RATIO
+        :param hand_shape: key of COUNTER_RATIO
+        :param hand_index: count of our discards
+        """
+        rates_table = self.player.ai.rates_table
+        if rates_table:
+            riichi_players = len([x for x in self.table.players[1:] if x.in_riichi])
+            rates = rates_table.get(shanten, wanted_tiles_count, hand_index, len(waiting), riichi_players)
+            if rates:
+                count, _, win_rate, deal_in_rate = rates
+                # there were no wins, but we don't want to divide by zero
+                return deal_in_rate / max(win_rate, 1 / count)
+
+        return COUNTER_RATIO[hand_shape][hand_index]
+
+    @measure('should_go_to_defence_mode')
     def should_go_to_defence_mode(self, discard_candidate=None):
         """
         The method is decides should bot go to the defence mode or not.
@@ -176,20 +246,18 @@ class DefenceHandler(object):
         #     return False
 
         # we are in tempai, let's try to estimate hand value
-        hands_estimated_cost = []
-        call_riichi = not self.player.is_open_hand
-        for tile in waiting:
-            # copy of tiles, because we are modifying a list
-            tiles = self.player.tiles[:]
+        # copy of tiles, because we are modifying a list
+        tiles = self.player.tiles[:]
 
-            # special case, when we already have 14 tiles in the hand
-            if discard_candidate:
-                temp_tile = discard_candidate.find_tile_in_hand(self.player.closed_hand)
-                tiles.remove(temp_tile)
+        # special case, when we already have 14 tiles in the hand
+        if discard_candidate:
+            temp_tile = discard_candidate.find_tile_in_hand(self.player.closed_hand)
+            tiles.remove(temp_tile)
 
-            hand_result = self.player.ai.estimate_hand_value(tile, tiles, call_riichi)
-            if hand_result.error is None:
-                hands_estimated_cost.append(hand_result.cost['main'])
+        # all waits are estimated at once
+        variant = (not self.player.is_open_hand, False)
+        hand_results = self.player.ai.estimate_hand_values(waiting, tiles, [variant])[variant]
+        hands_estimated_cost = [x.cost['main'] for x in hand_results if x.error is None]
 
         # probably we are with opened hand without yaku, let's fold it
         if not hands_estimated_cost:
@@ -220,8 +288,9 @@ class DefenceHandler(object):
         if threatening_players[0].is_dealer:
             counter_player_type = "dealer"
 
-        score_ev = hand_value - COUNTER_VALUES[counter_player_type] * COUNTER_RATIO[hand_shape][hand_index]
-        rank_ev = self.get_rank_ev(hand_value, COUNTER_VALUES[counter_player_type], COUNTER_RATIO[hand_shape][hand_index])
+        win_lose_ratio = self.get_win_lose_ratio(hand_shape, hand_index, shanten, wanted_tiles_count, waiting)
+        score_ev = hand_value - COUNTER_VALUES[counter_player_type] * win_lose_ratio
+        rank_ev = self.get_rank_ev(hand_value, COUNTER_VALUES[counter_player_type], win_lose_ratio)
 
         should_counter = False
 
@@ -283,78 +352,26 @@ class DefenceHandler(object):
 
         threatening_players = self._get_threatening_players()
 
-        # safe tiles that can be safe based on the table situation
-        safe_tiles = self.impossible_wait.find_tiles_to_discard(threatening_players)
-
-        # first try to check common safe tiles to discard for all players
-        if len(threatening_players) > 1:
-            against_honitsu = []
-            for player in threatening_players:
-                if player.chosen_suit:
-                    against_honitsu += [self._mark_safe_tiles_against_honitsu(player)]
-
-            common_safe_tiles = [x.all_safe_tiles for x in threatening_players]
-            common_safe_tiles += against_honitsu
-            # let's find a common tiles that will be safe against all threatening players
-            common_safe_tiles = list(set.intersection(*map(set, common_safe_tiles)))
-            common_safe_tiles = [DefenceTile(x, DefenceTile.SAFE) for x in common_safe_tiles]
-
-            # there is no sense to calculate suji tiles for honitsu players
-            not_honitsu_players = [x for x in threatening_players if x.chosen_suit is None]
-            common_suji_tiles = self.suji.find_tiles_to_discard(not_honitsu_players)
-
-            if common_safe_tiles:
-                # it can be that safe tile will be mark as "almost safe",
-                # but we already have "safe" tile in our hand
-                validated_safe_tiles = common_safe_tiles
-                for tile in safe_tiles:
-                    already_added_tile = [x for x in common_safe_tiles if x.value == tile.value]
-                    if not already_added_tile:
-                        validated_safe_tiles.append(tile)
-
-                # first try to check 100% safe tiles for all players
-                result = self._find_tile_to_discard(validated_safe_tiles, discard_results)
-                if result:
-                    return result
-
-            if common_suji_tiles:
-                # if there is no 100% safe tiles try to check common suji tiles
-                result = self._find_tile_to_discard(common_suji_tiles, discard_results)
-                if result:
-                    return result
+        # tiles that can be safe based on the table situation, it is the same for all players
+        table_danger = visible_danger(self.hand_34, self.table.revealed_tiles)
+        players_danger = [self._player_danger(x, table_danger) for x in threatening_players]
+
+        # first try to check common safe tiles to discard for all players,
+        # tile is as dangerous as it is for the most dangerous player
+        if len(players_danger) > 1:
+            common_danger = [max(x) for x in zip(*players_danger)]
+            result = self._find_tile_to_discard(common_danger, discard_results)
+            if result:
+                return result
 
         # there are only one threatening player or we wasn't able to find common safe tiles
         # let's find safe tiles for most dangerous player first
         # and than for all other players if we failed find tile for dangerous player
-        for player in threatening_players:
-            player_safe_tiles = [DefenceTile(x, DefenceTile.SAFE) for x in player.player.all_safe_tiles]
-            player_suji_tiles = self.suji.find_tiles_to_discard([player])
-
-            # it can be that safe tile will be mark as "almost safe",
-            # but we already have "safe" tile in our hand
-            validated_safe_tiles = player_safe_tiles
-            for tile in safe_tiles:
-                already_added_tile = [x for x in player_safe_tiles if x.value == tile.value]
-                if not already_added_tile:
-                    validated_safe_tiles.append(tile)
-
-            # better to not use suji for honitsu hands
-            if not player.chosen_suit:
-                validated_safe_tiles += player_suji_tiles
-
-            result = self._find_tile_to_discard(validated_safe_tiles, discard_results)
+        for danger in players_danger:
+            result = self._find_tile_to_discard(danger, discard_results)
             if result:
                 return result
 
-            # try to find safe tiles against honitsu
-            if player.chosen_suit:
-                against_honitsu = self._mark_safe_tiles_against_honitsu(player)
-                against_honitsu = [DefenceTile(x, DefenceTile.SAFE) for x in against_honitsu]
-
-                result = self._find_tile_to_discard(against_honitsu, discard_results)
-                if result:
-                    return result
-
         # we wasn't able to find safe tile to discard
         logger.info("No safe tiles, try to defence in other ways.")
         logger.info("With such a hand: {}".format(TilesConverter.to_one_line_string(self.player.closed_hand)))
@@ -395,17 +412,23 @@ class DefenceHandler(object):
 
     @property
     def analyzed_enemies(self):
-        players = self.player.ai.enemy_players
-        return [EnemyAnalyzer(x) for x in players]
+        return [self.get_enemy_analyzer(x.seat) for x in self.player.ai.enemy_players]
 
-    def _find_tile_to_discard(self, safe_tiles, discard_tiles):
+    def _find_tile_to_discard(self, danger, discard_tiles):
         """
         Try to find most effective safe tile to discard
-        :param safe_tiles:
-        :param discard_tiles:
+        :param danger: list of danger values for each tile in 34 format
+        :param discard_tiles: discard options for tiles of our closed hand
         :return: DiscardOption
         """
-        was_safe_tiles = self._mark_tiles_safety(safe_tiles, discard_tiles)
+        was_safe_tiles = False
+        for discard_tile in discard_tiles:
+            tile_danger = danger[discard_tile.tile_to_discard]
+            if tile_danger != DangerMap.UNKNOWN:
+                was_safe_tiles = True
+                if tile_danger < discard_tile.danger:
+                    discard_tile.danger = tile_danger
+
         if not was_safe_tiles:
             return None
 
@@ -413,15 +436,26 @@ class DefenceHandler(object):
 
         return final_results[0]
 
-    def _mark_tiles_safety(self, safe_tiles, discard_tiles):
-        was_safe_tiles = False
-        for safe_tile in safe_tiles:
-            for discard_tile in discard_tiles:
-                if discard_tile.tile_to_discard == safe_tile.value:
-                    was_safe_tiles = True
-                    if safe_tile.danger < discard_tile.danger:
-                        discard_tile.danger = safe_tile.danger
-        return was_safe_tiles
+    def _player_danger(self, player, table_danger):
+        """
+        :param player: EnemyAnalyzer
+        :param table_danger: danger of tiles based on the table situation
+        :return: list of danger values for each tile in 34 format
+        """
+        danger = player.danger_map.danger
+        # better to not use suji for honitsu hands,
+        # but tiles from other suits are almost safe
+        if player.chosen_suit:
+            danger = []
+            for tile in range(0, 34):
+                if player.danger_map.is_safe(tile):
+                    danger.append(DefenceTile.SAFE)
+                elif not player.chosen_suit(tile) and not is_honor(tile):
+                    danger.append(DefenceTile.OTHER_SUIT_TILE)
+                else:
+                    danger.append(DangerMap.UNKNOWN)
+
+        return [min(x) for x in zip(danger, table_danger)]
 
     def _get_threatening_players(self):
         """
@@ -439,16 +473,6 @@ class DefenceHandler(object):
 
         return result
 
-    def _mark_safe_tiles_against_honitsu(self, player):
-        against_honitsu = []
-        for tile in range(0, 34):
-            if not self.closed_hand_34[tile]:
-                continue
-
-            if not player.chosen_suit(tile) and not is_honor(tile):
-                against_honitsu.append(tile)
-        return against_honitsu
-
 
 if __name__ == "__main__":
     # Tests
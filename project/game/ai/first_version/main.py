@@ -14,12 +14,16 @@ from mahjong.utils import plus_dora, is_honor, is_aka_dora
 
 from game.ai.base.main import InterfaceAI
 from game.ai.discard import DiscardOption
+from game.ai.monte_carlo import MonteCarloEvaluator
+from game.ai.rates_table import load_rates_table
+from game.ai.shanten import IncrementalShanten, load_suit_decompositions
 from game.ai.first_version.defence.main import DefenceHandler
-from game.ai.first_version.defence.main import COUNTER_RATIO
 from game.ai.first_version.strategies.honitsu import HonitsuStrategy
 from game.ai.first_version.strategies.main import BaseStrategy
 from game.ai.first_version.strategies.tanyao import TanyaoStrategy
 from game.ai.first_version.strategies.yakuhai import YakuhaiStrategy
+from utils.cache import LRUCache
+from utils.latency import measure
 
 logger = logging.getLogger('ai')
 
@@ -36,6 +40,16 @@ class ImplementationAI(InterfaceAI):
 
     agari = None
     shanten = None
+    hand_shanten = None
+    # calculate_outs results for the recently seen hands
+    outs_cache = None
+    # estimate_hand_value results for our waits, they are valid until dora indicators change
+    hand_value_cache = None
+    _hand_value_dora_indicators = None
+    # optional MonteCarloEvaluator for discard options
+    monte_carlo = None
+    # RatesTable built on self-play games, it is optional
+    rates_table = None
     defence = None
     hand_divider = None
     finished_hand = None
@@ -50,8 +64,23 @@ class ImplementationAI(InterfaceAI):
     def __init__(self, player):
         super(ImplementationAI, self).__init__(player)
 
+        # settings are loading AI class, so we can't import them on the module level
+        from utils.settings_handler import settings
+
         self.agari = Agari()
-        self.shanten = Shanten()
+        decompositions = load_suit_decompositions(settings.SHANTEN_BACKEND, settings.SHANTEN_TABLE_PATH)
+        self.shanten = IncrementalShanten(decompositions)
+        self.hand_shanten = IncrementalShanten(decompositions)
+        self.outs_cache = LRUCache(settings.OUTS_CACHE_SIZE)
+        self.hand_value_cache = LRUCache(settings.HAND_VALUE_CACHE_SIZE)
+        self._hand_value_dora_indicators = []
+        self.monte_carlo = None
+        if settings.MONTE_CARLO_ROLLOUTS:
+            self.monte_carlo = MonteCarloEvaluator(settings.MONTE_CARLO_ROLLOUTS,
+                                                   settings.MONTE_CARLO_TIME_BUDGET,
+                                                   settings.MONTE_CARLO_WORKERS,
+                                                   decompositions)
+        self.rates_table = load_rates_table(settings.RATES_TABLE_PATH)
         self.defence = DefenceHandler(player)
         self.hand_divider = HandDivider()
         self.finished_hand = HandCalculator()
@@ -72,6 +101,14 @@ class ImplementationAI(InterfaceAI):
         self.determine_strategy()
 
     def erase_state(self):
+        if self.outs_cache.hits or self.outs_cache.misses:
+            logger.debug('Outs cache: {}'.format(self.outs_cache.info()))
+        self.outs_cache.clear()
+
+        if self.hand_value_cache.hits or self.hand_value_cache.misses:
+            logger.debug('Hand value cache: {}'.format(self.hand_value_cache.info()))
+        self.hand_value_cache.clear()
+
         self.current_strategy = None
         self.in_defence = False
         self.last_discard_option = None
@@ -87,6 +124,7 @@ class ImplementationAI(InterfaceAI):
         """
         self.determine_strategy()
 
+    @measure('discard_tile')
     def discard_tile(self, discard_tile):
         # we called meld and we had discard tile that we wanted to discard
         if discard_tile is not None:
@@ -140,14 +178,17 @@ class ImplementationAI(InterfaceAI):
         return card2discard
 
     def process_discard_options_and_select_tile_to_discard(self, results, shanten, had_was_open=False):
-        tiles_34 = TilesConverter.to_34_array(self.player.tiles)
+        remaining_tiles = self.remaining_tiles(TilesConverter.to_34_array(self.player.tiles))
 
         # we had to update tiles value there
         # because it is related with shanten number
         for result in results:
-            result.tiles_count = self.count_tiles(result.waiting, tiles_34)
+            result.tiles_count = sum([remaining_tiles[x] for x in result.waiting])
             result.calculate_value(shanten)
 
+        if self.monte_carlo and results:
+            self.play_rollouts(results, remaining_tiles)
+
         # current strategy can affect on our discard options
         # so, don't use strategy specific choices for calling riichi
         if self.current_strategy:
@@ -160,6 +201,7 @@ class ImplementationAI(InterfaceAI):
 
         return self.chose_tile_to_discard(results)
 
+    @measure('calculate_outs')
     def calculate_outs(self, tiles, closed_hand, open_sets_34=None):
         """
         :param tiles: array of tiles in 136 format
@@ -169,42 +211,101 @@ class ImplementationAI(InterfaceAI):
         """
         tiles_34 = TilesConverter.to_34_array(tiles)
         closed_tiles_34 = TilesConverter.to_34_array(closed_hand)
-        is_agari = self.agari.is_agari(tiles_34, self.player.open_hand_34_tiles)
 
+        # count of tiles depends on the table state,
+        # so we are caching only shanten and waiting
+        key = self._outs_cache_key(tiles_34, closed_tiles_34, open_sets_34)
+        cached = self.outs_cache.get(key)
+        if cached is None:
+            cached = self._calculate_outs(tiles_34, closed_tiles_34, open_sets_34)
+            self.outs_cache.put(key, cached)
+
+        outs, shanten = cached
+        remaining_tiles = self.remaining_tiles(tiles_34)
         results = []
+        for hand_tile, tile_shanten, waiting in outs:
+            results.append(DiscardOption(player=self.player,
+                                         shanten=tile_shanten,
+                                         tile_to_discard=hand_tile,
+                                         waiting=list(waiting),
+                                         tiles_count=sum([remaining_tiles[x] for x in waiting])))
+
+        return results, shanten
+
+    def _calculate_outs(self, tiles_34, closed_tiles_34, open_sets_34):
+        """
+        :return: tuple of (tile to discard, shanten, waiting) items and shanten of the hand
+        """
+        is_agari = self.agari.is_agari(tiles_34, self.player.open_hand_34_tiles)
+
+        # we are changing hand tile by tile,
+        # so only one suit will be recalculated for each shanten
+        hand_shanten = self.hand_shanten
+        hand_shanten.set_hand(tiles_34, open_sets_34)
+
+        outs = []
         for hand_tile in range(0, 34):
             if not closed_tiles_34[hand_tile]:
                 continue
 
-            tiles_34[hand_tile] -= 1
-
-            shanten = self.shanten.calculate_shanten(tiles_34, open_sets_34)
+            hand_shanten.remove_tile(hand_tile)
 
-            waiting = []
-            for j in range(0, 34):
-                if hand_tile == j or tiles_34[j] == 4:
-                    continue
+            shanten = hand_shanten.shanten()
 
-                tiles_34[j] += 1
-                if self.shanten.calculate_shanten(tiles_34, open_sets_34) == shanten - 1:
-                    waiting.append(j)
-                tiles_34[j] -= 1
+            waiting = hand_shanten.find_waiting(shanten, hand_tile)
 
-            tiles_34[hand_tile] += 1
+            hand_shanten.add_tile(hand_tile)
 
             if waiting:
-                results.append(DiscardOption(player=self.player,
-                                             shanten=shanten,
-                                             tile_to_discard=hand_tile,
-                                             waiting=waiting,
-                                             tiles_count=self.count_tiles(waiting, tiles_34)))
+                outs.append((hand_tile, shanten, tuple(waiting)))
 
         if is_agari:
             shanten = Shanten.AGARI_STATE
         else:
-            shanten = self.shanten.calculate_shanten(tiles_34, open_sets_34)
+            shanten = hand_shanten.shanten()
 
-        return results, shanten
+        return tuple(outs), shanten
+
+    def _outs_cache_key(self, tiles_34, closed_tiles_34, open_sets_34):
+        """
+        Packed hand signature, each tile count is stored in one byte
+        """
+        # agari is checked with the current player melds,
+        # they can be different from open_sets_34 when we are trying to call meld
+        open_hand = self.player.open_hand_34_tiles
+        return (bytes(tiles_34),
+                bytes(closed_tiles_34),
+                open_sets_34 and tuple(tuple(x) for x in open_sets_34) or None,
+                open_hand and tuple(tuple(x) for x in open_hand) or None)
+
+    @measure('play_rollouts')
+    def play_rollouts(self, results, remaining_tiles):
+        """
+        Set tenpai and agari rates for discard options with the lowest shanten,
+        other options will not be selected anyway
+        """
+        min_shanten = min([x.shanten for x in results])
+        options = [x for x in results if x.shanten == min_shanten]
+
+        # we are drawing each fourth tile from the wall
+        turns = self.player.table.count_of_remaining_tiles // 4
+        rates = self.monte_carlo.evaluate(TilesConverter.to_34_array(self.player.tiles),
+                                          self.player.open_hand_34_tiles,
+                                          remaining_tiles,
+                                          [x.tile_to_discard for x in options],
+                                          turns)
+
+        for option in options:
+            option.tenpai_rate, option.agari_rate, _ = rates[option.tile_to_discard]
+
+    def remaining_tiles(self, tiles_34):
+        """
+        Count of not visible tiles for each tile, to count tiles for all discard options at once
+        :param tiles_34: our hand in 34 format
+        :return: array of 34 counts
+        """
+        revealed_tiles = self.player.table.revealed_tiles
+        return [4 - tiles_34[x] - revealed_tiles[x] for x in range(0, 34)]
 
     def count_tiles(self, waiting, tiles_34):
         n = 0
@@ -212,6 +313,7 @@ class ImplementationAI(InterfaceAI):
             n += 4 - self.player.total_tiles(item, tiles_34)
         return n
 
+    @measure('try_to_call_meld')
     def try_to_call_meld(self, tile, is_kamicha_discard):
         if not self.current_strategy:
             return None, None
@@ -266,8 +368,9 @@ class ImplementationAI(InterfaceAI):
         def sorting(x):
             # - is important for x.tiles_count
             # in that case we will discard tile that will give for us more tiles
-            # to complete a hand
-            return x.shanten, -x.tiles_count, x.valuation
+            # to complete a hand.
+            # Rollouts rates are set only when monte carlo evaluation is enabled
+            return x.shanten, -(x.agari_rate or 0), -(x.tenpai_rate or 0), -x.tiles_count, x.valuation
 
         # util for drawing
         def get_order(t):
@@ -336,6 +439,10 @@ class ImplementationAI(InterfaceAI):
                             return r
 
 
+            # rollouts already compared waiting of options
+            if temp_tile.agari_rate is not None:
+                return temp_tile
+
             # if in drawing
             if temp_tile.shanten == 0:
                 print("It's a drawing hand!")
@@ -417,35 +524,88 @@ class ImplementationAI(InterfaceAI):
     def estimate_hand_value(self, win_tile, tiles=None, call_riichi=False):
         """
         :param win_tile: 34 tile format
-        :param tiles:
+        :param tiles: 13 tiles in 136 format, player tiles by default
         :param call_riichi:
-        :return:
+        :return: HandResponse
         """
-        win_tile *= 4
-
-        # we don't need to think, that our waiting is aka dora
-        if win_tile in AKA_DORA_LIST:
-            win_tile += 1
+        variant = (call_riichi, False)
+        return self.estimate_hand_values([win_tile], tiles, [variant])[variant][0]
 
+    @measure('estimate_hand_value')
+    def estimate_hand_values(self, waiting, tiles=None, variants=((False, False),)):
+        """
+        Values of the hand for all waits. Tiles conversion, configs and the cache key
+        are prepared once, for each wait only the win tile is added
+        :param waiting: tiles in 34 format
+        :param tiles: 13 tiles in 136 format, player tiles by default
+        :param variants: (call riichi, is tsumo) pairs
+        :return: dict of variant -> list of HandResponse in the order of waiting
+        """
         if not tiles:
             tiles = self.player.tiles
 
-        tiles += [win_tile]
-
-        config = HandConfig(
-            is_riichi=call_riichi,
-            player_wind=self.player.player_wind,
-            round_wind=self.player.table.round_wind,
-            has_aka_dora=self.player.table.has_aka_dora,
-            has_open_tanyao=self.player.table.has_open_tanyao
-        )
+        # dora indicators are changed only after kan,
+        # cached values are not needed after it
+        table = self.player.table
+        if self._hand_value_dora_indicators != table.dora_indicators:
+            self._hand_value_dora_indicators = table.dora_indicators[:]
+            self.hand_value_cache.clear()
 
-        result = self.finished_hand.estimate_hand_value(tiles,
-                                                        win_tile,
-                                                        self.player.melds,
-                                                        self.player.table.dora_indicators,
-                                                        config)
-        return result
+        tiles_34 = TilesConverter.to_34_array(tiles)
+        hand_key = self._hand_value_cache_key(tiles)
+
+        results = {}
+        for call_riichi, is_tsumo in variants:
+            config = None
+            variant_results = []
+            for tile in waiting:
+                tiles_34[tile] += 1
+                key = (bytes(tiles_34), tile, call_riichi, is_tsumo) + hand_key
+                tiles_34[tile] -= 1
+
+                result = self.hand_value_cache.get(key)
+                if result is None:
+                    win_tile = tile * 4
+                    # we don't need to think, that our waiting is aka dora
+                    if win_tile in AKA_DORA_LIST:
+                        win_tile += 1
+
+                    config = config or HandConfig(
+                        is_riichi=call_riichi,
+                        is_tsumo=is_tsumo,
+                        player_wind=self.player.player_wind,
+                        round_wind=table.round_wind,
+                        has_aka_dora=table.has_aka_dora,
+                        has_open_tanyao=table.has_open_tanyao
+                    )
+
+                    result = self.finished_hand.estimate_hand_value(tiles + [win_tile],
+                                                                    win_tile,
+                                                                    self.player.melds,
+                                                                    table.dora_indicators,
+                                                                    config)
+                    self.hand_value_cache.put(key, result)
+
+                variant_results.append(result)
+            results[(call_riichi, is_tsumo)] = variant_results
+
+        return results
+
+    def _hand_value_cache_key(self, tiles):
+        """
+        Part of the key that is the same for all waits,
+        copies of tiles are the same except aka dora
+        """
+        table = self.player.table
+        aka_dora = tuple(sorted([x for x in tiles if x in AKA_DORA_LIST]))
+        melds = tuple([(x.type, x.opened, tuple(sorted([y // 4 for y in x.tiles]))) for x in self.player.melds])
+        return (aka_dora,
+                melds,
+                tuple(table.dora_indicators),
+                self.player.player_wind,
+                table.round_wind,
+                table.has_aka_dora,
+                table.has_open_tanyao)
 
     def should_call_riichi(self):
         logger.info("Can call a reach!")
@@ -463,7 +623,9 @@ class ImplementationAI(InterfaceAI):
         # Get the rank EV after round 3
         if self.table.round_number >= 5:  # DEBUG: set this to 0
             try:
-                possible_hand_values = [self.estimate_hand_value(tile, call_riichi=True).cost["main"] for tile in self.waiting]
+                variant = (True, False)
+                hand_results = self.estimate_hand_values(self.waiting, variants=[variant])[variant]
+                possible_hand_values = [x.cost["main"] for x in hand_results]
             except Exception as e:
                 print(e)
                 possible_hand_values = [2000]
@@ -476,7 +638,9 @@ class ImplementationAI(InterfaceAI):
 
             hand_shape = "pro_bad_shape" if self.wanted_tiles_count <= 4 else "pro_good_shape"
 
-            rank_ev = self.defence.get_rank_ev(hand_value, lose_estimation, COUNTER_RATIO[hand_shape][len(self.player.discards)])
+            win_lose_ratio = self.defence.get_win_lose_ratio(hand_shape, len(self.player.discards), 0,
+                                                             self.wanted_tiles_count, self.waiting)
+            rank_ev = self.defence.get_rank_ev(hand_value, lose_estimation, win_lose_ratio)
 
             logger.info('''Cowboy: Proactive reach:
             Hand value: {}    Hand shape: {}
@@ -625,7 +789,19 @@ class ImplementationAI(InterfaceAI):
 
         # No need to check it here
 
-        pass
+        self.defence.add_called_riichi(enemy_seat)
+
+    def see_discard(self, player_seat, tile):
+        self.defence.add_discarded_tile(player_seat, tile)
+
+    def see_meld(self, player_seat, meld):
+        self.defence.add_called_meld(player_seat)
+
+    def see_dora_indicator(self, tile):
+        self.defence.add_dora_indicator()
+
+    def table_changed(self):
+        self.defence.recalculate()
 
     @property
     def enemy_players(self):
@@ -1,4 +1,7 @@
 # -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
 import unittest
 
 from mahjong.meld import Meld
@@ -6,6 +9,7 @@ from mahjong.tests_mixin import TestMixin
 
 from game.ai.first_version.strategies.main import BaseStrategy
 from game.table import Table
+from utils.latency import FILE_EXTENSION, LatencyStats, load_all
 
 
 class AITestCase(unittest.TestCase, TestMixin):
@@ -218,6 +222,113 @@ class AITestCase(unittest.TestCase, TestMixin):
         result = [x for x in results if x.tile_to_discard == self._string_to_34_tile(sou='1')][0]
         self.assertEqual(result.tiles_count, 7)
 
+    def test_outs_cache(self):
+        table = Table()
+        player = table.player
+
+        tiles = self._string_to_136_array(man='123456789', sou='167', honors='77')
+        player.init_hand(tiles)
+
+        results, shanten = player.ai.calculate_outs(tiles, tiles)
+        self.assertEqual(player.ai.outs_cache.info()['misses'], 1)
+
+        # cached results should be the new objects with actual tiles count
+        results[0].waiting.append(0)
+        player.table.add_discarded_tile(1, self._string_to_136_tile(sou='5'), False)
+
+        cached_results, cached_shanten = player.ai.calculate_outs(tiles, tiles)
+        self.assertEqual(player.ai.outs_cache.info()['hits'], 1)
+        self.assertEqual(cached_shanten, shanten)
+
+        result = [x for x in cached_results if x.tile_to_discard == self._string_to_34_tile(sou='1')][0]
+        self.assertEqual(result.tiles_count, 7)
+        self.assertNotIn(0, cached_results[0].waiting)
+
+        player.ai.erase_state()
+        self.assertEqual(len(player.ai.outs_cache), 0)
+
+    def test_hand_value_cache(self):
+        table = Table()
+        player = table.player
+
+        tiles = self._string_to_136_array(man='123456789', sou='234', honors='7')
+        player.init_hand(tiles)
+        win_tile = self._string_to_34_tile(honors='7')
+
+        result = player.ai.estimate_hand_value(win_tile)
+        self.assertEqual(player.tiles, tiles)
+        self.assertEqual(player.ai.hand_value_cache.info()['misses'], 1)
+
+        self.assertIs(player.ai.estimate_hand_value(win_tile), result)
+        self.assertEqual(player.ai.hand_value_cache.hits, 1)
+
+        # riichi is a different hand value
+        riichi_result = player.ai.estimate_hand_value(win_tile, call_riichi=True)
+        self.assertEqual(riichi_result.han, result.han + 1)
+
+        # new dora indicator
+        table.add_dora_indicator(self._string_to_136_tile(honors='6'))
+        self.assertEqual(len(player.ai.hand_value_cache), 2)
+        dora_result = player.ai.estimate_hand_value(win_tile)
+        self.assertEqual(dora_result.han, result.han + 2)
+        self.assertEqual(len(player.ai.hand_value_cache), 1)
+
+    def test_estimate_hand_values_for_all_waits(self):
+        table = Table()
+        player = table.player
+
+        tiles = self._string_to_136_array(man='123456789', sou='23', honors='77')
+        player.init_hand(tiles)
+        waiting = [self._string_to_34_tile(sou='1'), self._string_to_34_tile(sou='4')]
+
+        ron, riichi_tsumo = (False, False), (True, True)
+        results = player.ai.estimate_hand_values(waiting, variants=[ron, riichi_tsumo])
+
+        self.assertEqual([x.han for x in results[ron]], [2, 2])
+        # riichi and menzen tsumo
+        self.assertEqual([x.han for x in results[riichi_tsumo]], [4, 4])
+        self.assertEqual(player.tiles, tiles)
+
+        # the same values are returned for one wait
+        self.assertIs(player.ai.estimate_hand_value(waiting[1]), results[ron][1])
+
+    def test_latency_stats(self):
+        table = Table()
+        player = table.player
+
+        tiles = self._string_to_136_array(sou='111345677', pin='45', man='56')
+        player.init_hand(tiles)
+        # stats are disabled by default
+        player.ai.calculate_outs(tiles, tiles)
+
+        table.latency = LatencyStats()
+        player.draw_tile(self._string_to_136_tile(man='9'))
+        player.discard_tile()
+        player.draw_tile(self._string_to_136_tile(honors='1'))
+        player.discard_tile()
+
+        names = set([x[0] for x in table.latency.histograms])
+        self.assertIn('discard_tile', names)
+        self.assertIn('calculate_outs', names)
+        self.assertIn('should_go_to_defence_mode', names)
+        self.assertEqual(table.latency.histograms[('discard_tile', 'PREPARING')].count, 2)
+
+        folder = tempfile.mkdtemp()
+        try:
+            table.latency.dump(os.path.join(folder, 'first' + FILE_EXTENSION))
+            table.latency.dump(os.path.join(folder, 'second' + FILE_EXTENSION))
+            stats, count_of_games = load_all(folder)
+        finally:
+            shutil.rmtree(folder)
+
+        self.assertEqual(count_of_games, 2)
+        self.assertEqual(len(stats), len(table.latency) * 2)
+
+        summary = dict([((x[0], x[1]), x[2:]) for x in stats.summary()])
+        count, p50, p99, max_value = summary[('discard_tile', 'PREPARING')]
+        self.assertEqual(count, 4)
+        self.assertTrue(0 < p50 <= p99 <= max_value)
+
     def test_using_tiles_of_different_suit_for_chi(self):
         """
         It was a bug related to it, when bot wanted to call 9p12s chi :(
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+from mahjong.tests_mixin import TestMixin
+
+from game.ai.first_version.defence.danger import DangerMap, visible_danger
+from game.ai.first_version.defence.defence import DefenceTile
+from game.table import Table
+
+
+class DangerMapTestCase(unittest.TestCase, TestMixin):
+
+    def test_genbutsu_and_temporary_safe_tiles(self):
+        table = Table()
+        danger_map = table.player.ai.defence.get_enemy_analyzer(1).danger_map
+        four_man = self._string_to_34_tile(man='4')
+        east = self._string_to_34_tile(honors='1')
+
+        table.add_discarded_tile(1, self._string_to_136_tile(man='4'), False)
+        self.assertEqual(danger_map.danger[four_man], DefenceTile.SAFE)
+
+        # temporary safe tile until the enemy discard
+        table.add_discarded_tile(2, self._string_to_136_tile(honors='1'), False)
+        self.assertEqual(danger_map.danger[east], DefenceTile.SAFE)
+
+        table.add_discarded_tile(1, self._string_to_136_tile(sou='9'), False)
+        self.assertEqual(danger_map.danger[east], DangerMap.UNKNOWN)
+        self.assertEqual(danger_map.danger[four_man], DefenceTile.SAFE)
+
+        # furiten after riichi
+        table.add_called_riichi(1)
+        table.add_discarded_tile(0, self._string_to_136_tile(honors='1'), False)
+        table.add_discarded_tile(1, self._string_to_136_tile(pin='1'), True)
+        self.assertEqual(danger_map.danger[east], DefenceTile.SAFE)
+
+        # incremental updates give the same result as the full recount
+        danger = danger_map.danger[:]
+        danger_map.recalculate()
+        self.assertEqual(danger_map.danger, danger)
+
+    def test_safe_tiles_set_to_the_player(self):
+        table = Table()
+        danger_map = table.player.ai.defence.get_enemy_analyzer(2).danger_map
+        east = self._string_to_34_tile(honors='1')
+        four_pin = self._string_to_34_tile(pin='4')
+
+        table.add_discarded_tile(1, self._string_to_136_tile(honors='1'), False)
+        self.assertEqual(danger_map.danger[east], DefenceTile.SAFE)
+
+        table.get_player(2).temporary_safe_tiles = []
+        self.assertEqual(danger_map.is_safe(east), False)
+        self.assertEqual(danger_map.danger[east], DangerMap.UNKNOWN)
+
+        table.get_player(2).safe_tiles = [four_pin]
+        self.assertEqual(danger_map.danger[four_pin], DefenceTile.SAFE)
+        self.assertEqual(danger_map.suji_34[four_pin + 3], 40)
+
+    def test_suji_tiles(self):
+        table = Table()
+        danger_map = table.player.ai.defence.get_enemy_analyzer(1).danger_map
+
+        table.add_discarded_tile(1, self._string_to_136_tile(pin='4'), False)
+        self.assertEqual(self._suji(danger_map, pin='147'), [20, DefenceTile.SAFE, 40])
+        self.assertEqual(self._suji(danger_map, pin='258'), [DangerMap.UNKNOWN] * 3)
+
+        # double suji
+        table.add_discarded_tile(1, self._string_to_136_tile(pin='3'), False)
+        table.add_discarded_tile(1, self._string_to_136_tile(pin='9'), False)
+        self.assertEqual(self._suji(danger_map, pin='6'), [30])
+
+        # dora suji tile is more dangerous
+        table.add_dora_indicator(self._string_to_136_tile(pin='6'))
+        self.assertEqual(self._suji(danger_map, pin='67'), [30, 140])
+
+    def test_visible_danger(self):
+        tiles_34 = self._to_34_array(self._string_to_136_array(pin='2222', honors='111'))
+        revealed_tiles = self._to_34_array(self._string_to_136_array(pin='111', honors='2'))
+
+        danger = visible_danger(tiles_34, revealed_tiles)
+
+        self.assertEqual(danger[self._string_to_34_tile(honors='1')], DefenceTile.ALMOST_SAFE_TILE)
+        self.assertEqual(danger[self._string_to_34_tile(honors='2')], DangerMap.UNKNOWN)
+        # kabe of 2p
+        self.assertEqual(danger[self._string_to_34_tile(pin='1')], DefenceTile.ALMOST_SAFE_TILE)
+        self.assertEqual(danger[self._string_to_34_tile(pin='3')], DangerMap.UNKNOWN)
+
+        tiles_34 = self._to_34_array(self._string_to_136_array(pin='222', honors='111'))
+        danger = visible_danger(tiles_34, revealed_tiles)
+        self.assertEqual(danger[self._string_to_34_tile(pin='1')], DangerMap.UNKNOWN)
+
+    def _suji(self, danger_map, **kwargs):
+        tiles = self._string_to_136_array(**kwargs)
+        return [danger_map.danger[x // 4] for x in tiles]
@@ -5,6 +5,8 @@ from mahjong.constants import EAST, WEST
 from mahjong.meld import Meld
 from mahjong.tests_mixin import TestMixin
 
+from game.ai.first_version.defence.main import COUNTER_RATIO
+from game.ai.rates_table import RatesTable
 from game.table import Table
 
 
@@ -56,6 +58,28 @@ class DefenceTestCase(unittest.TestCase, TestMixin):
         self.assertEqual(table.get_player(2).temporary_safe_tiles, [5, 6])
         self.assertEqual(table.get_player(3).temporary_safe_tiles, [6])
 
+    def test_safe_tiles_masks(self):
+        table = Table()
+        table.add_called_riichi(2)
+
+        table.add_discarded_tile(1, self._string_to_136_tile(man='2'), False)
+        table.add_discarded_tile(2, self._string_to_136_tile(pin='1'), False)
+        table.add_discarded_tile(3, self._string_to_136_tile(man='2'), False)
+
+        player = table.get_player(2)
+        self.assertEqual(player.genbutsu_mask, 1 << 9)
+        self.assertEqual(player.furiten_mask, 1 << 1 | 1 << 9)
+        self.assertEqual(player.temporary_safe_mask, 1 << 1)
+        self.assertEqual(player.all_safe_tiles, [1, 9])
+
+        # common safe tiles for players
+        common_mask = table.get_player(1).all_safe_mask & player.all_safe_mask
+        self.assertEqual(common_mask, 1 << 1 | 1 << 9)
+
+        player.safe_tiles = [5, 3]
+        self.assertEqual(player.safe_tiles, [3, 5])
+        self.assertEqual(player.furiten_mask, 0)
+
     def test_should_go_for_defence_and_bad_hand(self):
         """
         When we have 13 tiles in hand and someone declared a riichi
@@ -207,8 +231,9 @@ class DefenceTestCase(unittest.TestCase, TestMixin):
         table.get_player(2).temporary_safe_tiles = []
 
         result = table.player.discard_tile()
-        # second player is a dealer, let's fold against him
-        self.assertEqual(self._to_string([result]), '9m')
+        # second player is a dealer, let's fold against him,
+        # 8m is also suji against the first player and 9m is not
+        self.assertEqual(self._to_string([result]), '8m')
 
         tiles = self._string_to_136_array(sou='234567', pin='348', man='234', honors='23')
         table.player.init_hand(tiles)
@@ -499,4 +524,24 @@ class DefenceTestCase(unittest.TestCase, TestMixin):
 
         self.assertEqual(self._to_string([result]), '3p')
 
+    def test_win_lose_ratio_from_rates_table(self):
+        table = Table()
+        table.add_called_riichi(2)
+        defence = table.player.ai.defence
+        table.player.ai.rates_table = None
+
+        ratio = defence.get_win_lose_ratio('good_shape', 5, 0, 8, [1, 4])
+        self.assertEqual(ratio, COUNTER_RATIO['good_shape'][5])
+
+        rates_table = RatesTable()
+        for i in range(0, 40):
+            rates_table.add(0, 8, 5, 2, 1, is_tenpai=True, is_win=i < 20, is_deal_in=i >= 30)
+        table.player.ai.rates_table = rates_table
+
+        ratio = defence.get_win_lose_ratio('good_shape', 5, 0, 8, [1, 4])
+        self.assertEqual(ratio, 0.5)
 
+        # not enough decisions without riichi players
+        table.get_player(2).in_riichi = False
+        ratio = defence.get_win_lose_ratio('good_shape', 5, 0, 8, [1, 4])
+        self.assertEqual(ratio, COUNTER_RATIO['good_shape'][5])
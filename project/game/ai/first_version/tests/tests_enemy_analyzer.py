@@ -59,3 +59,37 @@ class EnemyAnalyzerTestCase(unittest.TestCase, TestMixin):
 
         self.assertEqual(EnemyAnalyzer(table.get_player(1)).is_threatening, True)
         self.assertEqual(EnemyAnalyzer(table.get_player(1)).chosen_suit, is_pin)
+
+    def test_table_analyzers_are_updated_by_events(self):
+        table = Table()
+        analyzer = table.player.ai.defence.get_enemy_analyzer(1)
+
+        table.add_called_meld(1, self._make_meld(Meld.PON, man='777'))
+        table.add_called_meld(1, self._make_meld(Meld.CHI, man='345'))
+        for tile in ['1', '1', '2', '9']:
+            table.add_discarded_tile(1, self._string_to_136_tile(sou=tile), False)
+        for tile in ['1', '5', '9', '9', '6']:
+            table.add_discarded_tile(1, self._string_to_136_tile(pin=tile), False)
+        self.assertEqual(analyzer.is_threatening, False)
+        self.assertEqual(analyzer.discard_suits, [4, 0, 5, 0])
+
+        table.add_dora_indicator(self._string_to_136_tile(man='6'))
+
+        # enemy opened the pon of dora
+        self.assertEqual(analyzer.is_threatening, True)
+        self.assertEqual(analyzer.count_of_meld_dora, 3)
+        fresh_analyzer = EnemyAnalyzer(table.get_player(1))
+        self.assertEqual(fresh_analyzer.is_threatening, True)
+        self.assertEqual(fresh_analyzer.discards_34, analyzer.discards_34)
+
+        # the same analyzers are used by the defence
+        self.assertIs(table.player.ai.defence.analyzed_enemies[0], analyzer)
+
+        table.add_called_riichi(2)
+        self.assertEqual(table.player.ai.defence.get_enemy_analyzer(2).is_threatening, True)
+
+        table.init_round(0, 0, 0, 0, 0, [250, 250, 250, 250])
+        self.assertIs(table.player.ai.defence.get_enemy_analyzer(1), analyzer)
+        self.assertEqual(analyzer.is_threatening, False)
+        self.assertEqual(analyzer.count_of_discards, 0)
+        self.assertEqual(table.player.ai.defence.get_enemy_analyzer(2).is_threatening, False)
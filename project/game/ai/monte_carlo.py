@@ -0,0 +1,313 @@
+# -*- coding: utf-8 -*-
+"""
+Monte Carlo evaluation of discard options.
+
+Not visible tiles (not in our hand and not revealed on the table) are shuffled,
+and our draws are taken from them until the end of the wall.
+Other players hands and draws are the rest of the same shuffle,
+so each sample is consistent with the table.
+For each discard option we estimate how often we reach tenpai and win by self draw.
+
+Compare rollouts per second for different count of workers:
+    python -m game.ai.monte_carlo --benchmark
+"""
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from optparse import OptionParser
+
+from game.ai.shanten import IncrementalShanten
+
+# count of workers -> pool of processes, pools are shared by all evaluators of the process,
+# so bots and self-play games don't start new processes for each AI
+_executors = {}
+
+
+class RolloutPolicy(object):
+    """
+    Our discards in rollouts, hands are packed to bytes with count of each tile.
+    It is the main sorting of ImplementationAI.chose_tile_to_discard:
+    the lowest shanten and after it the most tiles to improve the hand.
+    Draws that don't improve the hand are discarded at once,
+    so the hand is changed only on improving draws and all results are cached by the hand
+    """
+    calculator = None
+    open_sets_34 = None
+    remaining_tiles = None
+
+    # packed hand -> (shanten, set of waiting tiles)
+    _hands = None
+    # (packed hand, drawn tile) -> packed hand after our discard
+    _moves = None
+
+    def __init__(self, calculator, open_sets_34, remaining_tiles):
+        """
+        :param calculator: IncrementalShanten
+        :param open_sets_34: array of array with tiles in 34 format
+        :param remaining_tiles: count of not visible tiles for each tile, to count tiles of discard options
+        """
+        self.calculator = calculator
+        self.open_sets_34 = open_sets_34 or []
+        self.remaining_tiles = remaining_tiles
+        self._hands = {}
+        self._moves = {}
+
+    def hand(self, key):
+        """
+        :param key: packed hand of 13 tiles (with tiles from open sets)
+        :return: shanten and set of tiles that improve the hand
+        """
+        result = self._hands.get(key)
+        if result is None:
+            calculator = self.calculator
+            calculator.set_hand(list(key), self.open_sets_34)
+            shanten = calculator.shanten()
+            result = shanten, frozenset(calculator.find_waiting(shanten))
+            self._hands[key] = result
+        return result
+
+    def move(self, key, tile):
+        """
+        Draw improving tile and discard the worst tile
+        :param key: packed hand of 13 tiles
+        :param tile: drawn tile in 34 format
+        :return: packed hand after the discard
+        """
+        result = self._moves.get((key, tile))
+        if result is not None:
+            return result
+
+        tiles_34 = list(key)
+        tiles_34[tile] += 1
+
+        calculator = self.calculator
+        calculator.set_hand(tiles_34, self.open_sets_34)
+        closed_34 = calculator.closed_34[:]
+
+        # waiting is needed only for discards with the lowest shanten
+        candidates = []
+        for hand_tile in range(0, 34):
+            if closed_34[hand_tile] > 0:
+                calculator.remove_tile(hand_tile)
+                candidates.append((calculator.shanten(), hand_tile))
+                calculator.add_tile(hand_tile)
+        min_shanten = min(candidates)[0]
+
+        best = None
+        for shanten, hand_tile in candidates:
+            if shanten != min_shanten:
+                continue
+
+            tiles_34[hand_tile] -= 1
+            candidate = bytes(tiles_34)
+            tiles_34[hand_tile] += 1
+
+            tiles_count = sum([self.remaining_tiles[x] for x in self.hand(candidate)[1]])
+            if best is None or tiles_count > best[0]:
+                best = tiles_count, candidate
+
+        result = best[1]
+        self._moves[(key, tile)] = result
+        return result
+
+    def rollout(self, key, draws):
+        """
+        :param key: packed hand of 13 tiles
+        :param draws: our draws in 34 format
+        :return: reached tenpai and won flags
+        """
+        shanten, waiting = self.hand(key)
+        is_tenpai = shanten == 0
+        for tile in draws:
+            if tile not in waiting:
+                continue
+
+            if shanten == 0:
+                return True, True
+
+            key = self.move(key, tile)
+            shanten, waiting = self.hand(key)
+            if shanten == 0:
+                is_tenpai = True
+
+        return is_tenpai, False
+
+
+def play_rollouts(args):
+    """
+    Rollouts for all discard options, they are played by batches until the deadline.
+    It is module level function to be able to run it in the pool of processes
+    :param args: tuple of hand, open sets, remaining tiles, discards, turns, count of rollouts, seed, deadline
+    :return: list of (count of tenpai, count of wins, count of rollouts) for each discard
+    """
+    tiles_34, open_sets_34, remaining_tiles, discards, turns, rollouts, seed, deadline = args
+
+    policy = RolloutPolicy(IncrementalShanten(), open_sets_34, remaining_tiles)
+    return _play_rollouts(policy, tiles_34, discards, turns, rollouts, seed, deadline)
+
+
+def _play_rollouts(policy, tiles_34, discards, turns, rollouts, seed, deadline, batch_size=16):
+    generator = random.Random(seed)
+
+    hidden_tiles = []
+    for tile in range(0, 34):
+        hidden_tiles.extend([tile] * max(policy.remaining_tiles[tile], 0))
+    turns = min(turns, len(hidden_tiles))
+
+    hands = []
+    for tile in discards:
+        hand = tiles_34[:]
+        hand[tile] -= 1
+        hands.append(bytes(hand))
+
+    results = [[0, 0, 0] for _ in discards]
+    played = 0
+    while played < rollouts:
+        batch = min(batch_size, rollouts - played)
+        # all options are compared on the same samples, it reduces the variance of the difference
+        samples = [generator.sample(hidden_tiles, turns) for _ in range(0, batch)]
+        for hand, result in zip(hands, results):
+            for draws in samples:
+                is_tenpai, is_agari = policy.rollout(hand, draws)
+                result[0] += is_tenpai
+                result[1] += is_agari
+            result[2] += batch
+
+        played += batch
+        if deadline and time.time() > deadline:
+            break
+
+    return results
+
+
+class MonteCarloEvaluator(object):
+    rollouts = 0
+    # seconds for one decision, None means to play all rollouts
+    time_budget = None
+    # one worker means rollouts in the current process
+    workers = 1
+
+    _calculator = None
+
+    def __init__(self, rollouts, time_budget=None, workers=1, decompositions=None):
+        """
+        :param rollouts: count of rollouts for each discard option
+        :param decompositions: suit decompositions for the shanten in the current process
+        """
+        self.rollouts = rollouts
+        self.time_budget = time_budget
+        self.workers = max(workers, 1)
+        self._calculator = IncrementalShanten(decompositions)
+
+    def evaluate(self, tiles_34, open_sets_34, remaining_tiles, discards, turns, seed=None):
+        """
+        :param tiles_34: our hand before the discard
+        :param open_sets_34: array of array with tiles in 34 format
+        :param remaining_tiles: count of not visible tiles for each tile
+        :param discards: tiles in 34 format to evaluate
+        :param turns: count of our draws before the end of the wall
+        :param seed: seed for samples, by default it depends on the hand and the table
+        :return: dict of discard -> (tenpai rate, agari rate, count of rollouts)
+        """
+        deadline = self.time_budget and time.time() + self.time_budget or None
+        if seed is None:
+            seed = '{}:{}:{}'.format(tiles_34, remaining_tiles, turns)
+
+        if self.workers == 1:
+            policy = RolloutPolicy(self._calculator, open_sets_34, remaining_tiles)
+            results = _play_rollouts(policy, tiles_34, discards, turns, self.rollouts, '{}:0'.format(seed), deadline)
+        else:
+            executor = _get_executor(self.workers)
+
+            # each worker plays its part of rollouts for all options
+            rollouts = (self.rollouts + self.workers - 1) // self.workers
+            tasks = [(tiles_34, open_sets_34, remaining_tiles, discards, turns, rollouts, '{}:{}'.format(seed, x),
+                      deadline) for x in range(0, self.workers)]
+
+            results = [[0, 0, 0] for _ in discards]
+            for worker_results in executor.map(play_rollouts, tasks):
+                for result, worker_result in zip(results, worker_results):
+                    for i in range(0, 3):
+                        result[i] += worker_result[i]
+
+        return {tile: (tenpai / count, agari / count, count) for tile, (tenpai, agari, count) in zip(discards, results)}
+
+
+def _get_executor(workers):
+    executor = _executors.get(workers)
+    if not executor:
+        executor = ProcessPoolExecutor(workers)
+        _executors[workers] = executor
+    return executor
+
+
+def shutdown_executors():
+    """
+    Stop shared pools of processes. They are stopped at the interpreter exit anyway,
+    it is needed only to free processes earlier
+    """
+    for executor in _executors.values():
+        executor.shutdown()
+    _executors.clear()
+
+
+def benchmark(rollouts=2000, workers=1, seed=0):
+    """
+    Evaluate discard options of random hands in the middle of the round
+    :return: rollouts per second
+    """
+    generator = random.Random(seed)
+    evaluator = MonteCarloEvaluator(rollouts, workers=workers)
+
+    count_of_rollouts = 0
+    start = time.perf_counter()
+    for _ in range(0, 5):
+        tiles = generator.sample(range(0, 136), 14 + 20)
+        tiles_34 = [0] * 34
+        for tile in tiles[:14]:
+            tiles_34[tile // 4] += 1
+
+        # other tiles were discarded by players
+        remaining_tiles = [4 - x for x in tiles_34]
+        for tile in tiles[14:]:
+            remaining_tiles[tile // 4] -= 1
+
+        discards = [x for x in range(0, 34) if tiles_34[x]]
+        results = evaluator.evaluate(tiles_34, [], remaining_tiles, discards, 12)
+        count_of_rollouts += sum([x[2] for x in results.values()])
+
+    seconds = time.perf_counter() - start
+    shutdown_executors()
+    return count_of_rollouts / seconds
+
+
+def main():
+    parser = OptionParser()
+
+    parser.add_option('-m', '--benchmark',
+                      action='store_true',
+                      default=False,
+                      help='Measure rollouts per second')
+
+    parser.add_option('-r', '--rollouts',
+                      type='int',
+                      default=2000,
+                      help='Count of rollouts for each discard option. Default is 2000')
+
+    parser.add_option('-w', '--workers',
+                      type='string',
+                      default='1,2,4',
+                      help='Comma separated counts of workers to compare. Default is 1,2,4')
+
+    opts, _ = parser.parse_args()
+
+    if not opts.benchmark:
+        print('Please, set -m option')
+        return
+
+    for workers in [int(x) for x in opts.workers.split(',')]:
+        print('{} workers: {:.0f} rollouts per second'.format(workers, benchmark(opts.rollouts, workers)))
+
+
+if __name__ == '__main__':
+    main()
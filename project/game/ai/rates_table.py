@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""
+Empirical rates of our hand after the discard decision:
+how often it reached tenpai, won and dealt in before the end of the round.
+
+Rates are indexed by shanten, count of tiles to improve the hand, turn,
+wait shape (one or few kinds of waiting tiles) and count of players in riichi.
+For each cell the file stores four uint32 counters: decisions, tenpai, wins and deal-ins.
+
+Build the table from self-play games:
+    python simulator.py --build_rates -g 1000 -w 0
+"""
+import array
+import logging
+import os
+import struct
+import sys
+
+logger = logging.getLogger('ai')
+
+MAGIC = b'RATE'
+VERSION = 1
+# magic, version, byte order, count of recorded hands
+HEADER = struct.Struct('<4sIBI')
+
+# 3 means 3 and more shanten
+MAX_SHANTEN = 3
+MAX_TILES_COUNT = 31
+MAX_TURN = 23
+# one kind of waiting tiles or more
+WAIT_SHAPES = 2
+MAX_RIICHI_PLAYERS = 3
+
+COUNTERS = 4
+TABLE_SIZE = (MAX_SHANTEN + 1) * (MAX_TILES_COUNT + 1) * (MAX_TURN + 1) * WAIT_SHAPES * (MAX_RIICHI_PLAYERS + 1)
+
+# cells with less decisions are not trusted
+MIN_DECISIONS = 30
+
+DEFAULT_TABLE_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..', 'data', 'round_rates.bin')
+
+# path -> loaded table, to share it between all players
+_loaded_tables = {}
+
+
+class RatesTable(object):
+    # counters for each cell
+    counters = None
+    # rounds played by the recorded players
+    count_of_hands = 0
+
+    def __init__(self, counters=None, count_of_hands=0):
+        self.counters = counters or array.array('I', [0]) * (TABLE_SIZE * COUNTERS)
+        self.count_of_hands = count_of_hands
+
+    def add(self, shanten, tiles_count, turn, count_of_waiting, riichi_players, is_tenpai, is_win, is_deal_in):
+        """
+        :param turn: count of our discards before the decision
+        :param is_tenpai: hand reached tenpai after the decision
+        """
+        offset = _cell_index(shanten, tiles_count, turn, count_of_waiting, riichi_players) * COUNTERS
+        counters = self.counters
+        counters[offset] += 1
+        counters[offset + 1] += is_tenpai and 1 or 0
+        counters[offset + 2] += is_win and 1 or 0
+        counters[offset + 3] += is_deal_in and 1 or 0
+
+    def merge(self, other):
+        counters = self.counters
+        for index, value in enumerate(other.counters):
+            if value:
+                counters[index] += value
+        self.count_of_hands += other.count_of_hands
+
+    def get(self, shanten, tiles_count, turn, count_of_waiting, riichi_players):
+        """
+        :return: tuple of (count of decisions, tenpai rate, win rate, deal-in rate)
+                 or None if there were not enough decisions
+        """
+        offset = _cell_index(shanten, tiles_count, turn, count_of_waiting, riichi_players) * COUNTERS
+        count, tenpai, wins, deal_ins = self.counters[offset:offset + COUNTERS]
+        if count < MIN_DECISIONS:
+            return None
+        return count, tenpai / count, wins / count, deal_ins / count
+
+    def save(self, path=None):
+        path = path or DEFAULT_TABLE_PATH
+
+        directory = os.path.dirname(os.path.realpath(path))
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        # running bots will not see half written table
+        temp_path = '{}.tmp'.format(path)
+        with open(temp_path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, _byte_order(), self.count_of_hands))
+            self.counters.tofile(f)
+        os.replace(temp_path, path)
+
+    @staticmethod
+    def from_file(path):
+        with open(path, 'rb') as f:
+            data = f.read()
+
+        if len(data) < HEADER.size:
+            raise ValueError('{} is not a rates table'.format(path))
+
+        magic, version, byte_order, count_of_hands = HEADER.unpack_from(data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('{} is not a rates table of version {}'.format(path, VERSION))
+
+        if byte_order != _byte_order():
+            raise ValueError('{} was built on the machine with different byte order'.format(path))
+
+        counters = array.array('I')
+        counters.frombytes(data[HEADER.size:])
+        if len(counters) != TABLE_SIZE * COUNTERS:
+            raise ValueError('{} has wrong size'.format(path))
+
+        return RatesTable(counters, count_of_hands)
+
+
+def load_rates_table(path=None):
+    """
+    :param path: path to the table file
+    :return: RatesTable or None if the table can't be loaded
+    """
+    path = path or DEFAULT_TABLE_PATH
+    if path in _loaded_tables:
+        return _loaded_tables[path]
+
+    try:
+        table = RatesTable.from_file(path)
+    except (OSError, ValueError) as e:
+        logger.warning('Rates table is not available, hard-coded ratios will be used: {}'.format(e))
+        table = None
+
+    _loaded_tables[path] = table
+    return table
+
+
+def _cell_index(shanten, tiles_count, turn, count_of_waiting, riichi_players):
+    shanten = min(max(shanten, 0), MAX_SHANTEN)
+    tiles_count = min(max(tiles_count, 0), MAX_TILES_COUNT)
+    turn = min(turn, MAX_TURN)
+    wait_shape = count_of_waiting > 1 and 1 or 0
+    riichi_players = min(riichi_players, MAX_RIICHI_PLAYERS)
+
+    index = shanten
+    index = index * (MAX_TILES_COUNT + 1) + tiles_count
+    index = index * (MAX_TURN + 1) + turn
+    index = index * WAIT_SHAPES + wait_shape
+    return index * (MAX_RIICHI_PLAYERS + 1) + riichi_players
+
+
+def _byte_order():
+    return sys.byteorder == 'little' and 1 or 0
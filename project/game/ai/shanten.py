@@ -0,0 +1,631 @@
+# -*- coding: utf-8 -*-
+from mahjong.shanten import Shanten
+
+TERMINAL_INDICES = [0, 8, 9, 17, 18, 26, 27, 28, 29, 30, 31, 32, 33]
+IS_TERMINAL = [x in TERMINAL_INDICES for x in range(0, 34)]
+
+# two suits that can be combined together when the third one was changed
+OTHER_SUITS = [(1, 2), (0, 2), (0, 1)]
+
+# 5 ** position, to update packed suit keys without rebuilding them
+POWERS_OF_FIVE = [5 ** x for x in range(0, 9)]
+
+# packed suit key -> not dominated (melds, tatsu, pairs) decompositions
+_suit_decompositions = {}
+
+
+def unpack_suit(key):
+    """
+    :param key: packed suit key
+    :return: array of 9 tile counts
+    """
+    counts = []
+    for x in range(0, 9):
+        counts.append(key % 5)
+        key //= 5
+    return counts
+
+
+def decompose_suit(counts):
+    """
+    Find all (melds, tatsu, pairs) combinations that mahjong.Shanten search
+    can reach for one suit and keep only combinations that are not dominated by others.
+    Search is going over the suit exactly as the library does it,
+    so we will get the same shanten numbers after combining suits together
+    :param counts: array of 9 tile counts
+    :return: tuple of (melds, tatsu, pairs) tuples
+    """
+    leaves = set()
+    _search_suit(list(counts), 0, 0, 0, 0, leaves)
+
+    results = []
+    for leaf in leaves:
+        dominated = False
+        for other in leaves:
+            if other != leaf and other[0] >= leaf[0] and other[1] >= leaf[1] and other[2] >= leaf[2]:
+                dominated = True
+                break
+
+        if not dominated:
+            results.append(leaf)
+
+    return tuple(sorted(results, reverse=True))
+
+
+def suit_decompositions(key):
+    """
+    Cached version of decompose_suit
+    :param key: packed suit key
+    :return: tuple of (melds, tatsu, pairs) tuples
+    """
+    result = _suit_decompositions.get(key)
+    if result is None:
+        result = decompose_suit(unpack_suit(key))
+        _suit_decompositions[key] = result
+    return result
+
+
+def load_suit_decompositions(backend, table_path=None):
+    """
+    Pluggable source of suit decompositions for IncrementalShanten
+    :param backend: "search" - calculate decompositions on demand and cache them in memory,
+                    "table" - read them from the precomputed memory-mapped table
+    :param table_path: path to the table file, default one will be used if it is empty
+    :return: function that returns decompositions by packed suit key
+    """
+    if backend == 'table':
+        # to avoid circular import
+        from game.ai.shanten_table import load_table
+
+        table = load_table(table_path)
+        if table:
+            return table.get
+
+    return suit_decompositions
+
+
+def combine_decompositions(first, second):
+    """
+    Sum each pair of suit decompositions and keep only not dominated results
+    :param first: tuple of (melds, tatsu, pairs) tuples
+    :param second: tuple of (melds, tatsu, pairs) tuples
+    :return: tuple of (melds, tatsu, pairs) tuples
+    """
+    sums = set()
+    for first_melds, first_tatsu, first_pairs in first:
+        for second_melds, second_tatsu, second_pairs in second:
+            sums.add((first_melds + second_melds, first_tatsu + second_tatsu, first_pairs + second_pairs))
+
+    results = []
+    for item in sums:
+        dominated = False
+        for other in sums:
+            if other != item and other[0] >= item[0] and other[1] >= item[1] and other[2] >= item[2]:
+                dominated = True
+                break
+
+        if not dominated:
+            results.append(item)
+
+    return tuple(results)
+
+
+def _combine_shanten(suit, rest, melds, pairs, min_shanten, target=-2):
+    """
+    Same formula as in mahjong.Shanten._update_result
+    :param target: we can stop the search when we reached this shanten
+    """
+    for suit_melds, suit_tatsu, suit_pairs in suit:
+        suit_melds += melds
+        suit_pairs += pairs
+        for rest_melds, rest_tatsu, rest_pairs in rest:
+            total_melds = suit_melds + rest_melds
+            total_tatsu = suit_tatsu + rest_tatsu
+            total_pairs = suit_pairs + rest_pairs
+
+            result = 8 - total_melds * 2 - total_tatsu - total_pairs
+            blocks = total_melds + total_tatsu
+            if total_pairs:
+                blocks += total_pairs - 1
+            if blocks > 4:
+                result += blocks - 4
+
+            if result < min_shanten:
+                if result <= target:
+                    return result
+                min_shanten = result
+
+    return min_shanten
+
+
+def _search_suit(tiles, depth, melds, tatsu, pairs, leaves):
+    """
+    Port of mahjong.Shanten._run limited by one suit.
+    Isolated tiles are not tracked there, they matter only for hands with 4 same tiles
+    and such hands are calculated by the library itself
+    """
+    while depth < 9 and not tiles[depth]:
+        depth += 1
+
+    if depth >= 9:
+        leaves.add((melds, tatsu, pairs))
+        return
+
+    i = depth
+
+    if tiles[i] == 4:
+        tiles[i] -= 3
+        if i < 7 and tiles[i + 2]:
+            if tiles[i + 1]:
+                _take_syuntsu(tiles, i)
+                _search_suit(tiles, i + 1, melds + 2, tatsu, pairs, leaves)
+                _return_syuntsu(tiles, i)
+            tiles[i] -= 1
+            tiles[i + 2] -= 1
+            _search_suit(tiles, i + 1, melds + 1, tatsu + 1, pairs, leaves)
+            tiles[i] += 1
+            tiles[i + 2] += 1
+
+        if i < 8 and tiles[i + 1]:
+            tiles[i] -= 1
+            tiles[i + 1] -= 1
+            _search_suit(tiles, i + 1, melds + 1, tatsu + 1, pairs, leaves)
+            tiles[i] += 1
+            tiles[i + 1] += 1
+
+        tiles[i] -= 1
+        _search_suit(tiles, i + 1, melds + 1, tatsu, pairs, leaves)
+        tiles[i] += 1
+        tiles[i] += 3
+
+        tiles[i] -= 2
+        if i < 7 and tiles[i + 2]:
+            if tiles[i + 1]:
+                _take_syuntsu(tiles, i)
+                _search_suit(tiles, i, melds + 1, tatsu, pairs + 1, leaves)
+                _return_syuntsu(tiles, i)
+            tiles[i] -= 1
+            tiles[i + 2] -= 1
+            _search_suit(tiles, i + 1, melds, tatsu + 1, pairs + 1, leaves)
+            tiles[i] += 1
+            tiles[i + 2] += 1
+
+        if i < 8 and tiles[i + 1]:
+            tiles[i] -= 1
+            tiles[i + 1] -= 1
+            _search_suit(tiles, i + 1, melds, tatsu + 1, pairs + 1, leaves)
+            tiles[i] += 1
+            tiles[i + 1] += 1
+        tiles[i] += 2
+
+    elif tiles[i] == 3:
+        tiles[i] -= 3
+        _search_suit(tiles, i + 1, melds + 1, tatsu, pairs, leaves)
+        tiles[i] += 3
+
+        tiles[i] -= 2
+        if i < 7 and tiles[i + 1] and tiles[i + 2]:
+            _take_syuntsu(tiles, i)
+            _search_suit(tiles, i + 1, melds + 1, tatsu, pairs + 1, leaves)
+            _return_syuntsu(tiles, i)
+        else:
+            if i < 7 and tiles[i + 2]:
+                tiles[i] -= 1
+                tiles[i + 2] -= 1
+                _search_suit(tiles, i + 1, melds, tatsu + 1, pairs + 1, leaves)
+                tiles[i] += 1
+                tiles[i + 2] += 1
+
+            if i < 8 and tiles[i + 1]:
+                tiles[i] -= 1
+                tiles[i + 1] -= 1
+                _search_suit(tiles, i + 1, melds, tatsu + 1, pairs + 1, leaves)
+                tiles[i] += 1
+                tiles[i + 1] += 1
+        tiles[i] += 2
+
+        if i < 7 and tiles[i + 2] >= 2 and tiles[i + 1] >= 2:
+            _take_syuntsu(tiles, i)
+            _take_syuntsu(tiles, i)
+            _search_suit(tiles, i, melds + 2, tatsu, pairs, leaves)
+            _return_syuntsu(tiles, i)
+            _return_syuntsu(tiles, i)
+
+    elif tiles[i] == 2:
+        tiles[i] -= 2
+        _search_suit(tiles, i + 1, melds, tatsu, pairs + 1, leaves)
+        tiles[i] += 2
+
+        if i < 7 and tiles[i + 2] and tiles[i + 1]:
+            _take_syuntsu(tiles, i)
+            _search_suit(tiles, i, melds + 1, tatsu, pairs, leaves)
+            _return_syuntsu(tiles, i)
+
+    elif tiles[i] == 1:
+        if i < 6 and tiles[i + 1] == 1 and tiles[i + 2] and tiles[i + 3] != 4:
+            _take_syuntsu(tiles, i)
+            _search_suit(tiles, i + 2, melds + 1, tatsu, pairs, leaves)
+            _return_syuntsu(tiles, i)
+        else:
+            tiles[i] -= 1
+            _search_suit(tiles, i + 1, melds, tatsu, pairs, leaves)
+            tiles[i] += 1
+
+            if i < 7 and tiles[i + 2]:
+                if tiles[i + 1]:
+                    _take_syuntsu(tiles, i)
+                    _search_suit(tiles, i + 1, melds + 1, tatsu, pairs, leaves)
+                    _return_syuntsu(tiles, i)
+                tiles[i] -= 1
+                tiles[i + 2] -= 1
+                _search_suit(tiles, i + 1, melds, tatsu + 1, pairs, leaves)
+                tiles[i] += 1
+                tiles[i + 2] += 1
+
+            if i < 8 and tiles[i + 1]:
+                tiles[i] -= 1
+                tiles[i + 1] -= 1
+                _search_suit(tiles, i + 1, melds, tatsu + 1, pairs, leaves)
+                tiles[i] += 1
+                tiles[i + 1] += 1
+
+
+def _take_syuntsu(tiles, i):
+    tiles[i] -= 1
+    tiles[i + 1] -= 1
+    tiles[i + 2] -= 1
+
+
+def _return_syuntsu(tiles, i):
+    tiles[i] += 1
+    tiles[i + 1] += 1
+    tiles[i + 2] += 1
+
+
+class IncrementalShanten(object):
+    """
+    Shanten calculation that keeps the hand split by suits.
+    Adding or removing one tile updates only one packed suit key,
+    and the shanten is combined from cached suit decompositions.
+    Results are identical to mahjong.Shanten, hands with 4 same closed tiles
+    (where the library has special rules) are delegated to the library
+    """
+
+    # full hand, including tiles from open sets
+    tiles_34 = None
+    open_sets_34 = None
+
+    # closed part of the hand, open sets are subtracted
+    closed_34 = None
+    suit_keys = None
+
+    count_of_tiles = 0
+    count_of_quads = 0
+    count_of_kinds = 0
+    count_of_pairs = 0
+    count_of_terminal_kinds = 0
+    count_of_terminal_pairs = 0
+    count_of_honor_sets = 0
+    count_of_honor_pairs = 0
+    count_of_free_honors = 0
+    count_of_negative_tiles = 0
+
+    reference = None
+    decompositions = None
+
+    # for each suit: (first other suit key, second other suit key, combined decompositions)
+    _combined_suits = None
+    _changed_suit = 0
+
+    def __init__(self, decompositions=None):
+        """
+        :param decompositions: function that returns decompositions by packed suit key
+        """
+        self.reference = Shanten()
+        self.decompositions = decompositions or suit_decompositions
+        self.set_hand([0] * 34)
+
+    def set_hand(self, tiles_34, open_sets_34=None):
+        """
+        :param tiles_34: array of tiles in 34 format
+        :param open_sets_34: array of array with tiles in 34 format
+        """
+        self.tiles_34 = [0] * 34
+        self.open_sets_34 = open_sets_34 or []
+        self.closed_34 = [0] * 34
+        self.suit_keys = [0, 0, 0]
+        self._combined_suits = [None, None, None]
+        self._changed_suit = 0
+
+        self.count_of_tiles = 0
+        self.count_of_quads = 0
+        self.count_of_kinds = 0
+        self.count_of_pairs = 0
+        self.count_of_terminal_kinds = 0
+        self.count_of_terminal_pairs = 0
+        self.count_of_honor_sets = 0
+        self.count_of_honor_pairs = 0
+        self.count_of_free_honors = 7
+        self.count_of_negative_tiles = 0
+
+        for tile in range(0, 34):
+            for _ in range(0, tiles_34[tile]):
+                self.add_tile(tile)
+
+        for meld in self.open_sets_34:
+            for tile in meld:
+                self._change_closed_tile(tile, -1)
+
+    def add_tile(self, tile):
+        """
+        :param tile: 34 tile format
+        """
+        count = self.tiles_34[tile]
+        self.tiles_34[tile] = count + 1
+        self.count_of_tiles += 1
+
+        if count == 0:
+            self.count_of_kinds += 1
+            if IS_TERMINAL[tile]:
+                self.count_of_terminal_kinds += 1
+            if tile >= 27:
+                self.count_of_free_honors -= 1
+        elif count == 1:
+            self.count_of_pairs += 1
+            if IS_TERMINAL[tile]:
+                self.count_of_terminal_pairs += 1
+
+        self._change_closed_tile(tile, 1)
+
+    def remove_tile(self, tile):
+        """
+        :param tile: 34 tile format
+        """
+        count = self.tiles_34[tile]
+        self.tiles_34[tile] = count - 1
+        self.count_of_tiles -= 1
+
+        if count == 1:
+            self.count_of_kinds -= 1
+            if IS_TERMINAL[tile]:
+                self.count_of_terminal_kinds -= 1
+            if tile >= 27:
+                self.count_of_free_honors += 1
+        elif count == 2:
+            self.count_of_pairs -= 1
+            if IS_TERMINAL[tile]:
+                self.count_of_terminal_pairs -= 1
+
+        self._change_closed_tile(tile, -1)
+
+    def calculate_shanten(self, tiles_34, open_sets_34=None):
+        """
+        Drop-in replacement for mahjong.Shanten.calculate_shanten
+        :param tiles_34: array of tiles in 34 format
+        :param open_sets_34: array of array with tiles in 34 format
+        :return: int
+        """
+        self.set_hand(tiles_34, open_sets_34)
+        return self.shanten()
+
+    def shanten(self):
+        """
+        Shanten number of the current hand
+        :return: int
+        """
+        if self.count_of_tiles > 14:
+            return -2
+
+        if not self._can_be_decomposed():
+            return self.reference.calculate_shanten(self.tiles_34, self.open_sets_34)
+
+        min_shanten = 8
+        if not self.open_sets_34:
+            min_shanten = self._chitoitsu_and_kokushi_shanten()
+
+        return self._regular_shanten(min_shanten)
+
+    def find_waiting(self, shanten, excluded_tile=None):
+        """
+        Find tiles that will decrease shanten number of the current hand after the draw
+        :param shanten: shanten number of the current hand
+        :param excluded_tile: 34 tile format, usually a tile that we just discarded
+        :return: array of tiles in 34 format
+        """
+        tiles_34 = self.tiles_34
+        closed_34 = self.closed_34
+        count_of_open_sets = len(self.open_sets_34)
+        needed_shanten = shanten - 1
+        decompositions = self.decompositions
+
+        # we can calculate shanten after the draw without changing the hand
+        can_use_fast_path = (
+            self.count_of_tiles < 14 and
+            not self.count_of_quads and
+            not self.count_of_negative_tiles
+        )
+
+        melds = (13 - self.count_of_tiles) // 3 + count_of_open_sets + self.count_of_honor_sets
+        pairs = self.count_of_honor_pairs
+
+        # chiitoitsu and kokushi shanten after the draw depends only on
+        # is it terminal tile and how many copies we already have
+        special_shanten = None
+        if not count_of_open_sets:
+            special_shanten = [[self._chitoitsu_and_kokushi_shanten(copies=x, is_terminal=y)
+                                for x in range(0, 4)] for y in range(0, 2)]
+
+        # tile without neighbours can't be a part of any set or tatsu,
+        # so regular shanten is the same for all such draws and we can calculate it once
+        isolated_shanten = None
+
+        waiting = []
+        for suit in range(0, 4):
+            first_tile = suit * 9
+            last_tile = suit < 3 and first_tile + 9 or 34
+
+            rest = None
+            near_tiles = 0
+            if suit < 3 and can_use_fast_path:
+                rest = self._combined_suits_for(suit)
+                near_tiles = self._near_tiles(first_tile)
+
+            for tile in range(first_tile, last_tile):
+                if tile == excluded_tile or tiles_34[tile] == 4:
+                    continue
+
+                count = closed_34[tile]
+                is_new_tile = not tiles_34[tile]
+
+                # new honor tile can break the library open sets replacement,
+                # and 4 same tiles have special rules
+                if (not can_use_fast_path or count == 3 or
+                        (suit == 3 and is_new_tile and self.count_of_free_honors <= count_of_open_sets)):
+                    self.add_tile(tile)
+                    if self.shanten() == needed_shanten:
+                        waiting.append(tile)
+                    self.remove_tile(tile)
+                    continue
+
+                new_shanten = 8
+                if special_shanten:
+                    new_shanten = special_shanten[IS_TERMINAL[tile]][tiles_34[tile]]
+                    if new_shanten == needed_shanten:
+                        waiting.append(tile)
+                        continue
+
+                if suit == 3:
+                    if count == 1:
+                        new_shanten = self._regular_shanten(new_shanten, melds, pairs + 1, needed_shanten)
+                    elif count == 2:
+                        new_shanten = self._regular_shanten(new_shanten, melds + 1, pairs - 1, needed_shanten)
+                    else:
+                        if isolated_shanten is None:
+                            isolated_shanten = self._regular_shanten(8, melds, pairs)
+                        if isolated_shanten < new_shanten:
+                            new_shanten = isolated_shanten
+                elif not near_tiles >> (tile - first_tile) & 1:
+                    if isolated_shanten is None:
+                        isolated_shanten = self._regular_shanten(8, melds, pairs)
+                    if isolated_shanten < new_shanten:
+                        new_shanten = isolated_shanten
+                else:
+                    key = self.suit_keys[suit] + POWERS_OF_FIVE[tile - first_tile]
+                    new_shanten = _combine_shanten(decompositions(key), rest, melds, pairs, new_shanten, needed_shanten)
+
+                if new_shanten == needed_shanten:
+                    waiting.append(tile)
+
+        return waiting
+
+    def _near_tiles(self, first_tile):
+        """
+        :param first_tile: 34 tile format, first tile of the suit
+        :return: bit mask of suit tiles that have closed tiles at distance of two or less
+        """
+        mask = 0
+        for position in range(0, 9):
+            if self.closed_34[first_tile + position]:
+                mask |= 1 << position
+        return mask | mask << 1 | mask << 2 | mask >> 1 | mask >> 2
+
+    def _can_be_decomposed(self):
+        """
+        The library replaces each open set with a pon of an isolated tile,
+        honor tiles are taken first, so for us it is just an additional meld.
+        In other cases we can't repeat its logic
+        """
+        return not (self.count_of_quads or
+                    self.count_of_negative_tiles or
+                    self.count_of_free_honors < len(self.open_sets_34))
+
+    def _regular_shanten(self, min_shanten, melds=None, pairs=None, target=-2):
+        if melds is None:
+            melds = (14 - self.count_of_tiles) // 3 + len(self.open_sets_34) + self.count_of_honor_sets
+            pairs = self.count_of_honor_pairs
+
+        suit = self._changed_suit
+        rest = self._combined_suits_for(suit)
+        return _combine_shanten(self.decompositions(self.suit_keys[suit]), rest, melds, pairs, min_shanten, target)
+
+    def _combined_suits_for(self, suit):
+        """
+        Usually we change tiles only in one suit between calls,
+        so two other suits can be combined once and reused
+        :param suit: suit that is not included to the combination
+        :return: combined decompositions of two other suits
+        """
+        first, second = OTHER_SUITS[suit]
+        first_key = self.suit_keys[first]
+        second_key = self.suit_keys[second]
+
+        cached = self._combined_suits[suit]
+        if cached and cached[0] == first_key and cached[1] == second_key:
+            return cached[2]
+
+        combined = combine_decompositions(self.decompositions(first_key), self.decompositions(second_key))
+        self._combined_suits[suit] = (first_key, second_key, combined)
+
+        return combined
+
+    def _change_closed_tile(self, tile, diff):
+        count = self.closed_34[tile]
+        new_count = count + diff
+        self.closed_34[tile] = new_count
+
+        if count == 4:
+            self.count_of_quads -= 1
+        elif new_count == 4:
+            self.count_of_quads += 1
+
+        if count < 0:
+            self.count_of_negative_tiles -= 1
+        if new_count < 0:
+            self.count_of_negative_tiles += 1
+
+        if tile < 27:
+            self._changed_suit = tile // 9
+            self.suit_keys[self._changed_suit] += diff * POWERS_OF_FIVE[tile % 9]
+        else:
+            if count == 3:
+                self.count_of_honor_sets -= 1
+            elif count == 2:
+                self.count_of_honor_pairs -= 1
+
+            if new_count == 3:
+                self.count_of_honor_sets += 1
+            elif new_count == 2:
+                self.count_of_honor_pairs += 1
+
+    def _chitoitsu_and_kokushi_shanten(self, new_tile=None, copies=None, is_terminal=0):
+        """
+        :param new_tile: 34 tile format, we can calculate shanten like this tile was added to the hand
+        :param copies: instead of new_tile, count of copies of the added tile that we already have
+        :param is_terminal: is added tile a terminal or honor
+        """
+        shanten = 8
+
+        kinds = self.count_of_kinds
+        completed_pairs = self.count_of_pairs
+        terminal_kinds = self.count_of_terminal_kinds
+        terminal_pairs = self.count_of_terminal_pairs
+        if new_tile is not None:
+            copies = self.tiles_34[new_tile]
+            is_terminal = IS_TERMINAL[new_tile]
+
+        if copies == 0:
+            kinds += 1
+            terminal_kinds += is_terminal
+        elif copies == 1:
+            completed_pairs += 1
+            terminal_pairs += is_terminal
+
+        result = 6 - completed_pairs + (kinds < 7 and 7 - kinds or 0)
+        if result < shanten:
+            shanten = result
+
+        result = 13 - terminal_kinds - (terminal_pairs and 1 or 0)
+        if result < shanten:
+            shanten = result
+
+        return shanten
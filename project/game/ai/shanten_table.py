@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+"""
+Precomputed suit decompositions for IncrementalShanten.
+
+Each suit has 9 tiles with 0-4 copies, so there are 5 ** 9 packed suit keys.
+The file stores an array of uint16 indices (one per key) that points to a pool of
+distinct decompositions, the array is memory-mapped and shared between processes.
+
+Build the table:
+    python -m game.ai.shanten_table --build
+Compare latency with the mahjong library:
+    python -m game.ai.shanten_table --benchmark
+"""
+import array
+import logging
+import mmap
+import os
+import random
+import struct
+import sys
+import time
+from optparse import OptionParser
+
+from mahjong.shanten import Shanten
+
+from game.ai.shanten import POWERS_OF_FIVE, IncrementalShanten, _suit_decompositions, decompose_suit, \
+    suit_decompositions
+
+logger = logging.getLogger('ai')
+
+MAGIC = b'SUIT'
+VERSION = 1
+# magic, version, byte order, count of decompositions in the pool, pool size in bytes
+HEADER = struct.Struct('<4sIBII')
+
+TABLE_SIZE = 5 ** 9
+# suits with more tiles than it is possible to have in the hand
+MISSING = 0xFFFF
+MAX_TILES_IN_SUIT = 14
+
+DEFAULT_TABLE_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..', 'data', 'suit_shanten.bin')
+
+# path -> loaded table, to share one memory map between all players
+_loaded_tables = {}
+
+
+class SuitShantenTable(object):
+    path = None
+    pool = None
+    indices = None
+
+    _file = None
+    _map = None
+
+    def __init__(self, path):
+        self.path = path
+
+        self._file = open(path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, byte_order, pool_count, pool_size = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError('{} is not a suit shanten table of version {}'.format(path, VERSION))
+
+        if byte_order != _byte_order():
+            self.close()
+            raise ValueError('{} was built on the machine with different byte order'.format(path))
+
+        self.pool = _unpack_pool(self._map[HEADER.size:HEADER.size + pool_size], pool_count)
+
+        offset = _indices_offset(pool_size)
+        self.indices = memoryview(self._map)[offset:offset + TABLE_SIZE * 2].cast('H')
+
+    def get(self, key):
+        """
+        :param key: packed suit key
+        :return: tuple of (melds, tatsu, pairs) tuples
+        """
+        index = self.indices[key]
+        if index == MISSING:
+            return suit_decompositions(key)
+        return self.pool[index]
+
+    def close(self):
+        if self.indices is not None:
+            self.indices.release()
+            self.indices = None
+
+        self._map.close()
+        self._file.close()
+
+
+def load_table(path=None):
+    """
+    :param path: path to the table file
+    :return: SuitShantenTable or None if the table can't be loaded
+    """
+    path = path or DEFAULT_TABLE_PATH
+    if path in _loaded_tables:
+        return _loaded_tables[path]
+
+    try:
+        table = SuitShantenTable(path)
+    except (OSError, ValueError) as e:
+        logger.warning('Suit shanten table is not available, decompositions will be calculated: {}'.format(e))
+        table = None
+
+    _loaded_tables[path] = table
+    return table
+
+
+def build_table(path=None, max_tiles=MAX_TILES_IN_SUIT):
+    """
+    Calculate decompositions for all suits and save them to the file
+    :param path: path to the table file
+    :param max_tiles: suits with more tiles will not be stored in the table
+    :return: count of stored suits
+    """
+    path = path or DEFAULT_TABLE_PATH
+
+    pool = {}
+    indices = array.array('H', [MISSING]) * TABLE_SIZE
+    count_of_suits = 0
+    for key, counts in _suits(max_tiles):
+        decompositions = decompose_suit(counts)
+        if decompositions not in pool:
+            pool[decompositions] = len(pool)
+
+        indices[key] = pool[decompositions]
+        count_of_suits += 1
+
+    packed_pool = _pack_pool(sorted(pool, key=lambda x: pool[x]))
+
+    directory = os.path.dirname(os.path.realpath(path))
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+
+    # write to the temporary file first,
+    # so running bots will not see half written table
+    temp_path = '{}.tmp'.format(path)
+    with open(temp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, _byte_order(), len(pool), len(packed_pool)))
+        f.write(packed_pool)
+        f.write(b'\x00' * (_indices_offset(len(packed_pool)) - HEADER.size - len(packed_pool)))
+        indices.tofile(f)
+    os.replace(temp_path, path)
+
+    return count_of_suits
+
+
+def benchmark(table_path=None, count_of_hands=2000, seed=0):
+    """
+    Per call latency of shanten calculation for random 13 and 14 tiles hands
+    :return: dict with (cold, warm) microseconds per call for each backend
+    """
+    generator = random.Random(seed)
+    hands = []
+    for _ in range(0, count_of_hands):
+        tiles = generator.sample(range(0, 136), generator.choice([13, 14]))
+        tiles_34 = [0] * 34
+        for tile in tiles:
+            tiles_34[tile // 4] += 1
+        hands.append(tiles_34)
+
+    calculators = [('mahjong', Shanten()), ('search', IncrementalShanten())]
+    table = load_table(table_path)
+    if table:
+        calculators.append(('table', IncrementalShanten(table.get)))
+
+    results = {}
+    for name, calculator in calculators:
+        # cold run is with the empty in-memory cache of suit decompositions
+        _suit_decompositions.clear()
+        cold = _measure(calculator, hands)
+        warm = _measure(calculator, hands)
+        results[name] = (cold, warm)
+
+    return results
+
+
+def _measure(calculator, hands):
+    start = time.perf_counter()
+    for hand in hands:
+        calculator.calculate_shanten(hand)
+    return (time.perf_counter() - start) / len(hands) * 1000000
+
+
+def _suits(max_tiles, position=0, key=0, counts=None):
+    """
+    Generate all suits with not more than max_tiles tiles
+    :return: generator of (packed suit key, counts of tiles) pairs
+    """
+    counts = counts or [0] * 9
+    if position == 9:
+        yield key, counts[:]
+        return
+
+    for count in range(0, min(4, max_tiles) + 1):
+        counts[position] = count
+        for item in _suits(max_tiles - count, position + 1, key + count * POWERS_OF_FIVE[position], counts):
+            yield item
+    counts[position] = 0
+
+
+def _byte_order():
+    return sys.byteorder == 'little' and 1 or 0
+
+
+def _indices_offset(pool_size):
+    # align indices array to 8 bytes
+    offset = HEADER.size + pool_size
+    return (offset + 7) // 8 * 8
+
+
+def _pack_pool(pool):
+    result = bytearray()
+    for decompositions in pool:
+        result.append(len(decompositions))
+        for item in decompositions:
+            result.extend(item)
+    return bytes(result)
+
+
+def _unpack_pool(data, count):
+    pool = []
+    position = 0
+    for _ in range(0, count):
+        size = data[position]
+        position += 1
+
+        decompositions = []
+        for _ in range(0, size):
+            decompositions.append((data[position], data[position + 1], data[position + 2]))
+            position += 3
+        pool.append(tuple(decompositions))
+    return pool
+
+
+def main():
+    parser = OptionParser()
+
+    parser.add_option('-b', '--build',
+                      action='store_true',
+                      default=False,
+                      help='Build the suit shanten table')
+
+    parser.add_option('-m', '--benchmark',
+                      action='store_true',
+                      default=False,
+                      help='Compare shanten calculation latency with the mahjong library')
+
+    parser.add_option('-p', '--path',
+                      type='string',
+                      default=None,
+                      help='Path to the table file. Default is {}'.format(os.path.normpath(DEFAULT_TABLE_PATH)))
+
+    opts, _ = parser.parse_args()
+
+    if not opts.build and not opts.benchmark:
+        print('Please, set -b or -m option')
+        return
+
+    if opts.build:
+        start = time.time()
+        count_of_suits = build_table(opts.path)
+        print('Table with {} suits was built in {:.1f} seconds'.format(count_of_suits, time.time() - start))
+
+    if opts.benchmark:
+        for name, (cold, warm) in benchmark(opts.path).items():
+            print('{}: {:.1f} us per call, {:.1f} us with warm cache'.format(name, cold, warm))
+
+
+if __name__ == '__main__':
+    main()
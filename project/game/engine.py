@@ -0,0 +1,713 @@
+# -*- coding: utf-8 -*-
+"""
+Game engine for the local games.
+
+It deals walls, asks players for decisions, validates them and counts scores.
+Players are connected to the engine with agents, see SeatAgent.
+Seats are absolute in the engine, agents should convert them if it is needed.
+
+Walls depend only on the game seed, and all accepted decisions are added to the game digest,
+so the game can be replayed from the seed and compared with the original one.
+
+Simplified rules: there are no abortive draws, no chankan, no kuikae restrictions,
+no ura dora and no ippatsu. Win is possible only with yaku and without furiten by own discards
+"""
+import hashlib
+import logging
+import random
+
+from mahjong.agari import Agari
+from mahjong.constants import EAST, SOUTH, WEST, NORTH
+from mahjong.hand_calculating.hand import HandCalculator
+from mahjong.hand_calculating.hand_config import HandConfig
+from mahjong.meld import Meld
+from mahjong.shanten import Shanten
+from mahjong.tile import TilesConverter
+
+logger = logging.getLogger('engine')
+
+# decisions after the draw: (type, tile, is riichi)
+DISCARD = 'discard'
+TSUMO = 'tsumo'
+CLOSED_KAN = 'closed_kan'
+# pon upgraded to kan
+ADDED_KAN = 'added_kan'
+
+# decisions on other player discard: (type, tiles from the hand)
+RON = 'ron'
+PON = 'pon'
+CHI = 'chi'
+OPEN_KAN = 'open_kan'
+
+# round results
+AGARI = 'agari'
+RYUUKYOKU = 'ryuukyoku'
+
+WINDS = [EAST, SOUTH, WEST, NORTH]
+START_SCORES = 25000
+RETURN_SCORES = 30000
+# for the first, second, third and fourth places
+UMA = [20, 10, -10, -20]
+MAX_KANS = 4
+
+
+class SeatAgent(object):
+    """
+    Player at the engine table.
+    Notifications are sent to all agents, decisions are asked only from the current player
+    """
+    seat = 0
+    name = 'NoName'
+
+    def start_game(self, engine):
+        pass
+
+    def start_round(self, engine, tiles):
+        """
+        :param tiles: 13 tiles in 136 format
+        """
+        pass
+
+    def see_draw(self, seat):
+        pass
+
+    def choose_draw_action(self, tile, can_tsumo):
+        """
+        :param tile: drawn tile, 136 format
+        :param can_tsumo: boolean
+        :return: (DISCARD, tile, is_riichi), (TSUMO, None, False), (CLOSED_KAN, tile, False)
+        or (ADDED_KAN, tile, False)
+        """
+        raise NotImplementedError()
+
+    def see_discard(self, seat, tile, is_tsumogiri, offer):
+        """
+        :param offer: list of possible calls for this agent, it is empty if there is nothing to call
+        :return: None for the empty offer, otherwise (RON, []), (PON, two tiles), (CHI, two tiles),
+        (OPEN_KAN, []) or None to skip
+        """
+        return None
+
+    def choose_discard_after_call(self):
+        """
+        :return: tile to discard after the called pon or chi
+        """
+        raise NotImplementedError()
+
+    def see_meld(self, meld):
+        pass
+
+    def see_riichi(self, seat, step):
+        pass
+
+    def see_dora_indicator(self, tile):
+        pass
+
+    def see_round_result(self, result, is_last):
+        """
+        :param result: dict from the engine, see GameEngine._agari and GameEngine._ryuukyoku
+        :param is_last: it is the last round of the game
+        """
+        pass
+
+    def end_game(self, engine):
+        pass
+
+
+class TsumogiriAgent(SeatAgent):
+    """
+    Discards the drawn tile, and wins when it is possible
+    """
+    name = 'Tsumogiri'
+
+    def choose_draw_action(self, tile, can_tsumo):
+        if can_tsumo:
+            return TSUMO, None, False
+        return DISCARD, tile, False
+
+    def see_discard(self, seat, tile, is_tsumogiri, offer):
+        if RON in offer:
+            return RON, []
+        return None
+
+
+class WallGenerator(object):
+    """
+    Walls for all rounds of the game from one seed.
+    Round wall depends only on the seed and the round index,
+    so it doesn't matter how much random numbers were used by players
+    """
+    seed = None
+
+    def __init__(self, seed=None):
+        """
+        :param seed: integer, new random seed is generated if it is not set
+        """
+        self.seed = seed if seed is not None else random.getrandbits(64)
+
+    def generate(self, round_index):
+        """
+        :param round_index: index of the round in the game, including renchan rounds
+        :return: list of 136 tiles
+        """
+        wall = list(range(0, 136))
+        # string seed is hashed in the same way on all platforms and python runs
+        random.Random('{}:{}'.format(self.seed, round_index)).shuffle(wall)
+        return wall
+
+
+class GameEngine(object):
+    agents = None
+    wall_generator = None
+
+    count_of_rounds = 8
+    has_aka_dora = True
+    has_open_tanyao = True
+
+    # game state
+    scores = None
+    round_number = 0
+    count_of_honba_sticks = 0
+    count_of_riichi_sticks = 0
+    dealer_seat = 0
+    uma = None
+    results = None
+
+    # round state
+    wall = None
+    dead_wall = None
+    dora_indicators = None
+    count_of_kans = 0
+    hands = None
+    melds = None
+    discards = None
+    in_riichi = None
+    last_draw = None
+    is_rinshan = False
+
+    # seat -> count of replies that were replaced by the default action
+    invalid_actions = None
+    # hash of all accepted decisions
+    history = None
+
+    def __init__(self, agents, seed=None, is_hanchan=True, has_aka_dora=True, has_open_tanyao=True):
+        """
+        :param agents: four SeatAgent objects
+        :param seed: integer seed for the walls, random one is used if it is not set
+        """
+        self.agents = agents
+        for seat, agent in enumerate(agents):
+            agent.seat = seat
+
+        self.wall_generator = WallGenerator(seed)
+        self.count_of_rounds = is_hanchan and 8 or 4
+        self.has_aka_dora = has_aka_dora
+        self.has_open_tanyao = has_open_tanyao
+
+        self.agari = Agari()
+        self.shanten = Shanten()
+        self.hand_calculator = HandCalculator()
+
+    def play_game(self):
+        """
+        :return: final scores
+        """
+        self.scores = [START_SCORES] * 4
+        self.round_number = 0
+        self.count_of_honba_sticks = 0
+        self.count_of_riichi_sticks = 0
+        self.dealer_seat = 0
+        self.uma = None
+        self.results = []
+        self.invalid_actions = [0] * 4
+        self.history = hashlib.sha1()
+
+        for agent in self.agents:
+            agent.start_game(self)
+
+        is_last = False
+        while not is_last:
+            result = self.play_round()
+            self.results.append(result)
+
+            for seat in range(0, 4):
+                self.scores[seat] += result['deltas'][seat]
+
+            is_last = self._is_game_over(result['dealer_keeps'])
+            if is_last:
+                self.uma = self._calculate_uma()
+
+            for agent in self.agents:
+                agent.see_round_result(result, is_last)
+
+            if result['dealer_keeps'] or result['type'] == RYUUKYOKU:
+                self.count_of_honba_sticks += 1
+            else:
+                self.count_of_honba_sticks = 0
+
+            if not result['dealer_keeps']:
+                self.dealer_seat = (self.dealer_seat + 1) % 4
+                self.round_number += 1
+
+        for agent in self.agents:
+            agent.end_game(self)
+
+        return self.scores
+
+    def play_round(self):
+        wall = self.wall_generator.generate(len(self.results))
+
+        self.dead_wall = wall[-14:]
+        self.wall = wall[:-14]
+        self.dora_indicators = [self.dead_wall[4]]
+        self.count_of_kans = 0
+
+        self.hands = [[], [], [], []]
+        for x in range(0, 4):
+            seat = (self.dealer_seat + x) % 4
+            self.hands[seat] = sorted(self.wall[:13])
+            del self.wall[:13]
+
+        self.melds = [[], [], [], []]
+        self.discards = [[], [], [], []]
+        self.in_riichi = [False] * 4
+
+        for agent in self.agents:
+            agent.start_round(self, self.hands[agent.seat][:])
+
+        seat = self.dealer_seat
+        drawn_tile = self._draw_tile(seat)
+        while True:
+            if drawn_tile is not None:
+                action_type, tile, is_riichi = self._ask_draw_action(seat, drawn_tile)
+
+                if action_type == TSUMO:
+                    return self._agari(seat, seat, drawn_tile)
+
+                if action_type == CLOSED_KAN or action_type == ADDED_KAN:
+                    self._call_kan(seat, action_type, tile)
+                    drawn_tile = self._draw_tile(seat, is_rinshan=True)
+                    continue
+            else:
+                # after called pon or chi
+                tile = self._ask_discard_after_call(seat)
+                is_riichi = False
+
+            winner, caller, call = self._discard_tile(seat, tile, is_riichi, tile == drawn_tile)
+            if winner is not None:
+                return self._agari(winner, seat, tile)
+
+            if caller is None:
+                if not self.wall:
+                    return self._ryuukyoku()
+
+                seat = (seat + 1) % 4
+                drawn_tile = self._draw_tile(seat)
+                continue
+
+            self._call_meld(caller, seat, tile, call)
+            seat = caller
+            if call[0] == OPEN_KAN:
+                drawn_tile = self._draw_tile(seat, is_rinshan=True)
+            else:
+                drawn_tile = None
+
+    @property
+    def seed(self):
+        return self.wall_generator.seed
+
+    @property
+    def digest(self):
+        """
+        :return: hex string, it is the same for the same seed and the same decisions
+        """
+        return self.history.hexdigest()
+
+    def player_wind(self, seat):
+        return WINDS[(seat - self.dealer_seat) % 4]
+
+    @property
+    def round_wind(self):
+        return WINDS[min(self.round_number // 4, 3)]
+
+    def _draw_tile(self, seat, is_rinshan=False):
+        if is_rinshan:
+            # kan was already added, and the last tile of the live wall is moved to the dead wall
+            tile = self.dead_wall[self.count_of_kans - 1]
+            self.wall.pop()
+        else:
+            tile = self.wall.pop(0)
+
+        self.is_rinshan = is_rinshan
+        self.last_draw = tile
+        self.hands[seat].append(tile)
+
+        for agent in self.agents:
+            if agent.seat != seat:
+                agent.see_draw(seat)
+
+        return tile
+
+    def _ask_draw_action(self, seat, drawn_tile):
+        can_tsumo = self._can_win(seat, drawn_tile, is_tsumo=True)
+        action = self.agents[seat].choose_draw_action(drawn_tile, can_tsumo)
+        action_type, tile, is_riichi = action
+
+        is_valid = False
+        if action_type == TSUMO:
+            is_valid = can_tsumo
+        elif action_type == CLOSED_KAN or action_type == ADDED_KAN:
+            is_valid = self._is_valid_kan(seat, action_type, tile, drawn_tile)
+        elif action_type == DISCARD:
+            is_valid = tile in self.hands[seat]
+            # player in riichi can discard only the drawn tile
+            if self.in_riichi[seat] and tile != drawn_tile:
+                is_valid = False
+            if is_valid and is_riichi and not self._can_call_riichi(seat, tile):
+                is_valid = False
+
+        if not is_valid:
+            self._invalid_action(seat, action)
+            action = (DISCARD, drawn_tile, False)
+
+        self._add_to_history(seat, action)
+        return action
+
+    def _ask_discard_after_call(self, seat):
+        tile = self.agents[seat].choose_discard_after_call()
+        if tile not in self.hands[seat]:
+            self._invalid_action(seat, tile)
+            tile = self.hands[seat][-1]
+
+        self._add_to_history(seat, tile)
+        return tile
+
+    def _discard_tile(self, seat, tile, is_riichi, is_tsumogiri):
+        """
+        :return: winner seat, caller seat and call
+        """
+        if is_riichi:
+            for agent in self.agents:
+                agent.see_riichi(seat, 1)
+
+        self.hands[seat].remove(tile)
+        self.discards[seat].append(tile)
+
+        offers = self._find_offers(seat, tile)
+
+        calls = {}
+        for agent in self.agents:
+            offer = offers.get(agent.seat, [])
+            call = agent.see_discard(seat, tile, is_tsumogiri, offer)
+            if not offer or not call:
+                continue
+
+            if self._is_valid_call(agent.seat, tile, offer, call):
+                calls[agent.seat] = call
+                self._add_to_history(agent.seat, call)
+            else:
+                self._invalid_action(agent.seat, call)
+
+        # the first player after discarder wins (atamahane)
+        for x in range(1, 4):
+            caller = (seat + x) % 4
+            if caller in calls and calls[caller][0] == RON:
+                return caller, None, None
+
+        if is_riichi:
+            self.in_riichi[seat] = True
+            self.scores[seat] -= 1000
+            self.count_of_riichi_sticks += 1
+            for agent in self.agents:
+                agent.see_riichi(seat, 2)
+
+        # pon and kan have the priority over chi
+        for call_type in [PON, OPEN_KAN, CHI]:
+            for caller, call in calls.items():
+                if call[0] == call_type:
+                    return None, caller, call
+
+        return None, None, None
+
+    def _find_offers(self, seat, tile):
+        """
+        :return: dict of seat -> list of possible calls
+        """
+        tile_34 = tile // 4
+        offers = {}
+        for x in range(1, 4):
+            caller = (seat + x) % 4
+            offer = []
+
+            if self._can_win(caller, tile, is_tsumo=False):
+                offer.append(RON)
+
+            # there are no calls on the last tile
+            if self.wall and not self.in_riichi[caller]:
+                count_of_copies = len([x for x in self.hands[caller] if x // 4 == tile_34])
+                if count_of_copies >= 2:
+                    offer.append(PON)
+                if count_of_copies == 3 and self.count_of_kans < MAX_KANS:
+                    offer.append(OPEN_KAN)
+                if x == 1 and self._chi_options(caller, tile):
+                    offer.append(CHI)
+
+            if offer:
+                offers[caller] = offer
+        return offers
+
+    def _chi_options(self, seat, tile):
+        """
+        :return: list of pairs of tiles 34 from the hand
+        """
+        tile_34 = tile // 4
+        if tile_34 >= 27:
+            return []
+
+        hand_34 = set([x // 4 for x in self.hands[seat]])
+        position = tile_34 % 9
+        options = []
+        for first, second in [(-2, -1), (-1, 1), (1, 2)]:
+            if 0 <= position + first and position + second <= 8:
+                if tile_34 + first in hand_34 and tile_34 + second in hand_34:
+                    options.append((tile_34 + first, tile_34 + second))
+        return options
+
+    def _is_valid_call(self, seat, tile, offer, call):
+        call_type, tiles = call
+        if call_type not in offer:
+            return False
+
+        if call_type == RON or call_type == OPEN_KAN:
+            return True
+
+        if len(tiles) != 2 or len(set(tiles)) != 2 or not all([x in self.hands[seat] for x in tiles]):
+            return False
+
+        tiles_34 = sorted([x // 4 for x in tiles])
+        if call_type == PON:
+            return tiles_34 == [tile // 4, tile // 4]
+
+        return tuple(tiles_34) in self._chi_options(seat, tile)
+
+    def _can_call_riichi(self, seat, tile):
+        if self.in_riichi[seat] or any([x.opened for x in self.melds[seat]]):
+            return False
+
+        if self.scores[seat] < 1000 or len(self.wall) < 4:
+            return False
+
+        hand = self.hands[seat][:]
+        hand.remove(tile)
+        return self._shanten(hand) == 0
+
+    def _is_valid_kan(self, seat, action_type, tile, drawn_tile):
+        if self.count_of_kans >= MAX_KANS or not self.wall or tile not in self.hands[seat]:
+            return False
+
+        tile_34 = tile // 4
+        # we don't check changes of the waiting
+        if self.in_riichi[seat] and tile_34 != drawn_tile // 4:
+            return False
+
+        if action_type == CLOSED_KAN:
+            return len([x for x in self.hands[seat] if x // 4 == tile_34]) == 4
+
+        return any([x.type == Meld.PON and x.tiles[0] // 4 == tile_34 for x in self.melds[seat]])
+
+    def _call_kan(self, seat, action_type, tile):
+        tile_34 = tile // 4
+        if action_type == CLOSED_KAN:
+            tiles = [x for x in self.hands[seat] if x // 4 == tile_34]
+            meld = Meld(Meld.KAN, sorted(tiles), False, tile, seat, seat)
+            for x in tiles:
+                self.hands[seat].remove(x)
+        else:
+            meld = [x for x in self.melds[seat] if x.type == Meld.PON and x.tiles[0] // 4 == tile_34][0]
+            self.melds[seat].remove(meld)
+            # the same as in tenhou, called tile is the added tile
+            meld = Meld(Meld.CHANKAN, meld.tiles + [tile], True, tile, seat, meld.from_who)
+            self.hands[seat].remove(tile)
+
+        self._add_meld(seat, meld)
+
+    def _call_meld(self, seat, from_seat, tile, call):
+        call_type, tiles = call
+        if call_type == OPEN_KAN:
+            tiles = [x for x in self.hands[seat] if x // 4 == tile // 4]
+            meld_type = Meld.KAN
+        elif call_type == PON:
+            meld_type = Meld.PON
+        else:
+            meld_type = Meld.CHI
+
+        for x in tiles:
+            self.hands[seat].remove(x)
+
+        meld = Meld(meld_type, sorted(tiles + [tile]), True, tile, seat, from_seat)
+        self._add_meld(seat, meld)
+
+    def _add_meld(self, seat, meld):
+        self.melds[seat].append(meld)
+        for agent in self.agents:
+            agent.see_meld(meld)
+
+        if meld.type == Meld.KAN or meld.type == Meld.CHANKAN:
+            self.count_of_kans += 1
+            # four rinshan tiles and then dora indicators
+            indicator = self.dead_wall[4 + self.count_of_kans]
+            self.dora_indicators.append(indicator)
+            for agent in self.agents:
+                agent.see_dora_indicator(indicator)
+
+    def _all_tiles(self, seat, hand):
+        """
+        Hand and meld tiles, kan is counted as pon
+        """
+        tiles = hand[:]
+        for meld in self.melds[seat]:
+            tiles.extend(meld.tiles[:3])
+        return tiles
+
+    def _shanten(self, hand):
+        # melds are already completed sets, so they are not needed there
+        return self.shanten.calculate_shanten(TilesConverter.to_34_array(hand))
+
+    def _is_agari(self, hand):
+        return self.agari.is_agari(TilesConverter.to_34_array(hand))
+
+    def _can_win(self, seat, tile, is_tsumo):
+        if is_tsumo:
+            hand = self.hands[seat]
+        else:
+            hand = self.hands[seat] + [tile]
+
+        if not self._is_agari(hand):
+            return False
+
+        # furiten by own discards
+        if not is_tsumo:
+            for discarded_tile in set([x // 4 for x in self.discards[seat]]):
+                if self._is_agari(self.hands[seat] + [discarded_tile * 4]):
+                    return False
+
+        result = self._estimate_hand_value(seat, tile, is_tsumo)
+        return result.error is None and result.cost is not None
+
+    def _estimate_hand_value(self, seat, tile, is_tsumo):
+        hand = is_tsumo and self.hands[seat] or self.hands[seat] + [tile]
+
+        config = HandConfig(
+            is_tsumo=is_tsumo,
+            is_riichi=self.in_riichi[seat],
+            is_rinshan=is_tsumo and self.is_rinshan,
+            is_haitei=is_tsumo and not self.wall,
+            is_houtei=not is_tsumo and not self.wall,
+            player_wind=self.player_wind(seat),
+            round_wind=self.round_wind,
+            has_aka_dora=self.has_aka_dora,
+            has_open_tanyao=self.has_open_tanyao
+        )
+
+        return self.hand_calculator.estimate_hand_value(
+            self._all_tiles(seat, hand),
+            tile,
+            self.melds[seat],
+            self.dora_indicators,
+            config
+        )
+
+    def _agari(self, winner, from_seat, tile):
+        is_tsumo = winner == from_seat
+        hand_value = self._estimate_hand_value(winner, tile, is_tsumo)
+        is_dealer = winner == self.dealer_seat
+
+        deltas = [0] * 4
+        if is_tsumo:
+            for seat in range(0, 4):
+                if seat == winner:
+                    continue
+
+                if is_dealer or seat == self.dealer_seat:
+                    payment = hand_value.cost['main']
+                else:
+                    payment = hand_value.cost['additional']
+                payment += self.count_of_honba_sticks * 100
+
+                deltas[seat] -= payment
+                deltas[winner] += payment
+        else:
+            payment = hand_value.cost['main'] + self.count_of_honba_sticks * 300
+            deltas[from_seat] -= payment
+            deltas[winner] += payment
+
+        deltas[winner] += self.count_of_riichi_sticks * 1000
+        self.count_of_riichi_sticks = 0
+
+        hand = is_tsumo and self.hands[winner] or self.hands[winner] + [tile]
+        return {
+            'type': AGARI,
+            'who': winner,
+            'from_who': from_seat,
+            'hand': sorted(hand),
+            'melds': self.melds[winner],
+            'win_tile': tile,
+            'han': hand_value.han,
+            'fu': hand_value.fu,
+            'cost': sum([x for x in deltas if x > 0]),
+            'deltas': deltas,
+            'dealer_keeps': is_dealer,
+        }
+
+    def _ryuukyoku(self):
+        tempai = [seat for seat in range(0, 4) if self._shanten(self.hands[seat]) == 0]
+
+        deltas = [0] * 4
+        if 0 < len(tempai) < 4:
+            for seat in range(0, 4):
+                if seat in tempai:
+                    deltas[seat] = 3000 // len(tempai)
+                else:
+                    deltas[seat] = -3000 // (4 - len(tempai))
+
+        return {
+            'type': RYUUKYOKU,
+            'tempai': tempai,
+            'deltas': deltas,
+            'dealer_keeps': self.dealer_seat in tempai,
+        }
+
+    def _is_game_over(self, dealer_keeps):
+        if any([x < 0 for x in self.scores]):
+            return True
+
+        return not dealer_keeps and self.round_number + 1 >= self.count_of_rounds
+
+    def get_places(self):
+        """
+        :return: list of places from 1 to 4 by seats
+        """
+        # the same scores are sorted by the first seat
+        seats = sorted(range(0, 4), key=lambda x: (-self.scores[x], x))
+        places = [0] * 4
+        for place, seat in enumerate(seats):
+            places[seat] = place + 1
+        return places
+
+    def _calculate_uma(self):
+        places = self.get_places()
+
+        uma = [0] * 4
+        for seat in range(0, 4):
+            uma[seat] = (self.scores[seat] - RETURN_SCORES) / 1000 + UMA[places[seat] - 1]
+            # the first place takes the difference between the start and return scores
+            if places[seat] == 1:
+                uma[seat] += (RETURN_SCORES - START_SCORES) * 4 / 1000
+        return uma
+
+    def _add_to_history(self, seat, action):
+        self.history.update('{}:{};'.format(seat, action).encode())
+
+    def _invalid_action(self, seat, action):
+        self.invalid_actions[seat] += 1
+        logger.warning('Invalid action from {} seat: {}'.format(seat, action))
@@ -74,10 +74,10 @@ class PlayerInterface(object):
         # because of furiten
         if tile.value:  # debug because sometimes tile is None
             self.discards.append(tile)
-            tile = tile.value // 4
+            tile_mask = 1 << (tile.value // 4)
             for player in self.table.players[1:]:
-                if player.in_riichi and tile not in player.safe_tiles:
-                    player.safe_tiles.append(tile)
+                if player.in_riichi:
+                    player.furiten_mask |= tile_mask
 
     @property
     def player_wind(self):
@@ -176,7 +176,14 @@ class Player(PlayerInterface):
         """
 
         tile_to_discard = self.ai.discard_tile(discard_tile)
+        return self.apply_discard(tile_to_discard)
 
+    def apply_discard(self, tile_to_discard):
+        """
+        Remove already selected tile from the hand
+        :param tile_to_discard: 136 tile format
+        :return:
+        """
         is_tsumogiri = tile_to_discard == self.last_draw
         # it is important to use table method,
         # to recalculate revealed tiles and etc.
@@ -278,35 +285,86 @@ class Player(PlayerInterface):
 
 
 class EnemyPlayer(PlayerInterface):
-    # array of tiles in 34 tile format
-    safe_tiles = None
+    # safe tiles are stored as masks, one bit for each tile in 34 format
+    # tiles from the player discard
+    genbutsu_mask = 0
+    # tiles that were discarded by other players after player riichi
+    furiten_mask = 0
     # tiles that were discarded in the current "step"
     # so, for example kamicha discard will be a safe tile for all players
-    temporary_safe_tiles = None
+    temporary_safe_mask = 0
 
     def erase_state(self):
         super().erase_state()
 
-        self.safe_tiles = []
-        self.temporary_safe_tiles = []
+        self.genbutsu_mask = 0
+        self.furiten_mask = 0
+        self.temporary_safe_mask = 0
 
     def add_discarded_tile(self, tile: Tile):
         super().add_discarded_tile(tile)
 
-        tile = tile.value // 4
-        if tile not in self.safe_tiles:
-            self.safe_tiles.append(tile)
+        tile_mask = 1 << (tile.value // 4)
+        self.genbutsu_mask |= tile_mask
 
         # erase temporary furiten after tile draw
-        self.temporary_safe_tiles = []
+        self.temporary_safe_mask = 0
         affected_players = [1, 2, 3]
         affected_players.remove(self.seat)
 
         # temporary furiten, for one "step"
         for x in affected_players:
-            if tile not in self.table.get_player(x).temporary_safe_tiles:
-                self.table.get_player(x).temporary_safe_tiles.append(tile)
+            self.table.get_player(x).temporary_safe_mask |= tile_mask
+
+    @property
+    def all_safe_mask(self):
+        return self.genbutsu_mask | self.furiten_mask | self.temporary_safe_mask
+
+    @property
+    def safe_tiles(self):
+        """
+        Array of tiles in 34 tile format
+        """
+        return mask_to_tiles(self.genbutsu_mask | self.furiten_mask)
+
+    @safe_tiles.setter
+    def safe_tiles(self, tiles):
+        self.genbutsu_mask = tiles_to_mask(tiles)
+        self.furiten_mask = 0
+
+    @property
+    def temporary_safe_tiles(self):
+        return mask_to_tiles(self.temporary_safe_mask)
+
+    @temporary_safe_tiles.setter
+    def temporary_safe_tiles(self, tiles):
+        self.temporary_safe_mask = tiles_to_mask(tiles)
 
     @property
     def all_safe_tiles(self):
-        return list(set(self.temporary_safe_tiles + self.safe_tiles))
+        return mask_to_tiles(self.all_safe_mask)
+
+
+def tiles_to_mask(tiles):
+    """
+    :param tiles: array of tiles in 34 format
+    :return: int with bit for each tile
+    """
+    mask = 0
+    for tile in tiles:
+        mask |= 1 << tile
+    return mask
+
+
+def mask_to_tiles(mask):
+    """
+    :param mask: int with bit for each tile in 34 format
+    :return: sorted array of tiles in 34 format
+    """
+    tiles = []
+    while mask:
+        # the lowest set bit
+        tile_mask = mask & -mask
+        tiles.append(tile_mask.bit_length() - 1)
+        mask ^= tile_mask
+    return tiles
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+Our AI at the engine table.
+It calls Table and Player in the same order as TenhouClient does,
+so AI decisions are the same as in the real game
+"""
+from mahjong.meld import Meld
+
+from game.engine import TsumogiriAgent, DISCARD, TSUMO, CLOSED_KAN, ADDED_KAN, RON, PON, CHI, OPEN_KAN, AGARI, \
+    RYUUKYOKU
+from game.table import Table
+
+
+class PlayerAgent(TsumogiriAgent):
+    name = 'AI'
+    table = None
+    engine = None
+
+    # called tile and tile to discard after the meld
+    _meld_tile = None
+    _tile_to_discard = None
+
+    def __init__(self, name='AI', params={}):
+        """
+        :param params: AI params, the same as in the reproducer
+        """
+        self.name = name
+        self.table = Table(params)
+
+    @property
+    def player(self):
+        return self.table.player
+
+    def start_game(self, engine):
+        self.engine = engine
+        self.table.has_aka_dora = engine.has_aka_dora
+        self.table.has_open_tanyao = engine.has_open_tanyao
+
+        for x in range(0, 4):
+            self.table.get_player(x).name = engine.agents[self._absolute_seat(x)].name
+
+    def start_round(self, engine, tiles):
+        self.table.init_round(
+            engine.round_number,
+            engine.count_of_honba_sticks,
+            engine.count_of_riichi_sticks,
+            engine.dora_indicators[0],
+            self._relative_seat(engine.dealer_seat),
+            self._rotated_scores(engine.scores),
+        )
+        self.player.init_hand(tiles)
+
+    def choose_draw_action(self, tile, can_tsumo):
+        # client is always winning by self draw
+        if can_tsumo:
+            return TSUMO, None, False
+
+        if self.player.in_riichi:
+            self.table.add_discarded_tile(0, tile, True)
+            return DISCARD, tile, False
+
+        self.player.draw_tile(tile)
+
+        kan_type = self.player.should_call_kan(tile, False)
+        if kan_type and self.table.count_of_remaining_tiles > 1:
+            return kan_type == Meld.CHANKAN and ADDED_KAN or CLOSED_KAN, tile, False
+
+        discarded_tile = self.player.apply_discard(self.player.ai.discard_tile(None))
+        is_riichi = self.player.can_call_riichi()
+        if is_riichi:
+            self.player.in_riichi = True
+
+        return DISCARD, discarded_tile, is_riichi
+
+    def see_discard(self, seat, tile, is_tsumogiri, offer):
+        relative_seat = self._relative_seat(seat)
+        # our discards were added to the table by the player
+        if not relative_seat:
+            return None
+
+        should_call_win = RON in offer and self.player.should_call_win(tile, relative_seat)
+        self.table.add_discarded_tile(relative_seat, tile, is_tsumogiri)
+        if should_call_win:
+            return RON, []
+
+        if OPEN_KAN in offer and self.player.should_call_kan(tile, True):
+            return OPEN_KAN, []
+
+        if PON not in offer and CHI not in offer:
+            return None
+
+        # only the previous player discard can be called as chi
+        meld, tile_to_discard = self.player.try_to_call_meld(tile, relative_seat == 3)
+        if not meld:
+            return None
+
+        call_type = meld.type == Meld.CHI and CHI or PON
+        if call_type not in offer:
+            return None
+
+        self._meld_tile = tile
+        self._tile_to_discard = tile_to_discard
+
+        tiles = meld.tiles[:]
+        tiles.remove(tile)
+        return call_type, tiles
+
+    def choose_discard_after_call(self):
+        discarded_tile = self.player.discard_tile(self._tile_to_discard)
+        self.player.tiles.append(self._meld_tile)
+        return discarded_tile
+
+    def see_meld(self, meld):
+        who = self._relative_seat(meld.who)
+        # the same values as decoded from tenhou meld
+        meld = Meld(meld.type, meld.tiles[:], meld.opened, meld.called_tile, who, (meld.from_who - meld.who) % 4)
+        self.table.add_called_meld(who, meld)
+
+    def see_riichi(self, seat, step):
+        if step == 1:
+            self.table.add_called_riichi(self._relative_seat(seat))
+
+    def see_dora_indicator(self, tile):
+        self.table.add_dora_indicator(tile)
+
+    def see_round_result(self, result, is_last):
+        if is_last:
+            self.table.set_players_scores(self._rotated_scores(self.engine.scores), self._rotate(self.engine.uma))
+
+    def _relative_seat(self, seat):
+        return (seat - self.seat) % 4
+
+    def _absolute_seat(self, relative_seat):
+        return (relative_seat + self.seat) % 4
+
+    def _rotate(self, values):
+        return [values[self._absolute_seat(x)] for x in range(0, 4)]
+
+    def _rotated_scores(self, scores):
+        # table scores are in hundreds, as in tenhou tags
+        return [x // 100 for x in self._rotate(scores)]
+
+
+class RatesAgent(PlayerAgent):
+    """
+    Our AI that records its discard decisions with the round outcome to the RatesTable.
+    Rates are used to decide whether to push, so rounds where AI folded are not recorded
+    """
+    rates_table = None
+    # (shanten, tiles count, turn, count of waiting, riichi players) for decisions in the current round
+    _decisions = None
+    # AI went into defence in the current round
+    _is_folded = False
+
+    def __init__(self, rates_table, name='AI', params={}):
+        super().__init__(name, params)
+        self.rates_table = rates_table
+        self._decisions = []
+
+    def start_round(self, engine, tiles):
+        self._decisions = []
+        self._is_folded = False
+        super().start_round(engine, tiles)
+
+    def choose_draw_action(self, tile, can_tsumo):
+        # in riichi AI is not making decisions
+        is_decision = not can_tsumo and not self.player.in_riichi
+        turn, riichi_players = self._turn()
+
+        action = super().choose_draw_action(tile, can_tsumo)
+        if is_decision and action[0] == DISCARD:
+            self._add_decision(turn, riichi_players)
+        return action
+
+    def choose_discard_after_call(self):
+        turn, riichi_players = self._turn()
+        discarded_tile = super().choose_discard_after_call()
+        self._add_decision(turn, riichi_players)
+        return discarded_tile
+
+    def see_round_result(self, result, is_last):
+        super().see_round_result(result, is_last)
+
+        is_win = result['type'] == AGARI and result['who'] == self.seat
+        is_deal_in = result['type'] == AGARI and result['from_who'] == self.seat and not is_win
+        is_tenpai = is_win or (result['type'] == RYUUKYOKU and self.seat in result['tempai'])
+
+        # outcome of the folded round is not the outcome of pushing with the same hand,
+        # it would make deal-in rates lower than they are
+        if self._is_folded:
+            self._decisions = []
+
+        # hand reached tenpai after the decision if it was in tenpai after any later decision
+        for decision in reversed(self._decisions):
+            is_tenpai = is_tenpai or decision[0] == 0
+            self.rates_table.add(*decision, is_tenpai=is_tenpai, is_win=is_win, is_deal_in=is_deal_in)
+
+        self.rates_table.count_of_hands += 1
+        self._decisions = []
+        self._is_folded = False
+
+    def _turn(self):
+        """
+        :return: count of our discards and count of other players in riichi before the decision
+        """
+        return len(self.player.discards), len([x for x in self.table.players[1:] if x.in_riichi])
+
+    def _add_decision(self, turn, riichi_players):
+        ai = self.player.ai
+        self._is_folded = self._is_folded or ai.in_defence
+        self._decisions.append((ai.previous_shanten, ai.wanted_tiles_count, turn, len(ai.waiting), riichi_players))
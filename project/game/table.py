@@ -33,6 +33,9 @@ class Table(object):
     has_open_tanyao = False
     has_aka_dora = False
 
+    # utils.latency.LatencyStats, AI decisions are measured only when it is set
+    latency = None
+
     def __init__(self, params={}):
         self._init_players(params)
         self.dora_indicators = []
@@ -62,6 +65,7 @@ class Table(object):
         for player in self.players:
             player.erase_state()
             player.dealer_seat = dealer_seat
+        self.player.ai.table_changed()
 
         # 136 - total count of tiles
         # 14 - tiles in dead wall
@@ -86,6 +90,7 @@ class Table(object):
             self.count_of_remaining_tiles -= 1
 
         self.get_player(player_seat).add_called_meld(meld)
+        self.player.ai.see_meld(player_seat, meld)
 
         tiles = meld.tiles[:]
         # called tile was already added to revealed array
@@ -117,6 +122,7 @@ class Table(object):
 
         tile = Tile(tile, is_tsumogiri)
         self.get_player(player_seat).add_discarded_tile(tile)
+        self.player.ai.see_discard(player_seat, tile.value)
 
         # cache already revealed tiles
         self._add_revealed_tile(tile.value)
@@ -124,6 +130,7 @@ class Table(object):
     def add_dora_indicator(self, tile):
         self.dora_indicators.append(tile)
         self._add_revealed_tile(tile)
+        self.player.ai.see_dora_indicator(tile)
 
     def is_dora(self, tile):
         return plus_dora(tile, self.dora_indicators) or is_aka_dora(tile, self.has_open_tanyao)
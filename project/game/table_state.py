@@ -0,0 +1,358 @@
+# -*- coding: utf-8 -*-
+"""
+Compact snapshot of the table.
+
+All table values are stored in one array of integers with fixed offsets,
+so a copy of the state is one memory copy, and it can be sent to other processes as bytes.
+Deltas are the same as Table methods, so the state can be moved forward without the Table.
+AI state (strategy, cached outs and etc.) is not included.
+"""
+from array import array
+
+from mahjong.meld import Meld
+from mahjong.tile import Tile
+
+from game.table import Table
+
+EMPTY = -1
+# player scores are None before the first round
+EMPTY_SCORES = -32768
+
+# our hand with tiles from melds
+MAX_HAND_TILES = 18
+MAX_DISCARDS = 32
+MAX_MELDS = 4
+MAX_DORA_INDICATORS = 5
+
+# discarded tile with this flag was tsumogiri
+TSUMOGIRI_FLAG = 0x100
+
+MELD_TYPES = [Meld.CHI, Meld.PON, Meld.KAN, Meld.CHANKAN, Meld.NUKI]
+# type, four tiles, called tile, flags
+MELD_SIZE = 7
+MELD_OPENED_FLAG = 0x1
+
+# flags in the safe tiles of enemies
+SAFE_FLAG = 0x1
+TEMPORARY_SAFE_FLAG = 0x2
+
+# offsets
+ROUND_NUMBER = 0
+HONBA_STICKS = 1
+RIICHI_STICKS = 2
+DEALER_SEAT = 3
+REMAINING_TILES = 4
+RULES = 5
+SCORES = 6
+IN_RIICHI = 10
+FIRST_SEATS = 14
+HAND_SIZE = 18
+DISCARDS_SIZES = 19
+MELDS_SIZES = 23
+DORA_INDICATORS_SIZE = 27
+REVEALED_TILES = 28
+DORA_INDICATORS = REVEALED_TILES + 34
+HAND = DORA_INDICATORS + MAX_DORA_INDICATORS
+DISCARDS = HAND + MAX_HAND_TILES
+MELDS = DISCARDS + 4 * MAX_DISCARDS
+SAFE_TILES = MELDS + 4 * MAX_MELDS * MELD_SIZE
+STATE_SIZE = SAFE_TILES + 3 * 34
+
+AKA_DORA_RULE = 0x1
+OPEN_TANYAO_RULE = 0x2
+
+
+class TableState(object):
+    """
+    Seats are the same as in the Table, our player is sitting on the zero seat
+    """
+    __slots__ = ['data']
+
+    def __init__(self, data=None):
+        """
+        :param data: array to use without copy
+        """
+        self.data = data if data is not None else array('h', [0] * STATE_SIZE)
+
+    def __eq__(self, other):
+        return isinstance(other, TableState) and self.data == other.data
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def copy(self):
+        return TableState(self.data[:])
+
+    def to_bytes(self):
+        return self.data.tobytes()
+
+    @staticmethod
+    def from_bytes(value):
+        data = array('h')
+        data.frombytes(value)
+        return TableState(data)
+
+    @staticmethod
+    def from_table(table):
+        state = TableState()
+        data = state.data
+
+        data[ROUND_NUMBER] = table.round_number
+        data[HONBA_STICKS] = table.count_of_honba_sticks
+        data[RIICHI_STICKS] = table.count_of_riichi_sticks
+        data[DEALER_SEAT] = table.dealer_seat
+        data[REMAINING_TILES] = table.count_of_remaining_tiles
+        data[RULES] = (table.has_aka_dora and AKA_DORA_RULE or 0) | (table.has_open_tanyao and OPEN_TANYAO_RULE or 0)
+        data[REVEALED_TILES:REVEALED_TILES + 34] = array('h', table.revealed_tiles)
+
+        for tile in table.dora_indicators:
+            state.add_dora_indicator(tile, is_revealed=False)
+
+        state._set_hand(table.player.tiles)
+
+        for seat, player in enumerate(table.players):
+            data[SCORES + seat] = EMPTY_SCORES if player.scores is None else int(player.scores // 100)
+            data[IN_RIICHI + seat] = player.in_riichi and 1 or 0
+            data[FIRST_SEATS + seat] = player.first_seat
+
+            for tile in player.discards:
+                state._append_discard(seat, tile.value, tile.is_tsumogiri)
+
+            for meld in player.melds:
+                state._append_meld(seat, meld)
+
+            if seat:
+                offset = SAFE_TILES + (seat - 1) * 34
+                for tile in player.safe_tiles:
+                    data[offset + tile] |= SAFE_FLAG
+                for tile in player.temporary_safe_tiles:
+                    data[offset + tile] |= TEMPORARY_SAFE_FLAG
+
+        return state
+
+    def to_table(self, table=None):
+        """
+        :param table: table to update, new table is created if it is not set
+        :return: Table
+        """
+        table = table or Table()
+        data = self.data
+
+        table.round_number = data[ROUND_NUMBER]
+        table.count_of_honba_sticks = data[HONBA_STICKS]
+        table.count_of_riichi_sticks = data[RIICHI_STICKS]
+        table.dealer_seat = data[DEALER_SEAT]
+        table.count_of_remaining_tiles = data[REMAINING_TILES]
+        table.has_aka_dora = bool(data[RULES] & AKA_DORA_RULE)
+        table.has_open_tanyao = bool(data[RULES] & OPEN_TANYAO_RULE)
+        table.revealed_tiles = self.revealed_tiles
+        table.dora_indicators = self.dora_indicators
+
+        for seat, player in enumerate(table.players):
+            player.dealer_seat = table.dealer_seat
+            player.scores = self.get_scores(seat)
+            player.in_riichi = self.is_riichi(seat)
+            player.first_seat = data[FIRST_SEATS + seat]
+            player.discards = [Tile(tile, is_tsumogiri) for tile, is_tsumogiri in self.get_discards(seat)]
+            player.melds = self.get_melds(seat)
+
+            if seat:
+                player.safe_tiles = self.get_safe_tiles(seat)
+                player.temporary_safe_tiles = self.get_safe_tiles(seat, TEMPORARY_SAFE_FLAG)
+
+        table.player.tiles = self.hand
+        table.recalculate_players_position()
+        table.player.ai.table_changed()
+        return table
+
+    @property
+    def round_number(self):
+        return self.data[ROUND_NUMBER]
+
+    @property
+    def dealer_seat(self):
+        return self.data[DEALER_SEAT]
+
+    @property
+    def count_of_remaining_tiles(self):
+        return self.data[REMAINING_TILES]
+
+    @property
+    def revealed_tiles(self):
+        """
+        :return: list of 34 counts
+        """
+        return self.data[REVEALED_TILES:REVEALED_TILES + 34].tolist()
+
+    @property
+    def dora_indicators(self):
+        return self.data[DORA_INDICATORS:DORA_INDICATORS + self.data[DORA_INDICATORS_SIZE]].tolist()
+
+    @property
+    def hand(self):
+        """
+        :return: our tiles in 136 format, with tiles from melds
+        """
+        return self.data[HAND:HAND + self.data[HAND_SIZE]].tolist()
+
+    def get_scores(self, seat):
+        scores = self.data[SCORES + seat]
+        return None if scores == EMPTY_SCORES else scores * 100
+
+    def is_riichi(self, seat):
+        return bool(self.data[IN_RIICHI + seat])
+
+    def get_discards(self, seat):
+        """
+        :return: list of (tile, is tsumogiri) pairs
+        """
+        offset = DISCARDS + seat * MAX_DISCARDS
+        values = self.data[offset:offset + self.data[DISCARDS_SIZES + seat]]
+        return [(x & ~TSUMOGIRI_FLAG, bool(x & TSUMOGIRI_FLAG)) for x in values]
+
+    def get_melds(self, seat):
+        melds = []
+        for index in range(0, self.data[MELDS_SIZES + seat]):
+            offset = MELDS + (seat * MAX_MELDS + index) * MELD_SIZE
+            values = self.data[offset:offset + MELD_SIZE]
+
+            meld = Meld()
+            meld.who = seat
+            meld.type = MELD_TYPES[values[0]]
+            meld.tiles = [x for x in values[1:5] if x != EMPTY]
+            meld.called_tile = None if values[5] == EMPTY else values[5]
+            meld.opened = bool(values[6] & MELD_OPENED_FLAG)
+            from_who = (values[6] >> 1) - 1
+            meld.from_who = None if from_who == EMPTY else from_who
+            melds.append(meld)
+        return melds
+
+    def get_safe_tiles(self, seat, flag=SAFE_FLAG):
+        """
+        :param seat: enemy seat, from 1 to 3
+        :return: list of tiles in 34 format
+        """
+        offset = SAFE_TILES + (seat - 1) * 34
+        return [x for x in range(0, 34) if self.data[offset + x] & flag]
+
+    def draw_tile(self, tile):
+        """
+        The same as Player.draw_tile, without AI
+        """
+        self._set_hand(sorted(self.hand + [tile]))
+
+    def discard_tile(self, tile, is_tsumogiri):
+        """
+        The same as Player.apply_discard
+        """
+        hand = self.hand
+        if tile in hand:
+            hand.remove(tile)
+            self._set_hand(hand)
+
+        self.add_discarded_tile(0, tile, is_tsumogiri)
+
+    def add_discarded_tile(self, seat, tile, is_tsumogiri):
+        """
+        The same as Table.add_discarded_tile
+        """
+        data = self.data
+        data[REMAINING_TILES] -= 1
+        tile_34 = tile // 4
+
+        # the same as in the table, the first tile is not added to discards
+        if tile:
+            self._append_discard(seat, tile, is_tsumogiri)
+
+            # discards after riichi are safe against riichi player
+            for enemy_seat in range(1, 4):
+                if data[IN_RIICHI + enemy_seat]:
+                    data[SAFE_TILES + (enemy_seat - 1) * 34 + tile_34] |= SAFE_FLAG
+
+        if seat:
+            offset = SAFE_TILES + (seat - 1) * 34
+            data[offset + tile_34] |= SAFE_FLAG
+
+            # temporary furiten is erased after the draw, and other enemies have it for this tile
+            for x in range(offset, offset + 34):
+                data[x] &= ~TEMPORARY_SAFE_FLAG
+
+            for enemy_seat in range(1, 4):
+                if enemy_seat != seat:
+                    data[SAFE_TILES + (enemy_seat - 1) * 34 + tile_34] |= TEMPORARY_SAFE_FLAG
+
+        self._add_revealed_tile(tile)
+
+    def add_called_meld(self, seat, meld):
+        """
+        The same as Table.add_called_meld
+        """
+        data = self.data
+        data[REMAINING_TILES] += 1
+        if meld.type == Meld.KAN or meld.type == Meld.CHANKAN:
+            data[REMAINING_TILES] -= 1
+
+        # our closed kan tiles are removed from the hand
+        if not seat and ((meld.type == Meld.KAN and not meld.opened) or meld.type == Meld.CHANKAN):
+            hand = self.hand
+            hand.remove(meld.called_tile)
+            self._set_hand(hand)
+
+        # pon is replaced by the chankan
+        if meld.type == Meld.CHANKAN:
+            melds = self.get_melds(seat)
+            tile_34 = meld.tiles[0] // 4
+            pon = [x for x in melds if x.type == Meld.PON and x.tiles[0] // 4 == tile_34][0]
+            melds.remove(pon)
+            data[MELDS_SIZES + seat] = 0
+            for item in melds:
+                self._append_meld(seat, item)
+
+        self._append_meld(seat, meld)
+
+        tiles = meld.tiles[:]
+        if meld.called_tile:
+            tiles.remove(meld.called_tile)
+
+        if meld.type == Meld.CHANKAN:
+            tiles = [meld.tiles[0]]
+
+        for tile in tiles:
+            self._add_revealed_tile(tile)
+
+    def add_called_riichi(self, seat):
+        self.data[IN_RIICHI + seat] = 1
+
+    def add_dora_indicator(self, tile, is_revealed=True):
+        size = self.data[DORA_INDICATORS_SIZE]
+        self.data[DORA_INDICATORS + size] = tile
+        self.data[DORA_INDICATORS_SIZE] = size + 1
+        if is_revealed:
+            self._add_revealed_tile(tile)
+
+    def _add_revealed_tile(self, tile):
+        if tile:
+            self.data[REVEALED_TILES + tile // 4] += 1
+
+    def _set_hand(self, tiles):
+        # the rest of the hand is erased, so equal states have equal arrays
+        self.data[HAND:HAND + MAX_HAND_TILES] = array('h', tiles + [0] * (MAX_HAND_TILES - len(tiles)))
+        self.data[HAND_SIZE] = len(tiles)
+
+    def _append_discard(self, seat, tile, is_tsumogiri):
+        size = self.data[DISCARDS_SIZES + seat]
+        self.data[DISCARDS + seat * MAX_DISCARDS + size] = tile | (is_tsumogiri and TSUMOGIRI_FLAG or 0)
+        self.data[DISCARDS_SIZES + seat] = size + 1
+
+    def _append_meld(self, seat, meld):
+        size = self.data[MELDS_SIZES + seat]
+        offset = MELDS + (seat * MAX_MELDS + size) * MELD_SIZE
+
+        tiles = meld.tiles + [EMPTY] * (4 - len(meld.tiles))
+        from_who = EMPTY if meld.from_who is None else meld.from_who
+        values = [MELD_TYPES.index(meld.type)] + tiles + [
+            EMPTY if meld.called_tile is None else meld.called_tile,
+            (meld.opened and MELD_OPENED_FLAG or 0) | (from_who + 1) << 1
+        ]
+        self.data[offset:offset + MELD_SIZE] = array('h', values)
+        self.data[MELDS_SIZES + seat] = size + 1
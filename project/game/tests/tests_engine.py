@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+from mahjong.meld import Meld
+
+from game.engine import GameEngine, TsumogiriAgent, WallGenerator, DISCARD, CLOSED_KAN, PON, RYUUKYOKU
+
+
+class EngineTestCase(unittest.TestCase):
+
+    def test_play_game(self):
+        engine = GameEngine([TsumogiriAgent() for _ in range(0, 4)], seed=1, is_hanchan=False)
+        scores = engine.play_game()
+
+        self.assertEqual(sum(scores) + engine.count_of_riichi_sticks * 1000, 100000)
+        self.assertEqual(engine.invalid_actions, [0, 0, 0, 0])
+        self.assertTrue(len(engine.results) >= 4)
+        self.assertEqual(round(sum(engine.uma)), 0)
+
+    def test_same_game_from_the_same_seed(self):
+        first = GameEngine([TsumogiriAgent() for _ in range(0, 4)], seed=7, is_hanchan=False)
+        second = GameEngine([TsumogiriAgent() for _ in range(0, 4)], seed=7, is_hanchan=False)
+
+        self.assertEqual(first.play_game(), second.play_game())
+        self.assertEqual(first.results, second.results)
+        self.assertEqual(first.digest, second.digest)
+
+    def test_wall_generator(self):
+        generator = WallGenerator(7)
+
+        self.assertEqual(sorted(generator.generate(0)), list(range(0, 136)))
+        self.assertEqual(generator.generate(0), WallGenerator(7).generate(0))
+        self.assertNotEqual(generator.generate(0), generator.generate(1))
+        self.assertNotEqual(generator.generate(0), WallGenerator(8).generate(0))
+
+    def test_invalid_actions(self):
+        agent = InvalidAgent()
+        engine = GameEngine([agent] + [TsumogiriAgent() for _ in range(0, 3)], seed=3, is_hanchan=False)
+        engine.play_game()
+
+        # all invalid discards were replaced by tsumogiri
+        self.assertTrue(engine.invalid_actions[0] > 0)
+        self.assertEqual(engine.invalid_actions[1:], [0, 0, 0])
+        self.assertTrue(all([x['type'] == RYUUKYOKU or x['who'] != 0 for x in engine.results]))
+
+    def test_closed_kan(self):
+        agent = KanAgent()
+        engine = GameEngine([agent] + [TsumogiriAgent() for _ in range(0, 3)], seed=5, is_hanchan=False)
+        engine.play_game()
+
+        self.assertEqual(engine.invalid_actions, [0, 0, 0, 0])
+        self.assertTrue(agent.kans > 0)
+        # new dora indicator for each kan
+        self.assertEqual(agent.dora_indicators, agent.kans)
+
+
+class InvalidAgent(TsumogiriAgent):
+
+    def choose_draw_action(self, tile, can_tsumo):
+        # riichi with not tempai hand and discard of not existing tile
+        return DISCARD, (tile + 1) % 136, True
+
+    def see_discard(self, seat, tile, is_tsumogiri, offer):
+        if offer:
+            return PON, []
+        return None
+
+
+class KanAgent(TsumogiriAgent):
+    engine = None
+    kans = 0
+    dora_indicators = 0
+
+    def start_game(self, engine):
+        self.engine = engine
+
+    def choose_draw_action(self, tile, can_tsumo):
+        hand = self.engine.hands[self.seat]
+        if self.engine.wall and self.engine.count_of_kans < 4:
+            same_tiles = [x for x in hand if x // 4 == tile // 4]
+            if len(same_tiles) == 4:
+                return CLOSED_KAN, tile, False
+
+        return super().choose_draw_action(tile, can_tsumo)
+
+    def see_meld(self, meld):
+        if meld.who == self.seat and meld.type == Meld.KAN:
+            self.kans += 1
+
+    def see_dora_indicator(self, tile):
+        self.dora_indicators += 1
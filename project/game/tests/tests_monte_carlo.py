@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+from mahjong.tests_mixin import TestMixin
+
+from game.ai import monte_carlo
+from game.ai.monte_carlo import MonteCarloEvaluator, shutdown_executors
+from game.table import Table
+from utils.settings_handler import settings
+
+
+class MonteCarloTestCase(unittest.TestCase, TestMixin):
+
+    def _evaluate(self, evaluator, hand, discards, seed=None):
+        tiles_34 = self._to_34_array(hand)
+        remaining_tiles = [4 - x for x in tiles_34]
+        return evaluator.evaluate(tiles_34, [], remaining_tiles, discards, 15, seed)
+
+    def test_evaluate(self):
+        hand = self._string_to_136_array(man='123456789', pin='119', sou='23')
+        nine_pin = self._string_to_34_tile(pin='9')
+        one_pin = self._string_to_34_tile(pin='1')
+
+        evaluator = MonteCarloEvaluator(200)
+        rates = self._evaluate(evaluator, hand, [nine_pin, one_pin])
+
+        tenpai_rate, agari_rate, count = rates[nine_pin]
+        self.assertEqual(tenpai_rate, 1)
+        self.assertEqual(count, 200)
+        self.assertTrue(agari_rate > rates[one_pin][1])
+        self.assertTrue(rates[one_pin][0] < 1)
+
+        # samples depend only on the seed
+        self.assertEqual(self._evaluate(evaluator, hand, [nine_pin, one_pin]), rates)
+        self.assertNotEqual(self._evaluate(evaluator, hand, [nine_pin, one_pin], seed=1), rates)
+
+    def test_time_budget(self):
+        hand = self._string_to_136_array(man='159', pin='1479', sou='258', honors='1234')
+        evaluator = MonteCarloEvaluator(100000, time_budget=0.01)
+        rates = self._evaluate(evaluator, hand, [self._string_to_34_tile(honors='1')])
+
+        count = list(rates.values())[0][2]
+        self.assertTrue(0 < count < 100000)
+
+    def test_workers(self):
+        hand = self._string_to_136_array(man='123456789', pin='119', sou='23')
+        nine_pin = self._string_to_34_tile(pin='9')
+
+        evaluator = MonteCarloEvaluator(100, workers=2)
+        other_evaluator = MonteCarloEvaluator(100, workers=2)
+        try:
+            rates = self._evaluate(evaluator, hand, [nine_pin])
+            other_rates = self._evaluate(other_evaluator, hand, [nine_pin])
+            # the pool is shared by evaluators
+            self.assertEqual(len(monte_carlo._executors), 1)
+        finally:
+            shutdown_executors()
+
+        self.assertEqual(rates[nine_pin][0], 1)
+        self.assertEqual(rates[nine_pin][2], 100)
+        self.assertEqual(other_rates, rates)
+        self.assertEqual(monte_carlo._executors, {})
+
+    def test_discard_with_rollouts(self):
+        with settings.override({'MONTE_CARLO_ROLLOUTS': 100, 'MONTE_CARLO_TIME_BUDGET': None}):
+            table = Table()
+        self.assertIsNotNone(table.player.ai.monte_carlo)
+
+        table.count_of_remaining_tiles = 60
+        table.player.init_hand(self._string_to_136_array(man='123456789', pin='119', sou='2'))
+        table.player.draw_tile(self._string_to_136_tile(sou='3'))
+
+        discarded_tile = table.player.discard_tile()
+        self.assertEqual(self._to_string([discarded_tile]), '9p')
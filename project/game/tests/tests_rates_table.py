@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+import os
+import tempfile
+import unittest
+
+from game.ai.rates_table import RatesTable, MIN_DECISIONS, load_rates_table
+from game.engine import AGARI
+from game.self_play import RatesAgent
+from simulator import build_rates_table, generate_seeds
+
+
+class RatesTableTestCase(unittest.TestCase):
+
+    def test_add_and_get(self):
+        rates_table = RatesTable()
+        for i in range(0, MIN_DECISIONS - 1):
+            rates_table.add(1, 12, 4, 3, 0, is_tenpai=i % 2, is_win=i % 3 == 0, is_deal_in=False)
+        self.assertEqual(rates_table.get(1, 12, 4, 3, 0), None)
+
+        rates_table.add(1, 12, 4, 3, 0, is_tenpai=True, is_win=False, is_deal_in=True)
+        count, tenpai_rate, win_rate, deal_in_rate = rates_table.get(1, 12, 4, 3, 0)
+        self.assertEqual(count, MIN_DECISIONS)
+        self.assertEqual(tenpai_rate, 15 / MIN_DECISIONS)
+        self.assertEqual(win_rate, 10 / MIN_DECISIONS)
+        self.assertEqual(deal_in_rate, 1 / MIN_DECISIONS)
+
+        # shanten, tiles count and turns are limited, wait shape is one kind of tiles or more
+        self.assertEqual(rates_table.get(1, 12, 4, 2, 0), rates_table.get(1, 12, 4, 3, 0))
+        self.assertEqual(rates_table.get(1, 12, 4, 1, 0), None)
+        rates_table.add(7, 100, 30, 5, 3, is_tenpai=False, is_win=False, is_deal_in=False)
+        self.assertEqual(rates_table.counters[-4], 1)
+
+    def test_save_and_load(self):
+        rates_table = RatesTable(count_of_hands=2)
+        for _ in range(0, MIN_DECISIONS):
+            rates_table.add(0, 4, 10, 1, 2, is_tenpai=True, is_win=True, is_deal_in=False)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'rates.bin')
+            rates_table.save(path)
+
+            loaded = load_rates_table(path)
+            self.assertEqual(loaded.counters, rates_table.counters)
+            self.assertEqual(loaded.count_of_hands, 2)
+            self.assertEqual(loaded.get(0, 4, 10, 1, 2), (MIN_DECISIONS, 1, 1, 0))
+            # table is loaded once for all players
+            self.assertIs(load_rates_table(path), loaded)
+
+            with open(path, 'wb') as f:
+                f.write(b'broken table')
+            self.assertEqual(load_rates_table(path + '.missing'), None)
+            with self.assertRaises(ValueError):
+                RatesTable.from_file(path)
+
+    def test_build_rates_table(self):
+        rates_table, errors = build_rates_table(generate_seeds(1, 3), {}, is_hanchan=False, progress_step=0)
+
+        self.assertEqual(errors, [])
+        self.assertTrue(rates_table.count_of_hands > 0)
+        self.assertEqual(rates_table.count_of_hands % 4, 0)
+
+        counters = rates_table.counters
+        self.assertTrue(sum(counters[0::4]) > rates_table.count_of_hands)
+        self.assertTrue(sum(counters[2::4]) > 0)
+        for index in range(0, len(counters), 4):
+            count, tenpai, wins, deal_ins = counters[index:index + 4]
+            self.assertTrue(tenpai <= count and wins <= tenpai and deal_ins <= count)
+
+    def test_folded_rounds_are_not_recorded(self):
+        agent = RatesAgent(RatesTable())
+        agent.seat = 0
+        ai = agent.player.ai
+        ai.previous_shanten = 1
+        ai.wanted_tiles_count = 12
+        deal_in = {'type': AGARI, 'who': 1, 'from_who': 0}
+        draw = {'type': AGARI, 'who': 1, 'from_who': 2}
+
+        # we pushed and dealt in
+        for _ in range(0, MIN_DECISIONS):
+            agent._add_decision(4, 1)
+            agent.see_round_result(deal_in, False)
+
+        # the same hands, but we folded after the decision
+        for _ in range(0, MIN_DECISIONS):
+            agent._add_decision(4, 1)
+            ai.in_defence = True
+            agent._add_decision(5, 1)
+            agent.see_round_result(draw, False)
+            ai.in_defence = False
+
+        self.assertEqual(agent.rates_table.get(1, 12, 4, 0, 1), (MIN_DECISIONS, 0, 0, 1))
+        self.assertEqual(agent.rates_table.count_of_hands, MIN_DECISIONS * 2)
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+import io
+import unittest
+from contextlib import redirect_stdout
+
+from game.engine import GameEngine, TsumogiriAgent
+from game.self_play import PlayerAgent
+from simulator import generate_seeds, play_games, replay_game
+
+
+class SelfPlayTestCase(unittest.TestCase):
+
+    def test_table_state(self):
+        agent = PlayerAgent()
+        agents = [TsumogiriAgent(), agent, TsumogiriAgent(), TsumogiriAgent()]
+        engine = GameEngine(agents, seed=2, is_hanchan=False)
+
+        with redirect_stdout(io.StringIO()):
+            engine.play_game()
+
+        self.assertEqual(engine.invalid_actions, [0, 0, 0, 0])
+
+        table = agent.table
+        # table of the agent is rotated, as in tenhou
+        for seat in range(0, 4):
+            player = table.get_player((seat - agent.seat) % 4)
+            # table skips the first tile of 1m, it is the same with tenhou client
+            self.assertEqual([x.value for x in player.discards], [x for x in engine.discards[seat] if x])
+            self.assertEqual(player.scores, engine.scores[seat])
+            self.assertEqual(player.uma, engine.uma[seat])
+            self.assertEqual(player.name, agents[seat].name)
+
+        self.assertEqual(table.dora_indicators, engine.dora_indicators)
+
+    def test_play_games(self):
+        seeds = generate_seeds(2, 42)
+        games, errors = play_games(seeds, 2, {}, is_hanchan=False, progress_step=0)
+
+        self.assertEqual(errors, [])
+        self.assertEqual([x['seed'] for x in games], seeds)
+        for result in games:
+            self.assertEqual(sorted(result['players']), ['AI', 'AI', 'Tsumogiri', 'Tsumogiri'])
+            self.assertEqual(sorted(result['places']), [1, 2, 3, 4])
+
+    def test_replay_game(self):
+        seed = generate_seeds(1, 1)[0]
+        games, errors = play_games([seed], 1, {}, is_hanchan=False, progress_step=0)
+
+        result, stats = replay_game(seed, 1, {}, False)
+        self.assertEqual(result['digest'], games[0]['digest'])
+        self.assertEqual(result['scores'], games[0]['scores'])
+        self.assertTrue(len(stats) > 0)
+
+        # other seed gives other game
+        result, stats = replay_game(seed + 1, 1, {}, False)
+        self.assertNotEqual(result['digest'], games[0]['digest'])
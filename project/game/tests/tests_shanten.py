@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from mahjong.shanten import Shanten
+from mahjong.tests_mixin import TestMixin
+from mahjong.tile import TilesConverter
+
+from game.ai.first_version.main import ImplementationAI
+from game.ai.shanten import IncrementalShanten, decompose_suit, unpack_suit
+from game.ai.shanten_table import SuitShantenTable, build_table, load_table
+from game.table import Table
+
+
+def calculate_outs_brute_force(ai, tiles, closed_hand, open_sets_34=None):
+    """
+    Previous version of ImplementationAI.calculate_outs,
+    it calculates shanten with the library for each discard and each draw
+    """
+    shanten_calculator = Shanten()
+    tiles_34 = TilesConverter.to_34_array(tiles)
+    closed_tiles_34 = TilesConverter.to_34_array(closed_hand)
+    is_agari = ai.agari.is_agari(tiles_34, ai.player.open_hand_34_tiles)
+
+    results = []
+    for hand_tile in range(0, 34):
+        if not closed_tiles_34[hand_tile]:
+            continue
+
+        tiles_34[hand_tile] -= 1
+
+        shanten = shanten_calculator.calculate_shanten(tiles_34, open_sets_34)
+
+        waiting = []
+        for j in range(0, 34):
+            if hand_tile == j or tiles_34[j] == 4:
+                continue
+
+            tiles_34[j] += 1
+            if shanten_calculator.calculate_shanten(tiles_34, open_sets_34) == shanten - 1:
+                waiting.append(j)
+            tiles_34[j] -= 1
+
+        tiles_34[hand_tile] += 1
+
+        if waiting:
+            results.append((hand_tile, shanten, waiting, ai.count_tiles(waiting, tiles_34)))
+
+    if is_agari:
+        shanten = Shanten.AGARI_STATE
+    else:
+        shanten = shanten_calculator.calculate_shanten(tiles_34, open_sets_34)
+
+    return results, shanten
+
+
+class IncrementalShantenTestCase(unittest.TestCase, TestMixin):
+
+    def setUp(self):
+        self.random = random.Random(20170415)
+
+    def test_suit_decompositions(self):
+        # 123 456 789
+        self.assertIn((3, 0, 0), decompose_suit([1, 1, 1, 1, 1, 1, 1, 1, 1]))
+        # 11 23
+        self.assertIn((0, 1, 1), decompose_suit([2, 1, 1, 0, 0, 0, 0, 0, 0]))
+        self.assertEqual(decompose_suit([0] * 9), ((0, 0, 0),))
+
+    def test_calculate_shanten(self):
+        shanten = IncrementalShanten()
+
+        tiles = self._string_to_34_array(sou='111234567', pin='11', man='567')
+        self.assertEqual(shanten.calculate_shanten(tiles), Shanten.AGARI_STATE)
+
+        tiles = self._string_to_34_array(sou='111345677', pin='11', man='567')
+        self.assertEqual(shanten.calculate_shanten(tiles), 0)
+
+        tiles = self._string_to_34_array(sou='11223344556677')
+        self.assertEqual(shanten.calculate_shanten(tiles), Shanten.AGARI_STATE)
+
+        tiles = self._string_to_34_array(sou='19', pin='19', man='19', honors='1234567')
+        self.assertEqual(shanten.calculate_shanten(tiles), 0)
+
+        tiles = self._string_to_34_array(sou='111345677', pin='11', man='567')
+        self.assertEqual(shanten.calculate_shanten(tiles, [self._string_to_open_34_set(sou='111')]), 0)
+
+    def test_incremental_changes(self):
+        shanten = IncrementalShanten()
+        shanten.set_hand(self._string_to_34_array(sou='111345678', pin='11', man='56'))
+        self.assertEqual(shanten.shanten(), 0)
+
+        shanten.add_tile(self._string_to_34_tile(man='7'))
+        self.assertEqual(shanten.shanten(), Shanten.AGARI_STATE)
+
+        shanten.remove_tile(self._string_to_34_tile(sou='1'))
+        self.assertEqual(shanten.shanten(), 0)
+        self.assertEqual(shanten.find_waiting(0), [self._string_to_34_tile(pin='1'),
+                                                   self._string_to_34_tile(sou='1')])
+
+    def test_shanten_parity_with_library(self):
+        library = Shanten()
+        shanten = IncrementalShanten()
+
+        for _ in range(0, 3000):
+            tiles_34, open_sets_34 = self._random_hand()
+            self.assertEqual(shanten.calculate_shanten(tiles_34, open_sets_34),
+                             library.calculate_shanten(tiles_34, open_sets_34),
+                             '{} {}'.format(tiles_34, open_sets_34))
+
+    def test_calculate_outs_parity_for_random_hands(self):
+        table = Table()
+        ai = table.player.ai
+
+        for _ in range(0, 150):
+            tiles_34, open_sets_34 = self._random_hand(sizes=[14])
+            tiles = TilesConverter.to_136_array(tiles_34)
+            self._assert_outs_are_equal(ai, tiles, tiles, open_sets_34)
+
+    def test_calculate_outs_parity_for_test_suite_hands(self):
+        """
+        Run AI and client tests and compare each calculate_outs call with the brute force version
+        """
+        calls = []
+        calculate_outs = ImplementationAI.calculate_outs
+
+        def checked_calculate_outs(ai, tiles, closed_hand, open_sets_34=None):
+            result = calculate_outs(ai, tiles, closed_hand, open_sets_34)
+            expected = calculate_outs_brute_force(ai, tiles, closed_hand, open_sets_34)
+            calls.append((self._outs_to_tuples(result), expected))
+            return result
+
+        suite = unittest.defaultTestLoader.loadTestsFromNames([
+            'game.ai.first_version.tests.tests_ai',
+            'game.ai.first_version.tests.tests_defence',
+            'game.ai.first_version.tests.tests_discards',
+            'game.ai.first_version.tests.tests_riichi',
+            'game.ai.first_version.tests.tests_strategies',
+            'tenhou.tests.tests_client',
+        ])
+
+        ImplementationAI.calculate_outs = checked_calculate_outs
+        try:
+            suite.run(unittest.TestResult())
+        finally:
+            ImplementationAI.calculate_outs = calculate_outs
+
+        self.assertTrue(len(calls) > 0)
+        for result, expected in calls:
+            self.assertEqual(result, expected)
+
+    def test_precomputed_table(self):
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'suit_shanten.bin')
+        try:
+            # small table to keep test fast, bigger suits will be calculated on demand
+            build_table(path, max_tiles=8)
+
+            table = SuitShantenTable(path)
+            for key in range(0, 5 ** 9, 101):
+                counts = unpack_suit(key)
+                if sum(counts) <= 10:
+                    self.assertEqual(table.get(key), decompose_suit(counts))
+
+            library = Shanten()
+            shanten = IncrementalShanten(table.get)
+            for _ in range(0, 500):
+                tiles_34, open_sets_34 = self._random_hand()
+                self.assertEqual(shanten.calculate_shanten(tiles_34, open_sets_34),
+                                 library.calculate_shanten(tiles_34, open_sets_34))
+            table.close()
+        finally:
+            shutil.rmtree(directory)
+
+    def test_missing_table(self):
+        self.assertIsNone(load_table('/not/existing/suit_shanten.bin'))
+
+    def _assert_outs_are_equal(self, ai, tiles, closed_hand, open_sets_34):
+        result = self._outs_to_tuples(ai.calculate_outs(tiles, closed_hand, open_sets_34))
+        expected = calculate_outs_brute_force(ai, tiles, closed_hand, open_sets_34)
+        self.assertEqual(result, expected)
+
+    def _outs_to_tuples(self, outs):
+        results, shanten = outs
+        # waiting can be sorted later by the AI, so we need a copy
+        return [(x.tile_to_discard, x.shanten, x.waiting[:], x.tiles_count) for x in results], shanten
+
+    def _random_hand(self, sizes=None):
+        """
+        Random hand with possible open sets and 4 same tiles
+        """
+        sizes = sizes or [1, 2, 4, 5, 7, 8, 10, 11, 13, 14]
+        while True:
+            tiles_34 = [0] * 34
+            open_sets_34 = []
+
+            if self.random.random() < 0.3:
+                for _ in range(0, self.random.randint(1, 3)):
+                    if self.random.random() < 0.5:
+                        open_sets_34.append([self.random.randrange(0, 34)] * 3)
+                    else:
+                        first_tile = self.random.randrange(0, 3) * 9 + self.random.randrange(0, 7)
+                        open_sets_34.append([first_tile, first_tile + 1, first_tile + 2])
+
+                for meld in open_sets_34:
+                    for tile in meld:
+                        tiles_34[tile] += 1
+
+            # one suit hands have much more complicated shapes
+            suits = None
+            if self.random.random() < 0.3:
+                suits = [self.random.randrange(0, 4)]
+
+            size = self.random.choice(sizes)
+            while sum(tiles_34) < size:
+                tile = self.random.randrange(0, 34)
+                if suits and tile // 9 not in suits:
+                    continue
+                tiles_34[tile] += 1
+
+            if max(tiles_34) <= 4 and sum(tiles_34) == size:
+                return tiles_34, open_sets_34
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+import io
+import unittest
+from contextlib import redirect_stdout
+
+from mahjong.meld import Meld
+from mahjong.tests_mixin import TestMixin
+
+from game.engine import GameEngine, TsumogiriAgent
+from game.self_play import PlayerAgent
+from game.table import Table
+from game.table_state import TableState, TEMPORARY_SAFE_FLAG
+
+
+class TableStateTestCase(unittest.TestCase, TestMixin):
+
+    def test_from_table(self):
+        table = Table()
+        table.init_round(1, 2, 1, 0, 3, [250, 0, -12, 350])
+        table.player.init_hand(self._string_to_136_array(man='123456', pin='1199', sou='555'))
+
+        table.add_called_meld(1, self._make_meld(Meld.PON, honors='555'))
+        table.add_discarded_tile(1, 8, True)
+        table.add_called_riichi(2)
+        table.add_discarded_tile(2, 100, False)
+
+        state = TableState.from_table(table)
+
+        self.assertEqual(state.round_number, 1)
+        self.assertEqual(state.dealer_seat, 3)
+        self.assertEqual(state.count_of_remaining_tiles, table.count_of_remaining_tiles)
+        self.assertEqual(state.revealed_tiles, table.revealed_tiles)
+        self.assertEqual(state.dora_indicators, [0])
+        self.assertEqual(state.hand, table.player.tiles)
+        self.assertEqual([state.get_scores(x) for x in range(0, 4)], [25000, 0, -1200, 35000])
+        self.assertEqual(state.is_riichi(2), True)
+        self.assertEqual(state.get_discards(1), [(8, True)])
+        self.assertEqual(state.get_safe_tiles(2), [100 // 4])
+        self.assertEqual(state.get_safe_tiles(1, TEMPORARY_SAFE_FLAG), [100 // 4])
+
+        meld = state.get_melds(1)[0]
+        self.assertEqual(meld.type, Meld.PON)
+        self.assertEqual(meld.tiles, table.get_player(1).melds[0].tiles)
+        self.assertEqual(meld.called_tile, table.get_player(1).melds[0].called_tile)
+        self.assertEqual(meld.opened, True)
+
+    def test_deltas(self):
+        table = Table()
+        table.init_round(0, 0, 0, 20, 0, [250, 250, 250, 250])
+        table.player.init_hand(self._string_to_136_array(man='1111', pin='234567', sou='234'))
+        state = TableState.from_table(table)
+
+        # the same actions are applied to the table and to the state
+        tile = self._string_to_136_tile(honors='1')
+        table.player.draw_tile(tile)
+        state.draw_tile(tile)
+        table.player.apply_discard(tile)
+        state.discard_tile(tile, True)
+        self.assertEqual(TableState.from_table(table), state)
+
+        for seat, tile in [(1, 40), (2, 0), (3, 41)]:
+            table.add_discarded_tile(seat, tile, False)
+            state.add_discarded_tile(seat, tile, False)
+        self.assertEqual(TableState.from_table(table), state)
+
+        table.player.draw_tile(122)
+        state.draw_tile(122)
+        meld = self._make_meld(Meld.KAN, is_open=False, man='1111')
+        table.add_called_meld(0, meld)
+        state.add_called_meld(0, meld)
+        table.add_dora_indicator(33)
+        state.add_dora_indicator(33)
+        self.assertEqual(TableState.from_table(table), state)
+
+        meld = self._make_meld(Meld.PON, pin='999')
+        meld.from_who = 0
+        table.add_called_meld(1, meld)
+        state.add_called_meld(1, meld)
+        table.add_called_riichi(2)
+        state.add_called_riichi(2)
+        table.add_discarded_tile(1, 60, True)
+        state.add_discarded_tile(1, 60, True)
+        self.assertEqual(TableState.from_table(table), state)
+
+        meld = self._make_meld(Meld.CHANKAN, pin='9999')
+        table.add_called_meld(1, meld)
+        state.add_called_meld(1, meld)
+        self.assertEqual(TableState.from_table(table), state)
+        self.assertEqual(state.get_melds(1)[0].from_who, None)
+
+    def test_round_trip(self):
+        agent = PlayerAgent()
+        engine = GameEngine([TsumogiriAgent(), TsumogiriAgent(), agent, TsumogiriAgent()], seed=2, is_hanchan=False)
+        with redirect_stdout(io.StringIO()):
+            engine.play_game()
+
+        state = TableState.from_table(agent.table)
+        table = state.to_table()
+
+        self.assertEqual(TableState.from_table(table), state)
+        self.assertEqual(table.player.tiles, agent.player.tiles)
+        self.assertEqual(table.dora_indicators, agent.table.dora_indicators)
+        for seat in range(0, 4):
+            player = table.get_player(seat)
+            original = agent.table.get_player(seat)
+            self.assertEqual(player.scores, original.scores)
+            self.assertEqual(player.position, original.position)
+            self.assertEqual([(x.value, x.is_tsumogiri) for x in player.discards],
+                             [(x.value, x.is_tsumogiri) for x in original.discards])
+            self.assertEqual([x.tiles for x in player.melds], [x.tiles for x in original.melds])
+
+    def test_copy(self):
+        table = Table()
+        table.init_round(0, 0, 0, 20, 0, [250, 250, 250, 250])
+        state = TableState.from_table(table)
+
+        copied = state.copy()
+        copied.add_discarded_tile(1, 40, False)
+        self.assertNotEqual(copied, state)
+        self.assertEqual(state.get_discards(1), [])
+
+        self.assertEqual(TableState.from_bytes(copied.to_bytes()), copied)
@@ -1,15 +1,18 @@
+import io
 import logging
 import os
-import re
+from contextlib import redirect_stdout
+from multiprocessing import Pool
 from optparse import OptionParser
 
 import requests
-from mahjong.meld import Meld
 from mahjong.tile import TilesConverter
 
-from game.table import Table
 from tenhou.client import TenhouClient
 from tenhou.decoder import TenhouDecoder
+from tenhou.log_archive import open_archive
+from tenhou.log_events import LogReplayer, compile_log, compile_tag, replay_events
+from tenhou.log_parser import iter_rounds
 from utils.logger import set_up_logging
 
 from collections import defaultdict
@@ -23,7 +26,12 @@ class TenhouLogReproducer(object):
     The way to debug bot decisions that it made in real tenhou.net games
     """
 
-    def __init__(self, log_url, stop_tag=None, params={}):
+    def __init__(self, log_url, stop_tag=None, params={}, archive=None):
+        """
+        :param archive: LogArchive, if it is set logs will be loaded only from it, without network
+        """
+        self.archive = archive
+
         log_id, player_position, needed_round = self._parse_url(log_url)
         log_content = self._download_log_content(log_id)
         rounds = self._parse_rounds(log_content)
@@ -36,18 +44,8 @@ class TenhouLogReproducer(object):
         self.params = params
 
     def reproduce(self, dry_run=True, verbose=False):
-        draw_tags = ['T', 'U', 'V', 'W']
-        discard_tags = ['D', 'E', 'F', 'G']
-
-        player_draw = draw_tags[self.player_position]
-
-        player_draw_regex = re.compile('^<[{}]+\d*'.format(''.join(player_draw)))
-        discard_regex = re.compile('^<[{}]+\d*'.format(''.join(discard_tags)))
-
-        table = Table(self.params)
-
-        total = defaultdict(int)
-        results = defaultdict(int)
+        replayer = LogReplayer(self.player_position, self.params, verbose)
+        table = replayer.table
 
         for i,r in enumerate(self.rounds):
             print("Round:", i)
@@ -60,76 +58,10 @@ class TenhouLogReproducer(object):
                 if not dry_run and tag == self.stop_tag:
                     break
 
-                if 'INIT' in tag:
-                    values = self.decoder.parse_initial_values(tag)
-
-                    shifted_scores = []
-                    for x in range(0, 4):
-                        shifted_scores.append(values['scores'][self._normalize_position(x, self.player_position)])
-
-                    table.init_round(
-                        values['round_number'],
-                        values['count_of_honba_sticks'],
-                        values['count_of_riichi_sticks'],
-                        values['dora_indicator'],
-                        self._normalize_position(self.player_position, values['dealer']),
-                        shifted_scores,
-                    )
-
-                    hands = [
-                        [int(x) for x in self.decoder.get_attribute_content(tag, 'hai0').split(',')],
-                        [int(x) for x in self.decoder.get_attribute_content(tag, 'hai1').split(',')],
-                        [int(x) for x in self.decoder.get_attribute_content(tag, 'hai2').split(',')],
-                        [int(x) for x in self.decoder.get_attribute_content(tag, 'hai3').split(',')],
-                    ]
-
-                    table.player.init_hand(hands[self.player_position])
-
-                if player_draw_regex.match(tag) and 'UN' not in tag:
-                    tile = self.decoder.parse_tile(tag)
-                    table.player.draw_tile(tile)
-
-                if discard_regex.match(tag) and 'DORA' not in tag:
-                    tile = self.decoder.parse_tile(tag)
-                    player_sign = tag.upper()[1]
-                    player_seat = self._normalize_position(self.player_position, discard_tags.index(player_sign))
-
-                    if player_seat == 0:
-                        # TODO: add player's state, river, melds, and reach timepoint
-                        current_hand = TilesConverter.to_one_line_string(table.player.tiles)
-                        choice = table.player.ai.discard_tile(None)
-                        table.player.discard_tile(tile)
-                        match = int(tile == choice)
-                        total["TOTAL"] += 1
-                        results["TOTAL"] += match
-                        total[table.player.play_state] += 1
-                        results[table.player.play_state] += match
-                        if verbose:
-                            print("Hand:", current_hand)
-                            print("AI's Choice:", TilesConverter.to_one_line_string([choice]))
-                            print("MP's Choice:", TilesConverter.to_one_line_string(([tile])))
-                            print("AI's State:", table.player.play_state)
-                            print("Same:", tile == choice)
-                            print()
-                    else:
-                        table.add_discarded_tile(player_seat, tile, False)
-
-                if '<N who=' in tag:
-                    meld = self.decoder.parse_meld(tag)
-                    player_seat = self._normalize_position(self.player_position, meld.who)
-                    table.add_called_meld(player_seat, meld)
-
-                    if player_seat == 0:
-                        # we had to delete called tile from hand
-                        # to have correct tiles count in the hand
-                        if meld.type != Meld.KAN and meld.type != Meld.CHANKAN:
-                            table.player.draw_tile(meld.called_tile)
-
-                if '<REACH' in tag and 'step="1"' in tag:
-                    who_called_riichi = self._normalize_position(self.player_position,
-                                                                 self.decoder.parse_who_called_riichi(tag))
-                    table.add_called_riichi(who_called_riichi)
-                    # TODO: add reach time point
+                for event in compile_tag(tag, self.decoder):
+                    replayer.apply(event)
+
+        total, results = replayer.total, replayer.results
 
         if dry_run:
             print(total, results)
@@ -149,10 +81,6 @@ class TenhouLogReproducer(object):
 
             print('Discard: {}'.format(TilesConverter.to_one_line_string([tile])))
 
-    def _normalize_position(self, who, from_who):
-        positions = [0, 1, 2, 3]
-        return positions[who - from_who]
-
     def _parse_url(self, log_url):
         temp = log_url.split('?')[1].split('&')
         log_id, player, round_number = '', 0, 0
@@ -172,22 +100,7 @@ class TenhouLogReproducer(object):
         :param log_id:
         :return:
         """
-        temp_folder = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'logs')
-        if not os.path.exists(temp_folder):
-            os.mkdir(temp_folder)
-
-        log_file = os.path.join(temp_folder, log_id)
-        if os.path.exists(log_file):
-            with open(log_file, 'r') as f:
-                return f.read()
-        else:
-            url = 'http://e.mjv.jp/0/log/?{0}'.format(log_id)
-            response = requests.get(url)
-
-            with open(log_file, 'w') as f:
-                f.write(response.text)
-
-            return response.text
+        return load_log_content(log_id, self.archive)
 
     def _parse_rounds(self, log_content):
         """
@@ -195,41 +108,7 @@ class TenhouLogReproducer(object):
         :param log_content:
         :return:
         """
-        rounds = []
-
-        game_round = []
-        tag_start = 0
-        tag = None
-        for x in range(0, len(log_content)):
-            if log_content[x] == '>':
-                tag = log_content[tag_start:x + 1]
-                tag_start = x + 1
-
-            # not useful tags
-            if tag and ('mjloggm' in tag or 'TAIKYOKU' in tag):
-                tag = None
-
-            # new round was started
-            if tag and 'INIT' in tag:
-                rounds.append(game_round)
-                game_round = []
-
-            # the end of the game
-            if tag and 'owari' in tag:
-                rounds.append(game_round)
-
-            if tag:
-                # to save some memory we can remove not needed information from logs
-                if 'INIT' in tag:
-                    # we dont need seed information
-                    find = re.compile(r'shuffle="[^"]*"')
-                    tag = find.sub('', tag)
-
-                # add processed tag to the round
-                game_round.append(tag)
-                tag = None
-
-        return rounds[1:]
+        return list(iter_rounds(log_content))
 
 
 class SocketMock(object):
@@ -337,9 +216,171 @@ def parse_args_and_start_reproducer():
             client.end_game()
 
 
+def load_log_content(log_id, archive=None):
+    """
+    Check the log file, and if it is not there download it from tenhou.net
+    :param log_id:
+    :param archive: LogArchive, if it is set log will be loaded only from it
+    :return:
+    """
+    if archive is not None:
+        return archive.get(log_id)
+
+    temp_folder = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'logs')
+    if not os.path.exists(temp_folder):
+        os.mkdir(temp_folder)
+
+    log_file = os.path.join(temp_folder, log_id)
+    if os.path.exists(log_file):
+        with open(log_file, 'r') as f:
+            return f.read()
+    else:
+        url = 'http://e.mjv.jp/0/log/?{0}'.format(log_id)
+        response = requests.get(url)
+
+        with open(log_file, 'w') as f:
+            f.write(response.text)
+
+        return response.text
+
+
+def compile_log_task(args):
+    """
+    Load the log and compile it to the events.
+    It is module level function to be able to run it in the pool of processes
+    :param args: tuple of log id and path to the log archive
+    :return: tuple of log id, compiled events, error message
+    """
+    log_id, archive_path = args
+    try:
+        archive = open_archive(archive_path) if archive_path else None
+        return log_id, compile_log(load_log_content(log_id, archive)), None
+    except Exception as e:
+        return log_id, None, str(e)
+
+
+def replay_log(args):
+    """
+    Reproduce all our discards from one compiled log and compare them with the real player choices.
+    It is module level function to be able to run it in the pool of processes
+    :param args: tuple of log id, AI params and compiled events
+    :return: tuple of log id, total discards and same discards by play state, error message
+    """
+    log_id, params, events = args
+    try:
+        # AI prints a lot of debug info, it will be mixed between workers
+        with redirect_stdout(io.StringIO()):
+            total, results = replay_events(events, params=params)
+    except Exception as e:
+        return log_id, {}, {}, str(e)
+
+    return log_id, dict(total), dict(results), None
+
+
+def compile_logs(log_ids, workers=1, archive_path=None):
+    """
+    Logs are compiled once and can be replayed with different params
+    :param log_ids: list of tenhou log ids
+    :param workers: count of processes, one means run in the current process
+    :param archive_path: path to the log archive, logs will not be downloaded if it is set
+    :return: dict of log id -> compiled events, list of (log id, error) pairs
+    """
+    events = {}
+    errors = []
+    for log_id, log_events, error in run_tasks(compile_log_task, [(x, archive_path) for x in log_ids], workers):
+        if error:
+            errors.append((log_id, error))
+        else:
+            events[log_id] = log_events
+
+    return events, errors
+
+
+def replay_logs(log_ids, params, workers=1, progress_step=50, archive_path=None, events=None):
+    """
+    Replay logs in parallel and merge counters in the order of log ids,
+    so results don't depend on the count of workers
+    :param log_ids: list of tenhou log ids
+    :param params: AI params
+    :param workers: count of processes, one means run in the current process
+    :param progress_step: print progress after each N processed logs
+    :param archive_path: path to the log archive, logs will not be downloaded if it is set
+    :param events: dict of log id -> compiled events, logs will be compiled if it is not set
+    :return: tuple of merged total and same discards by play state, list of (log id, error) pairs
+    """
+    errors = []
+    if events is None:
+        events, errors = compile_logs(log_ids, workers, archive_path)
+
+    tasks = [(log_id, params, events[log_id]) for log_id in log_ids if log_id in events]
+
+    total_all = defaultdict(int)
+    results_all = defaultdict(int)
+    for i, (log_id, total, results, error) in enumerate(run_tasks(replay_log, tasks, workers)):
+        if error:
+            errors.append((log_id, error))
+
+        for k in total:
+            total_all[k] += total[k]
+            results_all[k] += results[k]
+
+        if progress_step and ((i + 1) % progress_step == 0 or i + 1 == len(tasks)):
+            print("Replayed: {}/{} logs, errors: {}".format(i + 1, len(tasks), len(errors)))
+
+    return total_all, results_all, errors
+
+
+def run_tasks(function, tasks, workers=1):
+    """
+    :param function: module level function to run in the pool of processes
+    :param tasks: list of function arguments
+    :param workers: count of processes, one means run in the current process
+    :return: generator of results in the order of tasks
+    """
+    if workers <= 1:
+        for task in tasks:
+            yield function(task)
+        return
+
+    pool = Pool(workers)
+    try:
+        # small chunks to keep workers busy on logs with different length
+        for result in pool.imap(function, tasks, chunksize=4):
+            yield result
+    finally:
+        pool.close()
+        pool.join()
+
+
 def main():
     #parse_args_and_start_reproducer()
 
+    parser = OptionParser()
+
+    parser.add_option('-w', '--workers',
+                      type='int',
+                      default=1,
+                      help='Count of processes to replay logs. Zero means count of CPUs')
+
+    parser.add_option('-f', '--logs_folder',
+                      type='string',
+                      default='full_logs',
+                      help='Folder with tenhou logs')
+
+    parser.add_option('-a', '--archive',
+                      type='string',
+                      default=None,
+                      help='Path to the log archive. If it is set, logs will be replayed from it without network')
+
+    parser.add_option('-n', '--limit',
+                      type='int',
+                      default=1000,
+                      help='How many logs to replay')
+
+    opts, _ = parser.parse_args()
+
+    workers = opts.workers or os.cpu_count()
+
     params_set = [
           {},
     #     {"force_honitsu":True},
@@ -348,29 +389,28 @@ def main():
 
     t0 = time.time()
 
+    # sorted to have the same logs in each run
+    if opts.archive:
+        log_ids = sorted(open_archive(opts.archive).log_ids)[:opts.limit]
+    else:
+        log_ids = [x[:-6] for x in sorted(os.listdir(opts.logs_folder))[:opts.limit]]  # total 2800
+
+    # logs are parsed once for all params
+    events, compile_errors = compile_logs(log_ids, workers, opts.archive)
+
     for params in params_set:
-        total_all = defaultdict(int)
-        results_all = defaultdict(int)
-        for log_id in os.listdir("full_logs")[:1000]: # total 2800
-            #print(l[:-6])
-            log_url = "https://tenhou.net/0/?log={}".format(log_id[:-6])
-            try:
-                total, results = TenhouLogReproducer(log_url, params=params).reproduce(True, False)
-                for k in total:
-                    total_all[k] += total[k]
-                    results_all[k] += results[k]
-            except Exception as e:
-                print("There is a bug:", e)
-                #raise e
+        total_all, results_all, errors = replay_logs(log_ids, params, workers, events=events)
+
+        for log_id, error in compile_errors + errors:
+            print("There is a bug:", log_id, error)
 
         print("\nPARAMS:", params)
         print("\nRESULTS:")
-        for k in total_all:
+        for k in sorted(total_all):
             print(k, ":", results_all[k]/total_all[k])
 
     print("Running time:", time.time()-t0)
 
 
-
 if __name__ == '__main__':
     main()
@@ -19,6 +19,55 @@ AI_PACKAGE = 'first_version'
 # class will be loaded automatically
 AI_CLASS = None
 
+# where to take suit decompositions for the shanten calculation:
+# "search" - calculate them on demand and cache in memory
+# "table" - read them from the precomputed table,
+# build it with "python -m game.ai.shanten_table --build"
+SHANTEN_BACKEND = 'search'
+# empty value means project/data/suit_shanten.bin
+SHANTEN_TABLE_PATH = ''
+# count of hands with cached discard options, 0 disables the cache
+OUTS_CACHE_SIZE = 128
+# count of cached hand values for our waits, 0 disables the cache
+HAND_VALUE_CACHE_SIZE = 256
+
+# Monte Carlo evaluation of discard options with the lowest shanten:
+# count of rollouts for each option, 0 disables it.
+# Rollouts are stopped after the time budget (seconds for one discard),
+# with more than one worker they are played in the pool of processes (shared by all bots of the process)
+MONTE_CARLO_ROLLOUTS = 0
+MONTE_CARLO_TIME_BUDGET = 0.5
+MONTE_CARLO_WORKERS = 1
+
+# tenpai, win and deal-in rates of our hands for the push or fold decision,
+# build them with "python simulator.py --build_rates -g 1000 -w 0".
+# Empty value means project/data/round_rates.bin, without the table hard-coded ratios are used
+RATES_TABLE_PATH = ''
+
+# (min, max) seconds before our answer to tenhou, to look like a human player.
+# Time spent on the decision is included, use (0, 0) to answer as soon as it is computed
+HUMAN_LIKE_DELAY = {
+    # discard after the draw or after the called meld
+    'discard': (0.5, 1.5),
+    # between riichi declaration and the riichi discard
+    'riichi': (1, 1),
+    # pon, chi, kan or win decision on other player's discard
+    'call': (0.5, 1.5),
+    # tenhou shows round results before the next round
+    'round_end': (7, 7),
+    # let tenhou to process the lobby change
+    'lobby': (2, 2),
+}
+
+# seconds from the tenhou message to our answer.
+# If AI is slower, we discard a safe tile (or tsumogiri) and skip calls,
+# to not lose the turn by timeout. None disables the deadline
+DECISION_TIMEOUT = 3
+
+# measure AI decisions latency and save it to the logs folder after each game,
+# summary for all games: python -m utils.latency
+LATENCY_STATS = False
+
 """
   Game type decoding:
 
@@ -51,6 +100,14 @@ AI_CLASS = None
 # GAME_TYPE = None
 GAME_TYPE = None
 
+# bots for "python supervisor.py", they are playing in one process.
+# Each session is a dict with settings that are changed only for this bot, for example:
+# SESSIONS = [
+#     {'USER_ID': 'IDXXXXXXXX-XXXXXXXX', 'LOBBY': '0', 'GAME_TYPE': '1'},
+#     {'USER_ID': 'IDYYYYYYYY-YYYYYYYY', 'LOBBY': '0', 'GAME_TYPE': '9'},
+# ]
+SESSIONS = []
+
 try:
     from settings_local import *
 except ImportError:
@@ -0,0 +1,325 @@
+# -*- coding: utf-8 -*-
+"""
+Endpoint to play games between our AI and other players without tenhou.
+It is used to compare AI versions by the average place:
+    python simulator.py -g 1000 -w 0 -p 4 -o results.jsonl
+
+Each game is played from its own seed, seeds are saved to the results file,
+so any game can be replayed with the same decisions and AI latency stats:
+    python simulator.py -r 1234567890 -o results.jsonl
+
+Tenpai, win and deal-in rates of AI decisions are collected from games to the table for the defence:
+    python simulator.py --build_rates -g 1000 -w 0
+"""
+import io
+import json
+import os
+import random
+import time
+from collections import defaultdict
+from contextlib import redirect_stdout
+from optparse import OptionParser
+
+from game.ai.rates_table import RatesTable
+from game.engine import GameEngine, TsumogiriAgent
+from game.self_play import PlayerAgent, RatesAgent
+from reproducer import run_tasks
+from utils.latency import LatencyStats
+
+
+def create_engine(seed, count_of_ai_players, params, is_hanchan):
+    """
+    Seats of players are selected from the game seed too
+    """
+    agents = [PlayerAgent('AI', params) for _ in range(0, count_of_ai_players)]
+    agents += [TsumogiriAgent() for _ in range(0, 4 - count_of_ai_players)]
+    random.Random(seed).shuffle(agents)
+
+    return GameEngine(agents, seed, is_hanchan=is_hanchan)
+
+
+def game_result(engine, count_of_ai_players, is_hanchan, seconds):
+    """
+    :return: dict for the results file
+    """
+    return {
+        'seed': engine.seed,
+        'ai_players': count_of_ai_players,
+        'is_hanchan': is_hanchan,
+        'players': [x.name for x in engine.agents],
+        'places': engine.get_places(),
+        'scores': engine.scores,
+        'uma': engine.uma,
+        'invalid_actions': sum(engine.invalid_actions),
+        'digest': engine.digest,
+        'seconds': seconds,
+    }
+
+
+def play_game_task(args):
+    """
+    Play one game.
+    It is module level function to be able to run it in the pool of processes
+    :param args: tuple of game seed, count of AI players, AI params and is hanchan flag
+    :return: tuple of game seed, game result, error message
+    """
+    seed, count_of_ai_players, params, is_hanchan = args
+
+    engine = create_engine(seed, count_of_ai_players, params, is_hanchan)
+    start = time.perf_counter()
+    try:
+        # AI prints a lot of debug info, it will be mixed between workers
+        with redirect_stdout(io.StringIO()):
+            engine.play_game()
+    except Exception as e:
+        return seed, None, str(e)
+
+    return seed, game_result(engine, count_of_ai_players, is_hanchan, time.perf_counter() - start), None
+
+
+def play_games(seeds, count_of_ai_players, params, workers=1, is_hanchan=True, progress_step=100):
+    """
+    :param seeds: seed for each game
+    :param workers: count of processes, one means run in the current process
+    :param progress_step: print progress after each N played games
+    :return: list of game results in the order of seeds, list of (seed, error) pairs
+    """
+    tasks = [(x, count_of_ai_players, params, is_hanchan) for x in seeds]
+
+    games = []
+    errors = []
+    for i, (seed, result, error) in enumerate(run_tasks(play_game_task, tasks, workers)):
+        if error:
+            errors.append((seed, error))
+        else:
+            games.append(result)
+
+        if progress_step and ((i + 1) % progress_step == 0 or i + 1 == len(tasks)):
+            print('Played: {}/{} games, errors: {}'.format(i + 1, len(tasks), len(errors)))
+
+    return games, errors
+
+
+def collect_rates_task(args):
+    """
+    Play one game between four AI players and record their decisions
+    :param args: tuple of game seed, AI params and is hanchan flag
+    :return: tuple of game seed, RatesTable, error message
+    """
+    seed, params, is_hanchan = args
+
+    rates_table = RatesTable()
+    engine = GameEngine([RatesAgent(rates_table, 'AI', params) for _ in range(0, 4)], seed, is_hanchan=is_hanchan)
+    try:
+        with redirect_stdout(io.StringIO()):
+            engine.play_game()
+    except Exception as e:
+        return seed, None, str(e)
+
+    return seed, rates_table, None
+
+
+def build_rates_table(seeds, params, workers=1, is_hanchan=True, progress_step=100):
+    """
+    :return: RatesTable from all games, list of (seed, error) pairs
+    """
+    tasks = [(x, params, is_hanchan) for x in seeds]
+
+    rates_table = RatesTable()
+    errors = []
+    for i, (seed, game_rates_table, error) in enumerate(run_tasks(collect_rates_task, tasks, workers)):
+        if error:
+            errors.append((seed, error))
+        else:
+            rates_table.merge(game_rates_table)
+
+        if progress_step and ((i + 1) % progress_step == 0 or i + 1 == len(tasks)):
+            print('Played: {}/{} games, errors: {}'.format(i + 1, len(tasks), len(errors)))
+
+    return rates_table, errors
+
+
+def generate_seeds(count_of_games, seed):
+    """
+    :param seed: seed for the list of game seeds
+    """
+    generator = random.Random(seed)
+    return [generator.getrandbits(64) for _ in range(0, count_of_games)]
+
+
+def replay_game(seed, count_of_ai_players, params, is_hanchan):
+    """
+    Play the game again with latency stats of AI decisions
+    :return: game result and LatencyStats
+    """
+    engine = create_engine(seed, count_of_ai_players, params, is_hanchan)
+
+    stats = LatencyStats()
+    for agent in engine.agents:
+        if isinstance(agent, PlayerAgent):
+            agent.table.latency = stats
+
+    start = time.perf_counter()
+    with redirect_stdout(io.StringIO()):
+        engine.play_game()
+
+    return game_result(engine, count_of_ai_players, is_hanchan, time.perf_counter() - start), stats
+
+
+def load_results(file_path):
+    """
+    :return: dict of seed -> game result
+    """
+    results = {}
+    with open(file_path, 'r') as f:
+        for line in f:
+            result = json.loads(line)
+            results[result['seed']] = result
+    return results
+
+
+def save_results(file_path, games):
+    with open(file_path, 'w') as f:
+        for result in games:
+            f.write(json.dumps(result) + '\n')
+
+
+def format_results(games):
+    # player name -> list of (place, scores, uma)
+    players = defaultdict(list)
+    for result in games:
+        for seat, name in enumerate(result['players']):
+            players[name].append((result['places'][seat], result['scores'][seat], result['uma'][seat]))
+
+    lines = ['{:<12} {:>8} {:>10} {:>7} {:>7} {:>7} {:>7} {:>10} {:>8}'.format(
+        'player', 'games', 'avg place', '1st %', '2nd %', '3rd %', '4th %', 'avg score', 'avg uma'
+    )]
+
+    for name in sorted(players):
+        results = players[name]
+        count = len(results)
+        places = [len([x for x in results if x[0] == place]) * 100 / count for place in range(1, 5)]
+        lines.append('{:<12} {:>8} {:>10.3f} {:>7.1f} {:>7.1f} {:>7.1f} {:>7.1f} {:>10.0f} {:>8.1f}'.format(
+            name,
+            count,
+            sum([x[0] for x in results]) / count,
+            places[0],
+            places[1],
+            places[2],
+            places[3],
+            sum([x[1] for x in results]) / count,
+            sum([x[2] for x in results]) / count,
+        ))
+
+    return '\n'.join(lines)
+
+
+def main():
+    parser = OptionParser()
+
+    parser.add_option('-g', '--games',
+                      type='int',
+                      default=100,
+                      help='How many games to play. Default is 100')
+
+    parser.add_option('-w', '--workers',
+                      type='int',
+                      default=1,
+                      help='Count of processes to play games. Zero means count of CPUs')
+
+    parser.add_option('-p', '--players',
+                      type='int',
+                      default=4,
+                      help='Count of AI players at the table, other seats are taken by tsumogiri players. '
+                           'Default is 4')
+
+    parser.add_option('-t', '--tonpusen',
+                      action='store_true',
+                      default=False,
+                      help='Play east round games instead of hanchans')
+
+    parser.add_option('-s', '--seed',
+                      type='int',
+                      default=None,
+                      help='Seed for games seeds, the same seed gives the same games. Default is random')
+
+    parser.add_option('-o', '--output',
+                      type='string',
+                      default=None,
+                      help='File for the results of each game. For the replay, game is compared with it')
+
+    parser.add_option('-r', '--replay',
+                      type='int',
+                      default=None,
+                      help='Seed of the game to replay')
+
+    parser.add_option('-b', '--build_rates',
+                      action='store_true',
+                      default=False,
+                      help='Play games between AI players only to build the table of tenpai, win and deal-in rates')
+
+    parser.add_option('--rates_path',
+                      type='string',
+                      default=None,
+                      help='Where to save the table of rates. Default is project/data/round_rates.bin')
+
+    opts, _ = parser.parse_args()
+
+    workers = opts.workers or os.cpu_count()
+    count_of_ai_players = min(max(opts.players, 1), 4)
+    is_hanchan = not opts.tonpusen
+    params = {}
+
+    if opts.replay is not None:
+        original = None
+        if opts.output:
+            original = load_results(opts.output).get(opts.replay)
+        if original:
+            count_of_ai_players = original['ai_players']
+            is_hanchan = original['is_hanchan']
+
+        result, stats = replay_game(opts.replay, count_of_ai_players, params, is_hanchan)
+        print('Game: {}'.format(json.dumps(result)))
+        print('Decisions latency:\n{}'.format(stats.format_summary()))
+        if original:
+            print('The same game: {}'.format(original['digest'] == result['digest']))
+        return
+
+    seed = opts.seed if opts.seed is not None else random.getrandbits(32)
+    print('Seed:', seed)
+
+    t0 = time.time()
+
+    if opts.build_rates:
+        rates_table, errors = build_rates_table(generate_seeds(opts.games, seed), params, workers, is_hanchan)
+        for game_seed, error in errors:
+            print('There is a bug:', game_seed, error)
+
+        rates_table.save(opts.rates_path)
+        print('Rates of {} hands were saved, running time: {:.1f}'.format(rates_table.count_of_hands,
+                                                                          time.time() - t0))
+        return
+
+    games, errors = play_games(generate_seeds(opts.games, seed), count_of_ai_players, params, workers, is_hanchan)
+
+    for game_seed, error in errors:
+        print('There is a bug:', game_seed, error)
+
+    if opts.output:
+        save_results(opts.output, games)
+
+    print('\nPARAMS:', params)
+    print('\nRESULTS:')
+    print(format_results(games))
+    print('Invalid actions:', sum([x['invalid_actions'] for x in games]))
+
+    slowest = max(games, key=lambda x: x['seconds'], default=None)
+    if slowest:
+        print('The slowest game: {} seconds, seed {}'.format(round(slowest['seconds'], 2), slowest['seed']))
+
+    running_time = time.time() - t0
+    print('Running time: {:.1f}, games per minute: {:.1f}'.format(running_time, opts.games * 60 / running_time))
+
+
+if __name__ == '__main__':
+    main()
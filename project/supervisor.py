@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+Endpoint to run many bots in one process.
+Each bot plays in its own thread with settings from SESSIONS,
+so python startup and AI loading are done only once
+"""
+import logging
+import threading
+import time
+from optparse import OptionParser
+
+from tenhou.main import connect_and_play
+from utils.logger import set_up_logging
+from utils.settings_handler import settings
+
+logger = logging.getLogger('tenhou')
+
+
+def run_session(name, values, count_of_games=500, restart_delay=60):
+    """
+    Play games one by one with the session settings
+    :param name: session name, it is used for the thread name and log file
+    :param values: dict with settings for this session
+    :param count_of_games: how much games to play
+    :param restart_delay: seconds to wait after the crash
+    """
+    with settings.override(values):
+        handlers = set_up_logging(name)
+        try:
+            for _ in range(count_of_games):
+                try:
+                    connect_and_play()
+                except Exception as e:
+                    # one broken session shouldn't stop other sessions
+                    logger.exception('Session was crashed', exc_info=e)
+                    time.sleep(restart_delay)
+        finally:
+            tear_down_logging(handlers)
+
+
+def tear_down_logging(handlers):
+    for logger_name in ['tenhou', 'ai']:
+        for handler in handlers:
+            logging.getLogger(logger_name).removeHandler(handler)
+
+    for handler in handlers:
+        handler.close()
+
+
+def start_sessions(sessions, count_of_games=500, restart_delay=60):
+    """
+    :param sessions: list of dicts with settings for each session
+    :return: list of started threads
+    """
+    threads = []
+    for index, values in enumerate(sessions):
+        name = 'bot{}'.format(index)
+        thread = threading.Thread(
+            target=run_session,
+            name=name,
+            args=(name, values, count_of_games, restart_delay),
+            # we don't need to wait for the game end after ctrl+c
+            daemon=True
+        )
+        thread.start()
+        threads.append(thread)
+
+    return threads
+
+
+def main():
+    parser = OptionParser()
+
+    parser.add_option('-s', '--settings',
+                      type='string',
+                      default=None,
+                      help='Settings file name with SESSIONS (without path, just file name without extension)')
+
+    parser.add_option('-g', '--games',
+                      type='int',
+                      default=500,
+                      help='How much games each session will play. Default is 500')
+
+    parser.add_option('-r', '--restart_delay',
+                      type='int',
+                      default=60,
+                      help='Seconds to wait before the session restart after the crash. Default is 60')
+
+    opts, _ = parser.parse_args()
+
+    if opts.settings:
+        module = __import__(opts.settings)
+        for key, value in vars(module).items():
+            # let's use only upper case settings
+            if key.isupper():
+                settings.__setattr__(key, value)
+
+        # it is important to reload bot class
+        settings.load_ai_class()
+
+    if not settings.SESSIONS:
+        print('Please, add bots settings to the SESSIONS')
+        return
+
+    threads = start_sessions(settings.SESSIONS, opts.games, opts.restart_delay)
+
+    try:
+        for thread in threads:
+            # join with timeout allows to handle ctrl+c
+            while thread.is_alive():
+                thread.join(1)
+    except KeyboardInterrupt:
+        print('Stopping the sessions...')
+
+
+if __name__ == '__main__':
+    main()
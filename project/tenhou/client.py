@@ -1,11 +1,12 @@
 # -*- coding: utf-8 -*-
+import asyncio
 import datetime
 import time
 import random
 import logging
 import socket
-from threading import Thread
-from time import sleep
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import quote
 
 from mahjong.constants import DISPLAY_WINDS
@@ -14,7 +15,10 @@ from mahjong.tile import TilesConverter
 
 from game.client import Client
 from tenhou.decoder import TenhouDecoder
+from tenhou.delay import HumanLikeDelay
 
+from utils.latency import FILE_EXTENSION, LatencyStats
+from utils.logger import get_file_path
 from utils.settings_handler import settings
 from utils.statistics import Statistics
 
@@ -22,40 +26,70 @@ logger = logging.getLogger('tenhou')
 
 
 class TenhouClient(Client):
-    SLEEP_BETWEEN_ACTIONS = 1
+    KEEP_ALIVE_INTERVAL = 15
+    RECEIVE_BUFFER_SIZE = 4096
 
     statistics = None
     socket = None
+    loop = None
+    delay = None
+    # AI decisions are made there
+    executor = None
+    # seconds from the received message to our answer, None means no deadline
+    decision_timeout = None
+    # decision that wasn't made before the deadline, with AI state before it
+    late_decision = None
     game_is_continue = True
     looking_for_game = True
-    keep_alive_thread = None
+    keep_alive_task = None
     reconnected_messages = None
+    # tenhou closed the socket on its side
+    is_connection_closed = False
 
-    decoder = TenhouDecoder()
+    decoder = None
 
-    _count_of_empty_messages = 0
+    # received bytes that are not a complete message yet
+    _buffer = None
     _rating_string = None
     _socket_mock = None
 
     def __init__(self, socket_mock=None):
         super().__init__()
         self.statistics = Statistics()
+        # decoder caches parsed message, so it can't be shared between clients
+        self.decoder = TenhouDecoder()
+        self.loop = asyncio.new_event_loop()
+        self._buffer = bytearray()
+        # there is no need to wait in the reproducer
+        self.delay = HumanLikeDelay(is_disabled=socket_mock is not None)
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        if settings.LATENCY_STATS:
+            self.table.latency = LatencyStats()
+
+        # reproducer should make the same decisions as AI, even if they are slow
+        if socket_mock is None:
+            self.decision_timeout = settings.DECISION_TIMEOUT
         self._socket_mock = socket_mock
 
     def connect(self):
         # for reproducer
         if self._socket_mock:
             self.socket = self._socket_mock
-            TenhouClient.SLEEP_BETWEEN_ACTIONS = 0
         else:
             self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
 
         self.socket.connect((settings.TENHOU_HOST, settings.TENHOU_PORT))
 
     def authenticate(self):
+        return self._run(self._authenticate())
+
+    def start_game(self):
+        return self._run(self._start_game())
+
+    async def _authenticate(self):
         self._send_message('<HELO name="{}" tid="f0" sx="M" />'.format(quote(settings.USER_ID)))
-        messages = self._get_multiple_messages()
-        auth_message = messages[0]
+        messages = await self._get_multiple_messages()
+        auth_message = messages and messages[0]
 
         if not auth_message:
             logger.info("Auth message wasn't received")
@@ -96,7 +130,7 @@ class TenhouClient(Client):
         counter = 0
         authenticated = False
         while continue_reading:
-            messages = self._get_multiple_messages()
+            messages = await self._get_multiple_messages()
             for message in messages:
                 if '<LN' in message:
                     authenticated = True
@@ -104,7 +138,7 @@ class TenhouClient(Client):
 
             counter += 1
             # to avoid infinity loop
-            if counter > 10:
+            if counter > 10 or self.is_connection_closed:
                 continue_reading = False
 
         if authenticated:
@@ -115,7 +149,7 @@ class TenhouClient(Client):
             logger.info('Failed to authenticate')
             return False
 
-    def start_game(self):
+    async def _start_game(self):
         log_link = ''
 
         # play in private or tournament lobby
@@ -123,18 +157,17 @@ class TenhouClient(Client):
             if settings.IS_TOURNAMENT:
                 logger.info('Go to the tournament lobby: {}'.format(settings.LOBBY))
                 self._send_message('<CS lobby="{}" />'.format(settings.LOBBY))
-                sleep(TenhouClient.SLEEP_BETWEEN_ACTIONS * 2)
+                await self.delay.wait('lobby')
                 self._send_message('<DATE />')
             else:
                 logger.info('Go to the lobby: {}'.format(settings.LOBBY))
                 self._send_message('<CHAT text="{}" />'.format(quote('/lobby {}'.format(settings.LOBBY))))
-                sleep(TenhouClient.SLEEP_BETWEEN_ACTIONS * 2)
+                await self.delay.wait('lobby')
 
         if self.reconnected_messages:
             # we already in the game
             self.looking_for_game = False
             self._send_message('<GOK />')
-            sleep(TenhouClient.SLEEP_BETWEEN_ACTIONS)
         else:
             selected_game_type = self._build_game_type()
             game_type = '{},{}'.format(settings.LOBBY, selected_game_type)
@@ -144,11 +177,20 @@ class TenhouClient(Client):
                 logger.info('Looking for the game...')
 
             start_time = datetime.datetime.now()
+            waiting_seconds = 60 * settings.WAITING_GAME_TIMEOUT_MINUTES
 
             while self.looking_for_game:
-                sleep(TenhouClient.SLEEP_BETWEEN_ACTIONS)
+                # tenhou can be silent in the lobby,
+                # so we don't wait for messages longer than the game search timeout
+                time_difference = datetime.datetime.now() - start_time
+                timeout = max(waiting_seconds - time_difference.total_seconds(), 0)
+
+                messages = await self._get_multiple_messages(timeout=timeout)
 
-                messages = self._get_multiple_messages()
+                if self.is_connection_closed:
+                    logger.error('Socket connection was closed while we were looking for the game')
+                    self.end_game(False)
+                    return
 
                 for message in messages:
                     if '<REJOIN' in message:
@@ -188,7 +230,7 @@ class TenhouClient(Client):
                 current_time = datetime.datetime.now()
                 time_difference = current_time - start_time
 
-                if time_difference.seconds > 60 * settings.WAITING_GAME_TIMEOUT_MINUTES:
+                if time_difference.seconds > waiting_seconds:
                     break
 
         # we wasn't able to find the game in specified time range
@@ -197,7 +239,7 @@ class TenhouClient(Client):
         if self.looking_for_game:
             logger.error('Game is not started. Can\'t find the game')
             self.end_game()
-            time.sleep(random.randint(30,120))
+            await asyncio.sleep(random.randint(30, 120))
             return
 
         logger.info('Game started')
@@ -210,20 +252,24 @@ class TenhouClient(Client):
         tile_to_discard = None
 
         while self.game_is_continue:
-            sleep(TenhouClient.SLEEP_BETWEEN_ACTIONS)
-            messages = self._get_multiple_messages()
+            messages = await self._get_multiple_messages()
+            # answers are delayed from this moment, not from the end of the decision
+            received_at = time.monotonic()
+
+            # socket was closed by tenhou
+            if self.is_connection_closed:
+                logger.error('Socket connection was closed')
+                self.end_game(False)
+                return
 
             if self.reconnected_messages:
                 messages = self.reconnected_messages + messages
                 self.reconnected_messages = None
 
-            if not messages:
-                self._count_of_empty_messages += 1
-            else:
-                # we had set to zero counter
-                self._count_of_empty_messages = 0
-
             for message in messages:
+                # table can't be changed while the late decision is using it
+                await self._finish_late_decision()
+
                 if '<INIT' in message or '<REINIT' in message:
                     values = self.decoder.parse_initial_values(message)
                     self.table.init_round(
@@ -278,10 +324,15 @@ class TenhouClient(Client):
                         # logger.info('Hand: {}'.format(main_player.format_hand_for_print(drawn_tile)))
 
                         self.player.draw_tile(drawn_tile)
-                        sleep(TenhouClient.SLEEP_BETWEEN_ACTIONS)
 
-                        kan_type = self.player.should_call_kan(drawn_tile, False)
-                        if kan_type and self.table.count_of_remaining_tiles > 1:
+                        kan_type, discarded_tile = await self._make_decision(
+                            self._choose_discard,
+                            lambda: (None, self._fallback_discard(drawn_tile)),
+                            received_at,
+                            drawn_tile
+                        )
+
+                        if kan_type:
                             if kan_type == Meld.CHANKAN:
                                 meld_type = 5
                             else:
@@ -290,21 +341,38 @@ class TenhouClient(Client):
                             # logger.info('We called a closed kan\chankan set!')
                             continue
 
-                        discarded_tile = self.player.discard_tile()
+                        # we are already late, so fallback discard is sent at once,
+                        # and our hand is changed only after the late decision is finished
+                        if self.late_decision:
+                            self._send_message('<D p="{}"/>'.format(discarded_tile))
+                            await self._finish_late_decision()
+                            self.player.apply_discard(discarded_tile)
+                            continue
+
+                        discarded_tile = self.player.apply_discard(discarded_tile)
                         # logger.info('Discard: {}'.format(TilesConverter.to_one_line_string([discarded_tile])))
 
-                        can_call_riichi = main_player.can_call_riichi()
+                        # after the late discard decision there is no time for riichi
+                        can_call_riichi = await self._make_decision(
+                            main_player.can_call_riichi,
+                            lambda: False,
+                            received_at
+                        )
+
+                        await self.delay.wait('discard', received_at)
 
                         # let's call riichi
                         if can_call_riichi:
                             self._send_message('<REACH hai="{}" />'.format(discarded_tile))
-                            sleep(TenhouClient.SLEEP_BETWEEN_ACTIONS)
+                            await self.delay.wait('riichi')
                             main_player.in_riichi = True
                     else:
                         # we had to add it to discards, to calculate remaining tiles correctly
                         discarded_tile = drawn_tile
                         self.table.add_discarded_tile(0, discarded_tile, True)
 
+                        await self.delay.wait('discard', received_at)
+
                     # tenhou format: <D p="133" />
                     self._send_message('<D p="{}"/>'.format(discarded_tile))
                     # logger.info('D: {}'.format(TilesConverter.to_one_line_string([discarded_tile])))
@@ -324,7 +392,7 @@ class TenhouClient(Client):
 
                 # the end of round
                 if '<AGARI' in message or '<RYUUKYOKU' in message:
-                    sleep(TenhouClient.SLEEP_BETWEEN_ACTIONS * 7)
+                    await self.delay.wait('round_end', received_at)
                     self._send_message('<NEXTREADY />')
 
                 # set was called
@@ -349,6 +417,7 @@ class TenhouClient(Client):
                             )
 
                             self.player.tiles.append(meld_tile)
+                            await self.delay.wait('discard', received_at)
                             self._send_message('<D p="{}"/>'.format(discarded_tile))
 
                 win_suggestions = [
@@ -358,9 +427,11 @@ class TenhouClient(Client):
                 if any(i in message for i in win_suggestions):
                     tile = self.decoder.parse_tile(message)
                     enemy_seat = self.decoder.get_enemy_seat(message)
-                    sleep(TenhouClient.SLEEP_BETWEEN_ACTIONS)
 
-                    if main_player.should_call_win(tile, enemy_seat):
+                    should_call_win = main_player.should_call_win(tile, enemy_seat)
+                    await self.delay.wait('call', received_at)
+
+                    if should_call_win:
                         self._send_message('<N type="6" />')
                     else:
                         self._send_message('<N />')
@@ -385,20 +456,30 @@ class TenhouClient(Client):
                         # 5 pon + chi
                         # 7 pon + kan + chi
 
-                        # should we call a kan?
-                        if 't="3"' in message or 't="7"' in message:
-                            if self.player.should_call_kan(tile, True):
-                                # 2 is open kan
-                                self._send_message('<N type="2" />')
-                                # logger.info('We called an open kan set!')
-                                continue
+                        can_call_kan = 't="3"' in message or 't="7"' in message
 
                         # player with "g" discard is always our kamicha
                         is_kamicha_discard = False
                         if message[1].lower() == 'g':
                             is_kamicha_discard = True
 
-                        meld, tile_to_discard = self.player.try_to_call_meld(tile, is_kamicha_discard)
+                        # we will skip the call if AI was too slow
+                        call_kan, meld, tile_to_discard = await self._make_decision(
+                            self._choose_call,
+                            lambda: (False, None, None),
+                            received_at,
+                            tile,
+                            is_kamicha_discard,
+                            can_call_kan
+                        )
+
+                        # should we call a kan?
+                        if call_kan:
+                            # 2 is open kan
+                            self._send_message('<N type="2" />')
+                            # logger.info('We called an open kan set!')
+                            continue
+
                         if meld:
                             meld_tile = tile
 
@@ -412,6 +493,8 @@ class TenhouClient(Client):
                             tiles = meld.tiles
                             tiles.remove(meld_tile)
 
+                            await self.delay.wait('call', received_at)
+
                             # try to call a meld
                             self._send_message('<N type="{}" hai0="{}" hai1="{}" />'.format(
                                 meld_type,
@@ -420,7 +503,7 @@ class TenhouClient(Client):
                             ))
                         # this meld will not improve our hand
                         else:
-                            sleep(TenhouClient.SLEEP_BETWEEN_ACTIONS)
+                            await self.delay.wait('call', received_at)
                             self._send_message('<N />')
 
                 if 'owari' in message:
@@ -430,12 +513,6 @@ class TenhouClient(Client):
                 if '<PROF' in message:
                     self.game_is_continue = False
 
-            # socket was closed by tenhou
-            if self._count_of_empty_messages >= 5:
-                logger.error('We are getting empty messages from socket. Probably socket connection was closed')
-                self.end_game(False)
-                return
-
         logger.info('Final results: {}'.format(self.table.get_players_sorted_by_scores()))
 
         # we need to finish the game, and only after this try to send statistics
@@ -445,7 +522,7 @@ class TenhouClient(Client):
         # sometimes log is not available just after the game
         # let's wait one minute before the statistics update
         if settings.STAT_SERVER_URL:
-            sleep(60)
+            await asyncio.sleep(60)
             result = self.statistics.send_statistics()
             logger.info('Statistics sent: {}'.format(result))
 
@@ -454,8 +531,18 @@ class TenhouClient(Client):
         if success:
             self._send_message('<BYE />')
 
-        if self.keep_alive_thread:
-            self.keep_alive_thread.join()
+        if self.keep_alive_task:
+            self.keep_alive_task.cancel()
+
+        # late decision can be still in progress, but we don't need its result
+        self.executor.shutdown(wait=False)
+
+        self._save_latency_stats()
+
+        # it can be called from the running game,
+        # in that case loop will be closed after the game
+        if not self.loop.is_running():
+            self._close_loop()
 
         try:
             self.socket.shutdown(socket.SHUT_RDWR)
@@ -468,40 +555,244 @@ class TenhouClient(Client):
         else:
             logger.error('Game was ended without success')
 
+    async def _make_decision(self, function, fallback, started_at, *args):
+        """
+        Run AI decision in the worker thread,
+        so we can read messages and send keep alive pings while AI is thinking.
+        If the decision is too slow, it will be ignored
+        :param function: decision, it is called with args in the worker thread
+        :param fallback: cheap decision for the case when deadline was exceeded
+        :param started_at: time.monotonic() value when the message was received
+        """
+        timeout = None
+        if self.decision_timeout is not None:
+            timeout = self.decision_timeout - (time.monotonic() - started_at)
+            if timeout <= 0:
+                return fallback()
+
+        # worker thread should see the settings of the current bot
+        thread_settings = getattr(settings.thread_values, 'values', None) or {}
+        # logs from the worker are written to the same log file as logs of the current thread
+        thread_name = threading.current_thread().name
+
+        def decide():
+            threading.current_thread().name = thread_name
+            with settings.override(thread_settings):
+                return function(*args)
+
+        state = self._get_ai_state()
+        future = self.loop.run_in_executor(self.executor, decide)
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            logger.error('AI decision was not made in {} seconds, fallback was used'.format(self.decision_timeout))
+            self.late_decision = future, state
+            # fallback only reads our hand and safe tiles, late decision doesn't change them
+            return fallback()
+
+    async def _finish_late_decision(self):
+        """
+        Wait for the decision that was too slow and drop all its changes of AI state,
+        after it we can change the table
+        """
+        if not self.late_decision:
+            return
+
+        future, state = self.late_decision
+        self.late_decision = None
+        try:
+            await future
+        except Exception as e:
+            logger.error('Late AI decision was failed: {}'.format(e))
+
+        for item, values in state:
+            item.__dict__.clear()
+            item.__dict__.update(values)
+
+    def _get_ai_state(self):
+        """
+        Attributes of our player and AI, decisions are changing them
+        """
+        items = [self.player, self.player.ai]
+        defence = getattr(self.player.ai, 'defence', None)
+        if defence:
+            items.append(defence)
+        return [(x, x.__dict__.copy()) for x in items]
+
+    def _choose_discard(self, drawn_tile):
+        """
+        :param drawn_tile: 136 tile format
+        :return: kan type or tile to discard
+        """
+        kan_type = self.player.should_call_kan(drawn_tile, False)
+        if kan_type and self.table.count_of_remaining_tiles > 1:
+            return kan_type, None
+
+        return None, self.player.ai.discard_tile(None)
+
+    def _choose_call(self, tile, is_kamicha_discard, can_call_kan):
+        """
+        :param tile: 136 tile format
+        :return: open kan flag, meld and tile to discard after the meld
+        """
+        if can_call_kan and self.player.should_call_kan(tile, True):
+            return True, None, None
+
+        meld, tile_to_discard = self.player.try_to_call_meld(tile, is_kamicha_discard)
+        return False, meld, tile_to_discard
+
+    def _fallback_discard(self, drawn_tile):
+        """
+        Discard that doesn't need AI calculations:
+        the most safe tile against riichi players or tsumogiri
+        :param drawn_tile: 136 tile format
+        :return: 136 tile format
+        """
+        riichi_players = [x for x in self.table.players[1:] if x.in_riichi]
+        if not riichi_players:
+            return drawn_tile
+
+        safe_masks = [x.all_safe_mask for x in riichi_players]
+
+        def count_of_safe_players(tile):
+            return len([x for x in safe_masks if x >> (tile // 4) & 1])
+
+        # drawn tile is selected when there are few tiles with the same safety
+        selected_tile = drawn_tile
+        for tile in self.player.closed_hand:
+            if count_of_safe_players(tile) > count_of_safe_players(selected_tile):
+                selected_tile = tile
+
+        return selected_tile
+
+    def _save_latency_stats(self):
+        stats = self.table.latency
+        if not stats:
+            return
+
+        logger.info('Decisions latency:\n{}'.format(stats.format_summary()))
+
+        # stats are saved near the log file
+        thread = threading.current_thread()
+        thread_name = thread is not threading.main_thread() and thread.name or None
+        stats.dump(get_file_path(FILE_EXTENSION, thread_name))
+        stats.clear()
+
     def _send_message(self, message):
         # tenhou requires an empty byte in the end of each sending message
         logger.debug('Send: {}'.format(message))
         message += '\0'
         self.socket.sendall(message.encode())
 
-    def _read_message(self):
-        message = self.socket.recv(2048)
-        logger.debug('Get: {}'.format(message.decode('utf-8').replace('\x00', ' ')))
-        return message.decode('utf-8')
+    async def _read_message(self, timeout=None):
+        """
+        :param timeout: seconds, None means wait forever
+        :return: received bytes, empty bytes if socket was closed and None after timeout
+        """
+        # socket mock has all messages in the memory
+        if not self._socket_mock:
+            is_readable = await self._wait_for_socket(timeout)
+            if not is_readable:
+                return None
+
+        return self.socket.recv(self.RECEIVE_BUFFER_SIZE)
+
+    async def _get_multiple_messages(self, timeout=None):
+        """
+        Tenhou can send multiple messages in one packet
+        and one long message can be split between packets,
+        so we keep not completed message in the buffer until the next read
+        :param timeout: seconds, None means wait forever
+        :return: list of complete messages, it is empty after timeout or when socket was closed
+        """
+        deadline = None
+        if timeout is not None:
+            deadline = time.monotonic() + timeout
+
+        messages = self._pop_messages()
+        while not messages:
+            if deadline is not None:
+                timeout = max(deadline - time.monotonic(), 0)
+
+            data = await self._read_message(timeout)
+            if data is None:
+                return []
 
-    def _get_multiple_messages(self):
-        # tenhou can send multiple messages in one request
-        messages = self._read_message()
-        messages = messages.split('\x00')
-        # last message always is empty after split, so let's exclude it
-        messages = messages[0:-1]
+            # readable socket without data was closed
+            if not data:
+                self.is_connection_closed = True
+                return []
+
+            self._buffer.extend(data)
+            messages = self._pop_messages()
+
+        return messages
+
+    def _pop_messages(self):
+        """
+        Take complete messages from the buffer.
+        Each message ends with an empty byte
+        """
+        end = self._buffer.rfind(b'\x00')
+        if end == -1:
+            return []
+
+        messages = self._buffer[:end].decode('utf-8').split('\x00')
+        del self._buffer[:end + 1]
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('Get: {}'.format(' '.join(messages)))
 
         return messages
 
+    async def _wait_for_socket(self, timeout=None):
+        """
+        Wait until socket will have something to read,
+        the loop is free to send keep alive pings in the meantime
+        :param timeout: seconds, None means wait forever
+        :return: False if there was nothing to read after timeout
+        """
+        readable = self.loop.create_future()
+
+        def on_readable():
+            if not readable.done():
+                readable.set_result(True)
+
+        file_descriptor = self.socket.fileno()
+        self.loop.add_reader(file_descriptor, on_readable)
+        try:
+            return await asyncio.wait_for(readable, timeout)
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self.loop.remove_reader(file_descriptor)
+
     def _send_keep_alive_ping(self):
-        def send_request():
-            while self.game_is_continue:
-                self._send_message('<Z />')
-
-                # we can't use sleep(15), because we want to be able
-                # end thread in the middle of running
-                seconds_to_sleep = 15
-                for x in range(0, seconds_to_sleep * 2):
-                    if self.game_is_continue:
-                        sleep(0.5)
-
-        self.keep_alive_thread = Thread(target=send_request)
-        self.keep_alive_thread.start()
+        self.keep_alive_task = self.loop.create_task(self._keep_alive())
+
+    async def _keep_alive(self):
+        while self.game_is_continue:
+            self._send_message('<Z />')
+            await asyncio.sleep(self.KEEP_ALIVE_INTERVAL)
+
+    def _run(self, coroutine):
+        try:
+            return self.loop.run_until_complete(coroutine)
+        finally:
+            if not self.game_is_continue:
+                self._close_loop()
+
+    def _close_loop(self):
+        if self.loop.is_closed():
+            return
+
+        # let cancelled keep alive task to finish
+        if self.keep_alive_task:
+            self.keep_alive_task.cancel()
+            self.loop.run_until_complete(asyncio.gather(self.keep_alive_task, return_exceptions=True))
+            self.keep_alive_task = None
+
+        self.loop.close()
 
     def _pxr_tag(self):
         # I have no idea why we need to send it, but better to do it
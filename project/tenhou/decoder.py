@@ -5,8 +5,19 @@ import re
 
 from mahjong.meld import Meld
 
+ATTRIBUTES_REGEX = re.compile(r'(\w+)="([^"]*)"')
+TILE_REGEX = re.compile(r'^<[tefgEFGTUVWD]+\d*')
+DISCARD_REGEX = re.compile(r'^<[efgEFG]+\d*')
+
 
 class TenhouDecoder(object):
+    # attributes of the last parsed message,
+    # usually we are reading a few attributes from the one message
+    _attributes_message = None
+    _attributes = None
+    # attribute name -> compiled regex, for names that are not in the attributes dict
+    _attribute_regexes = {}
+
     RANKS = [
         u'新人',
         u'9級',
@@ -114,7 +125,7 @@ class TenhouDecoder(object):
 
     def parse_tile(self, message):
         # tenhou format: <t23/>, <e23/>, <f23 t="4"/>, <f23/>, <g23/>
-        result = re.match(r'^<[tefgEFGTUVWD]+\d*', message).group()
+        result = TILE_REGEX.match(message).group()
         return int(result[2:])
 
     def parse_table_state_after_reconnection(self, message):
@@ -141,8 +152,7 @@ class TenhouDecoder(object):
                 melds = self.get_attribute_content(message, melds_attr)
                 melds = [int(x) for x in melds.split(',')]
                 for item in melds:
-                    meld_message = '<N who="{}" m="{}" />'.format(x, item)
-                    meld = self.parse_meld(meld_message)
+                    meld = self.decode_meld(x, item)
                     player['melds'].append(meld)
 
             players.append(player)
@@ -164,9 +174,17 @@ class TenhouDecoder(object):
 
     def parse_meld(self, message):
         data = int(self.get_attribute_content(message, 'm'))
+        who = int(self.get_attribute_content(message, 'who'))
+        return self.decode_meld(who, data)
 
+    def decode_meld(self, who, data):
+        """
+        :param who: seat of the player who called meld
+        :param data: meld code from "m" attribute
+        :return: Meld
+        """
         meld = Meld()
-        meld.who = int(self.get_attribute_content(message, 'who'))
+        meld.who = who
         meld.from_who = data & 0x3
 
         if data & 0x4:
@@ -244,8 +262,31 @@ class TenhouDecoder(object):
         return result
 
     def get_attribute_content(self, message, attribute_name):
-        result = re.findall(r'{}="([^"]*)"'.format(attribute_name), message)
-        return result and result[0] or None
+        if message is not self._attributes_message:
+            self._attributes = self.parse_attributes(message)
+            self._attributes_message = message
+
+        if attribute_name in self._attributes:
+            return self._attributes[attribute_name] or None
+
+        # the old way to find attribute, it matched attribute name as suffix of other names.
+        # Let's keep it for not found attributes, to not change the behaviour
+        regex = self._attribute_regexes.get(attribute_name)
+        if not regex:
+            regex = re.compile(r'{}="([^"]*)"'.format(re.escape(attribute_name)))
+            self._attribute_regexes[attribute_name] = regex
+
+        result = regex.search(message)
+        return result and result.group(1) or None
+
+    def parse_attributes(self, message):
+        """
+        Parse all attributes of the message in one pass
+        :param message: one or more tags
+        :return: dict of attribute name -> value, the first value is taken for repeated attributes
+        """
+        # reversed, so the first value will overwrite others
+        return dict(reversed(ATTRIBUTES_REGEX.findall(message)))
 
     def is_discarded_tile_message(self, message):
         if '<GO' in message:
@@ -254,7 +295,7 @@ class TenhouDecoder(object):
         if '<FURITEN' in message:
             return False
 
-        match_discard = re.match(r"^<[efgEFG]+\d*", message)
+        match_discard = DISCARD_REGEX.match(message)
         if match_discard:
             return True
 
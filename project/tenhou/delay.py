@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import random
+import time
+
+from utils.settings_handler import settings
+
+
+class HumanLikeDelay(object):
+    """
+    How long to wait before the answer to tenhou.
+    Time spent on the decision is included in the delay,
+    so slow decisions are sent just after they are computed
+    """
+    ranges = None
+    is_disabled = False
+
+    def __init__(self, ranges=None, is_disabled=False):
+        self.ranges = ranges if ranges is not None else settings.HUMAN_LIKE_DELAY
+        self.is_disabled = is_disabled
+
+    def seconds(self, action, started_at=None):
+        """
+        :param action: key from HUMAN_LIKE_DELAY
+        :param started_at: time.monotonic() value when the message was received
+        :return: seconds to wait
+        """
+        if self.is_disabled or action not in self.ranges:
+            return 0
+
+        min_delay, max_delay = self.ranges[action]
+        delay = random.uniform(min_delay, max_delay)
+
+        if started_at is not None:
+            delay -= time.monotonic() - started_at
+
+        return max(delay, 0)
+
+    async def wait(self, action, started_at=None):
+        delay = self.seconds(action, started_at)
+        if delay:
+            await asyncio.sleep(delay)
@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""
+Single file storage for tenhou logs, to replay them without network.
+
+Logs are compressed with zlib and stored by sha1 of the content,
+so the same log imported with different ids is stored once.
+Archive is memory-mapped, parallel workers share the page cache.
+
+Import a folder with logs:
+    python -m tenhou.log_archive -i full_logs
+"""
+import gzip
+import hashlib
+import json
+import mmap
+import os
+import struct
+import zlib
+from functools import partial
+from optparse import OptionParser
+
+MAGIC = b'TLOG'
+VERSION = 1
+# magic, version, offset of the index, size of the index
+HEADER = struct.Struct('<4sIQQ')
+
+DEFAULT_ARCHIVE_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'data', 'logs.archive')
+
+# path -> opened archive, one archive for the process
+_opened_archives = {}
+
+
+class LogArchive(object):
+    path = None
+    # log id -> sha1 of the log content
+    log_ids = None
+    # sha1 -> (offset, size) of compressed content
+    blobs = None
+
+    _file = None
+    _map = None
+
+    def __init__(self, path):
+        self.path = path
+        self.log_ids = {}
+        self.blobs = {}
+
+        self._file = open(path, 'rb')
+        # mmap can't map empty file, but archive always has the header
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, index_offset, index_size = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError('{} is not a log archive of version {}'.format(path, VERSION))
+
+        index = json.loads(self._map[index_offset:index_offset + index_size].decode('utf-8'))
+        self.log_ids = index['log_ids']
+        self.blobs = {k: tuple(v) for k, v in index['blobs'].items()}
+
+    def __contains__(self, log_id):
+        return log_id in self.log_ids
+
+    def __len__(self):
+        return len(self.log_ids)
+
+    def get(self, log_id):
+        """
+        :param log_id: tenhou log id
+        :return: log content
+        """
+        return self.get_bytes(log_id).decode('utf-8')
+
+    def get_bytes(self, log_id):
+        """
+        :param log_id: tenhou log id
+        :return: log content as utf-8 bytes
+        """
+        if log_id not in self.log_ids:
+            raise KeyError('Log {} is not in the archive {}'.format(log_id, self.path))
+
+        offset, size = self.blobs[self.log_ids[log_id]]
+        return zlib.decompress(self._map[offset:offset + size])
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+
+def open_archive(path=None):
+    """
+    :param path: path to the archive file
+    :return: LogArchive, it will be opened once for the process
+    """
+    path = path or DEFAULT_ARCHIVE_PATH
+    if path not in _opened_archives:
+        _opened_archives[path] = LogArchive(path)
+    return _opened_archives[path]
+
+
+def write_archive(path, logs):
+    """
+    Write logs to the new archive
+    :param path: path to the archive file
+    :param logs: iterable of (log id, log content) pairs
+    :return: count of stored logs
+    """
+    directory = os.path.dirname(os.path.realpath(path))
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+
+    log_ids = {}
+    blobs = {}
+
+    temp_path = '{}.tmp'.format(path)
+    with open(temp_path, 'wb') as f:
+        # header will be updated when we will know where the index is
+        f.write(HEADER.pack(MAGIC, VERSION, 0, 0))
+        offset = HEADER.size
+
+        for log_id, content in logs:
+            data = content.encode('utf-8')
+            digest = hashlib.sha1(data).hexdigest()
+            log_ids[log_id] = digest
+            if digest in blobs:
+                continue
+
+            compressed = zlib.compress(data, 9)
+            f.write(compressed)
+            blobs[digest] = (offset, len(compressed))
+            offset += len(compressed)
+
+        index = json.dumps({'log_ids': log_ids, 'blobs': blobs}, sort_keys=True).encode('utf-8')
+        f.write(index)
+
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, VERSION, offset, len(index)))
+
+    # archive can be opened by other processes,
+    # so we are replacing it only when the new one is ready
+    os.replace(temp_path, path)
+
+    return len(log_ids)
+
+
+def import_logs(folder, path=None):
+    """
+    Add all logs from the folder to the archive, log id is the file name without extension.
+    Logs that are already in the archive are replaced
+    :param folder: folder with raw or gzipped logs
+    :param path: path to the archive file
+    :return: count of logs in the archive
+    """
+    path = path or DEFAULT_ARCHIVE_PATH
+
+    # log id -> function to load the content,
+    # to not keep all logs in the memory
+    sources = {}
+    archive = None
+    if os.path.exists(path):
+        archive = LogArchive(path)
+        for log_id in archive.log_ids:
+            sources[log_id] = partial(archive.get, log_id)
+
+    for file_name in sorted(os.listdir(folder)):
+        file_path = os.path.join(folder, file_name)
+        if not os.path.isfile(file_path):
+            continue
+
+        log_id = os.path.splitext(file_name)[0]
+        sources[log_id] = partial(_read_log_file, file_path)
+
+    try:
+        return write_archive(path, ((x, sources[x]()) for x in sorted(sources)))
+    finally:
+        if archive:
+            archive.close()
+
+
+def _read_log_file(file_path):
+    with open(file_path, 'rb') as f:
+        data = f.read()
+
+    # logs downloaded from tenhou.net are gzipped
+    if data[:2] == b'\x1f\x8b':
+        data = gzip.decompress(data)
+
+    return data.decode('utf-8')
+
+
+def main():
+    parser = OptionParser()
+
+    parser.add_option('-i', '--import_folder',
+                      type='string',
+                      help='Folder with logs to import')
+
+    parser.add_option('-a', '--archive',
+                      type='string',
+                      default=None,
+                      help='Path to the archive. Default is {}'.format(os.path.normpath(DEFAULT_ARCHIVE_PATH)))
+
+    opts, _ = parser.parse_args()
+
+    if not opts.import_folder:
+        print('Please, set -i option')
+        return
+
+    count_of_logs = import_logs(opts.import_folder, opts.archive)
+    print('Archive has {} logs'.format(count_of_logs))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+"""
+Compact binary form of tenhou logs.
+
+Log is compiled once to the stream of fixed width records,
+and it can be replayed many times without tags parsing.
+Record is: event type, seat, tile, extra byte and 32 bit value.
+Seats are not normalized, so one stream can be replayed for any player.
+"""
+import re
+import struct
+from collections import defaultdict
+
+from mahjong.meld import Meld
+from mahjong.tile import TilesConverter
+
+from game.table import Table
+from tenhou.decoder import TenhouDecoder
+from tenhou.log_parser import iter_rounds
+
+RECORD = struct.Struct('<BBBBi')
+NO_TILE = 255
+
+# who - dealer, tile - dora indicator, extra - round number, value - honba sticks << 8 | riichi sticks.
+# It goes after SCORE and HAI events of the round, so replay starts the round on it
+INIT = 1
+# who - seat, value - scores
+SCORE = 2
+# who - seat, tile - tile from initial hand
+HAI = 3
+DRAW = 4
+DISCARD = 5
+# who - seat, value - meld code
+MELD = 6
+# who - seat, extra - riichi step
+RIICHI = 7
+# tile - new dora indicator
+DORA = 8
+# who - winner, extra - from who
+AGARI = 9
+RYUUKYOKU = 10
+
+DRAW_TAGS = ['T', 'U', 'V', 'W']
+DISCARD_TAGS = ['D', 'E', 'F', 'G']
+
+# the same checks as TenhouLogReproducer had for the tags
+DRAW_REGEX = re.compile(r'^<[TUVW]+\d*')
+DISCARD_REGEX = re.compile(r'^<[DEFG]+\d*')
+
+
+def compile_tag(tag, decoder):
+    """
+    :param tag: log tag
+    :param decoder: TenhouDecoder
+    :return: list of records as tuples
+    """
+    events = []
+
+    if 'INIT' in tag:
+        values = decoder.parse_initial_values(tag)
+        for seat, score in enumerate(values['scores']):
+            events.append((SCORE, seat, NO_TILE, 0, score))
+
+        for seat in range(0, 4):
+            for tile in decoder.get_attribute_content(tag, 'hai{}'.format(seat)).split(','):
+                events.append((HAI, seat, int(tile), 0, 0))
+
+        sticks = values['count_of_honba_sticks'] << 8 | values['count_of_riichi_sticks']
+        events.append((INIT, values['dealer'], values['dora_indicator'], values['round_number'], sticks))
+
+    if DRAW_REGEX.match(tag) and 'UN' not in tag:
+        events.append((DRAW, DRAW_TAGS.index(tag[1]), decoder.parse_tile(tag), 0, 0))
+
+    if DISCARD_REGEX.match(tag) and 'DORA' not in tag:
+        events.append((DISCARD, DISCARD_TAGS.index(tag[1]), decoder.parse_tile(tag), 0, 0))
+
+    if '<N who=' in tag:
+        who = int(decoder.get_attribute_content(tag, 'who'))
+        events.append((MELD, who, NO_TILE, 0, int(decoder.get_attribute_content(tag, 'm'))))
+
+    if '<REACH' in tag:
+        who = decoder.parse_who_called_riichi(tag)
+        events.append((RIICHI, who, NO_TILE, int(decoder.get_attribute_content(tag, 'step')), 0))
+
+    if '<DORA' in tag:
+        events.append((DORA, 0, decoder.parse_dora_indicator(tag), 0, 0))
+
+    if '<AGARI' in tag:
+        who = int(decoder.get_attribute_content(tag, 'who'))
+        from_who = int(decoder.get_attribute_content(tag, 'fromWho'))
+        events.append((AGARI, who, NO_TILE, from_who, 0))
+
+    if '<RYUUKYOKU' in tag:
+        events.append((RYUUKYOKU, 0, NO_TILE, 0, 0))
+
+    return events
+
+
+def compile_log(content):
+    """
+    :param content: log content, see iter_rounds for supported types
+    :return: bytes with the events of all rounds
+    """
+    decoder = TenhouDecoder()
+    data = bytearray()
+    for game_round in iter_rounds(content):
+        for tag in game_round:
+            for event in compile_tag(tag, decoder):
+                data.extend(RECORD.pack(*event))
+    return bytes(data)
+
+
+def iter_events(data):
+    """
+    :param data: bytes with compiled events
+    :return: generator of (event type, who, tile, extra, value) tuples
+    """
+    return RECORD.iter_unpack(data)
+
+
+def replay_events(data, player_position=0, params=None):
+    """
+    Feed compiled log to the table and compare our discards with the player choices
+    :return: total discards and same discards by play state
+    """
+    replayer = LogReplayer(player_position, params)
+    for event in iter_events(data):
+        replayer.apply(event)
+    return replayer.total, replayer.results
+
+
+class LogReplayer(object):
+    """
+    Feed log events to the table from the point of view of one player
+    """
+    player_position = 0
+    table = None
+    decoder = None
+    verbose = False
+
+    # counters by player play state
+    total = None
+    results = None
+
+    _scores = None
+    _hands = None
+
+    def __init__(self, player_position, params=None, verbose=False):
+        self.player_position = player_position
+        self.table = Table(params or {})
+        self.decoder = TenhouDecoder()
+        self.verbose = verbose
+
+        self.total = defaultdict(int)
+        self.results = defaultdict(int)
+
+        self._scores = [0] * 4
+        self._hands = [[], [], [], []]
+
+    def apply(self, event):
+        event_type, who, tile, extra, value = event
+        table = self.table
+
+        if event_type == SCORE:
+            self._scores[who] = value
+
+        elif event_type == HAI:
+            self._hands[who].append(tile)
+
+        elif event_type == INIT:
+            shifted_scores = []
+            for x in range(0, 4):
+                shifted_scores.append(self._scores[self._normalize_position(x, self.player_position)])
+
+            table.init_round(
+                extra,
+                value >> 8,
+                value & 0xff,
+                tile,
+                self._normalize_position(self.player_position, who),
+                shifted_scores,
+            )
+
+            table.player.init_hand(self._hands[self.player_position])
+            self._hands = [[], [], [], []]
+
+        elif event_type == DRAW:
+            if who == self.player_position:
+                table.player.draw_tile(tile)
+
+        elif event_type == DISCARD:
+            player_seat = self._normalize_position(self.player_position, who)
+            if player_seat == 0:
+                self._compare_discard(tile)
+            else:
+                table.add_discarded_tile(player_seat, tile, False)
+
+        elif event_type == MELD:
+            meld = self.decoder.decode_meld(who, value)
+            player_seat = self._normalize_position(self.player_position, meld.who)
+            table.add_called_meld(player_seat, meld)
+
+            if player_seat == 0:
+                # we had to delete called tile from hand
+                # to have correct tiles count in the hand
+                if meld.type != Meld.KAN and meld.type != Meld.CHANKAN:
+                    table.player.draw_tile(meld.called_tile)
+
+        elif event_type == RIICHI:
+            if extra == 1:
+                table.add_called_riichi(self._normalize_position(self.player_position, who))
+                # TODO: add reach time point
+
+    def _compare_discard(self, tile):
+        table = self.table
+
+        # TODO: add player's state, river, melds, and reach timepoint
+        current_hand = TilesConverter.to_one_line_string(table.player.tiles)
+        choice = table.player.ai.discard_tile(None)
+        table.player.discard_tile(tile)
+        match = int(tile == choice)
+        self.total["TOTAL"] += 1
+        self.results["TOTAL"] += match
+        self.total[table.player.play_state] += 1
+        self.results[table.player.play_state] += match
+        if self.verbose:
+            print("Hand:", current_hand)
+            print("AI's Choice:", TilesConverter.to_one_line_string([choice]))
+            print("MP's Choice:", TilesConverter.to_one_line_string(([tile])))
+            print("AI's State:", table.player.play_state)
+            print("Same:", tile == choice)
+            print()
+
+    def _normalize_position(self, who, from_who):
+        positions = [0, 1, 2, 3]
+        return positions[who - from_who]
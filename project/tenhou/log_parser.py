@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+Split tenhou logs to tags and rounds.
+
+Compare speed with the previous implementation:
+    python -m tenhou.log_parser -a data/logs.archive
+"""
+import re
+import time
+from optparse import OptionParser
+
+from tenhou.log_archive import open_archive
+
+SHUFFLE_ATTRIBUTE = 'shuffle="'
+
+
+def iter_tags(content):
+    """
+    Split log to tags. Text between tags is added to the next tag,
+    text after the last tag is ignored
+    :param content: str, bytes, bytearray, mmap or memoryview with the log
+    :return: generator of tags as strings
+    """
+    # one decode of the whole log is much faster than decode of each tag
+    if not isinstance(content, str):
+        content = bytes(content).decode('utf-8')
+
+    start = 0
+    end = content.find('>')
+    while end != -1:
+        yield content[start:end + 1]
+
+        start = end + 1
+        end = content.find('>', start)
+
+
+def iter_rounds(content):
+    """
+    Group log tags by rounds. Not useful tags and shuffle seed are dropped
+    :param content: str, bytes, bytearray, mmap or memoryview with the log
+    :return: generator of rounds, each round is a list of tags
+    """
+    game_round = None
+    is_finished = False
+    for tag in iter_tags(content):
+        # not useful tags
+        if 'mjloggm' in tag or 'TAIKYOKU' in tag:
+            continue
+
+        # new round was started
+        if 'INIT' in tag:
+            if game_round is not None:
+                yield game_round
+            game_round = []
+
+            # we dont need seed information
+            tag = remove_shuffle(tag)
+
+        # the end of the game,
+        # tags after it are still added to the last round
+        if 'owari' in tag:
+            is_finished = True
+
+        if game_round is not None:
+            game_round.append(tag)
+
+    # round without the end of the game is not completed
+    if is_finished and game_round is not None:
+        yield game_round
+
+
+def remove_shuffle(tag):
+    start = tag.find(SHUFFLE_ATTRIBUTE)
+    if start == -1:
+        return tag
+
+    end = tag.find('"', start + len(SHUFFLE_ATTRIBUTE))
+    if end == -1:
+        return tag
+
+    return tag[:start] + tag[end + 1:]
+
+
+def parse_rounds_by_characters(log_content):
+    """
+    Previous version of the rounds parser, it is used to check and benchmark the new one
+    :param log_content: str with the log
+    :return: list of rounds
+    """
+    rounds = []
+
+    game_round = []
+    tag_start = 0
+    tag = None
+    for x in range(0, len(log_content)):
+        if log_content[x] == '>':
+            tag = log_content[tag_start:x + 1]
+            tag_start = x + 1
+
+        # not useful tags
+        if tag and ('mjloggm' in tag or 'TAIKYOKU' in tag):
+            tag = None
+
+        # new round was started
+        if tag and 'INIT' in tag:
+            rounds.append(game_round)
+            game_round = []
+
+        # the end of the game
+        if tag and 'owari' in tag:
+            rounds.append(game_round)
+
+        if tag:
+            # to save some memory we can remove not needed information from logs
+            if 'INIT' in tag:
+                # we dont need seed information
+                find = re.compile(r'shuffle="[^"]*"')
+                tag = find.sub('', tag)
+
+            # add processed tag to the round
+            game_round.append(tag)
+            tag = None
+
+    return rounds[1:]
+
+
+def benchmark(logs):
+    """
+    :param logs: list of logs as bytes
+    :return: dict with tags per second for each parser
+    """
+    count_of_tags = sum([x.count(b'>') for x in logs])
+
+    start = time.perf_counter()
+    for log in logs:
+        parse_rounds_by_characters(log.decode('utf-8'))
+    by_characters = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for log in logs:
+        for _ in iter_rounds(log):
+            pass
+    streaming = time.perf_counter() - start
+
+    return {
+        'characters loop': count_of_tags / by_characters,
+        'streaming': count_of_tags / streaming,
+    }
+
+
+def main():
+    parser = OptionParser()
+
+    parser.add_option('-a', '--archive',
+                      type='string',
+                      default=None,
+                      help='Path to the log archive')
+
+    parser.add_option('-f', '--log_file',
+                      type='string',
+                      default=None,
+                      help='Benchmark one log file')
+
+    opts, _ = parser.parse_args()
+
+    if opts.log_file:
+        with open(opts.log_file, 'rb') as f:
+            logs = [f.read()]
+    else:
+        archive = open_archive(opts.archive)
+        logs = [archive.get_bytes(x) for x in sorted(archive.log_ids)]
+
+    for name, tags_per_second in benchmark(logs).items():
+        print('{}: {:.0f} tags per second'.format(name, tags_per_second))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,612 @@
+# -*- coding: utf-8 -*-
+"""
+Local server with the part of tenhou protocol that is used by TenhouClient.
+
+Bots are connected to it instead of tenhou.net, so we can check the whole client
+and measure decisions throughput and latency under the load:
+    python -m tenhou.server -p 10080 -s 4 -g 100
+
+Tables are started when enough bots joined the same game type,
+free seats are taken by tsumogiri players.
+Game seed is sent as the log id, walls and seats are the same for the same seed.
+"""
+import logging
+import random
+import select
+import socket
+import socketserver
+import threading
+import time
+from optparse import OptionParser
+from urllib.parse import quote, unquote
+
+from mahjong.meld import Meld
+
+from game.engine import GameEngine, TsumogiriAgent, DISCARD, TSUMO, CLOSED_KAN, ADDED_KAN, \
+    RON, PON, CHI, OPEN_KAN, AGARI
+from tenhou.decoder import TenhouDecoder
+from utils.latency import LatencyStats
+
+logger = logging.getLogger('server')
+
+AUTH_STRING = '20170415-11111111'
+
+# bits from the game type, see settings.py
+NO_AKA_DORA = 0x2
+NO_OPEN_TANYAO = 0x4
+HANCHAN = 0x8
+SANMA = 0x10
+
+# "t" attribute of the discard tag
+OFFER_FLAGS = {PON: 1, OPEN_KAN: 2, CHI: 4, RON: 8}
+# "type" attribute of <N /> answers
+CALL_TYPES = {'1': PON, '2': OPEN_KAN, '3': CHI, '6': RON}
+DRAW_TAGS = ['T', 'U', 'V', 'W']
+DISCARD_TAGS = ['D', 'E', 'F', 'G']
+
+
+def encode_meld(meld):
+    """
+    Opposite to TenhouDecoder.decode_meld
+    :param meld: Meld with absolute seats
+    :return: meld code for "m" attribute
+    """
+    from_who = (meld.from_who - meld.who) % 4
+    tiles = sorted(meld.tiles)
+    base_34 = tiles[0] // 4
+
+    if meld.type == Meld.CHI:
+        base = (base_34 // 9) * 7 + base_34 % 9
+        called = tiles.index(meld.called_tile)
+        data = (base * 3 + called) << 10
+        for index, tile in enumerate(tiles):
+            data |= (tile % 4) << (3 + 2 * index)
+        return data | 0x4 | from_who
+
+    if meld.type == Meld.PON or meld.type == Meld.CHANKAN:
+        pon_tiles = sorted(meld.tiles[:3])
+        # copy of the tile that is not in pon
+        unused = [x for x in range(0, 4) if x not in [y % 4 for y in pon_tiles]][0]
+        # for added kan we don't know what tile was called for pon
+        called = meld.called_tile in pon_tiles and pon_tiles.index(meld.called_tile) or 0
+        data = (base_34 * 3 + called) << 9 | unused << 5
+        if meld.type == Meld.PON:
+            return data | 0x8 | from_who
+        return data | 0x10 | from_who
+
+    return (base_34 * 4 + meld.called_tile % 4) << 8 | from_who
+
+
+class Connection(object):
+    """
+    Messages from and to one bot
+    """
+    RECEIVE_BUFFER_SIZE = 4096
+
+    socket = None
+    is_closed = False
+    _buffer = None
+
+    def __init__(self, sock):
+        self.socket = sock
+        # tags are small, they shouldn't wait for the previous tag acknowledgement
+        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._buffer = bytearray()
+
+    def send(self, *messages):
+        if self.is_closed:
+            return
+
+        logger.debug('Send: {}'.format(' '.join(messages)))
+        data = ''.join([x + '\0' for x in messages]).encode()
+        try:
+            self.socket.sendall(data)
+        except OSError:
+            self.is_closed = True
+
+    def read(self, timeout):
+        """
+        :param timeout: seconds
+        :return: message or None after the timeout or when socket was closed.
+        Keep alive pings are skipped
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            message = self._pop_message()
+            if message is not None:
+                if message.startswith('<Z'):
+                    continue
+                return message
+
+            if self.is_closed or not self._receive(deadline - time.monotonic()):
+                return None
+
+    def drain(self):
+        """
+        Skip messages that were sent by the bot, but we don't wait for them
+        """
+        while self._pop_message() is not None or self._receive(0):
+            pass
+
+    def _pop_message(self):
+        end = self._buffer.find(b'\x00')
+        if end == -1:
+            return None
+
+        message = self._buffer[:end].decode('utf-8')
+        del self._buffer[:end + 1]
+        logger.debug('Get: {}'.format(message))
+        return message
+
+    def _receive(self, timeout):
+        """
+        :return: False if there was nothing to read
+        """
+        if self.is_closed:
+            return False
+
+        try:
+            readable, _, _ = select.select([self.socket], [], [], max(timeout, 0))
+            if not readable:
+                return False
+
+            data = self.socket.recv(self.RECEIVE_BUFFER_SIZE)
+        except (OSError, ValueError):
+            data = b''
+
+        if not data:
+            self.is_closed = True
+            return False
+
+        self._buffer.extend(data)
+        return True
+
+
+class NetworkAgent(TsumogiriAgent):
+    """
+    Bot connected to the server.
+    Tags are sent with seats relative to the bot, as tenhou does.
+    If bot is not answering in time, we are playing instead of him till the end of the game
+    """
+    connection = None
+    game_type = None
+    reply_timeout = None
+    decoder = None
+    engine = None
+    stats = None
+    # bot was disconnected or was too slow
+    is_auto_play = False
+    # the game was ended and the connection can be closed
+    game_ended = None
+
+    count_of_honba_sticks = 0
+    count_of_riichi_sticks = 0
+    # decision name and time when we send the question to the bot
+    _question = None
+
+    def __init__(self, connection, name, game_type, reply_timeout):
+        self.connection = connection
+        self.name = name
+        self.game_type = game_type
+        self.reply_timeout = reply_timeout
+        self.decoder = TenhouDecoder()
+        self.game_ended = threading.Event()
+
+    def start_game(self, engine):
+        self.engine = engine
+        self.is_auto_play = False
+        self.stats = LatencyStats()
+
+        names = ['n{}="{}"'.format(x, quote(engine.agents[self._absolute_seat(x)].name)) for x in range(0, 4)]
+        # bot is waiting the game start in the lobby,
+        # so all game start tags are sent together
+        self.connection.send(
+            '<GO type="{}" lobby="0" gpid="" />'.format(self.game_type),
+            '<UN {} dan="0,0,0,0" rate="1500.00,1500.00,1500.00,1500.00" sx="M,M,M,M" />'.format(' '.join(names)),
+            '<TAIKYOKU oya="{}" log="{}" />'.format(self._relative_seat(0), engine.seed),
+        )
+
+    def start_round(self, engine, tiles):
+        self.count_of_honba_sticks = engine.count_of_honba_sticks
+        self.count_of_riichi_sticks = engine.count_of_riichi_sticks
+
+        # tenhou waits till the bot will see results of the previous round
+        self._wait_for('<NEXTREADY')
+
+        seed = '{},{},{},0,0,{}'.format(
+            engine.round_number,
+            engine.count_of_honba_sticks,
+            engine.count_of_riichi_sticks,
+            engine.dora_indicators[0]
+        )
+        self.connection.send('<INIT seed="{}" ten="{}" oya="{}" hai="{}" />'.format(
+            seed,
+            self._format_scores(engine.scores),
+            self._relative_seat(engine.dealer_seat),
+            ','.join([str(x) for x in tiles])
+        ))
+
+    def see_draw(self, seat):
+        self.connection.send('<{} />'.format(DRAW_TAGS[self._relative_seat(seat)]))
+
+    def choose_draw_action(self, tile, can_tsumo):
+        self._ask('draw', '<T{}{} />'.format(tile, can_tsumo and ' t="16"' or ''))
+
+        is_riichi = False
+        while True:
+            message = self._read_answer()
+            if message is None:
+                return super().choose_draw_action(tile, can_tsumo)
+
+            if message.startswith('<REACH'):
+                is_riichi = True
+                continue
+
+            if message.startswith('<D'):
+                self._answered()
+                return DISCARD, int(self.decoder.get_attribute_content(message, 'p')), is_riichi
+
+            if message.startswith('<N'):
+                meld_type = self.decoder.get_attribute_content(message, 'type')
+                # answers for previous discard offers can be there
+                if meld_type is None or meld_type in CALL_TYPES:
+                    continue
+
+                self._answered()
+                if meld_type == '7':
+                    return TSUMO, None, False
+
+                tile = self.decoder.get_attribute_content(message, 'hai')
+                tile = int(tile) if tile is not None else None
+                if meld_type == '4':
+                    return CLOSED_KAN, tile, False
+                if meld_type == '5':
+                    return ADDED_KAN, tile, False
+
+                # kyuushuu kyuuhai and other unsupported answers
+                return None, tile, False
+
+    def see_discard(self, seat, tile, is_tsumogiri, offer):
+        relative_seat = self._relative_seat(seat)
+        tag = DISCARD_TAGS[relative_seat]
+        if is_tsumogiri:
+            tag = tag.lower()
+
+        if not offer:
+            self.connection.send('<{}{} />'.format(tag, tile))
+            return None
+
+        flags = sum([OFFER_FLAGS[x] for x in offer])
+        self._ask('call', '<{}{} t="{}" />'.format(tag, tile, flags))
+
+        while True:
+            message = self._read_answer()
+            if message is None:
+                return super().see_discard(seat, tile, is_tsumogiri, offer)
+
+            if not message.startswith('<N'):
+                continue
+
+            self._answered()
+            meld_type = self.decoder.get_attribute_content(message, 'type')
+            if meld_type is None:
+                return None
+
+            call_type = CALL_TYPES.get(meld_type, meld_type)
+            tiles = [self.decoder.get_attribute_content(message, x) for x in ['hai0', 'hai1']]
+            return call_type, [int(x) for x in tiles if x is not None]
+
+    def choose_discard_after_call(self):
+        while True:
+            message = self._read_answer()
+            if message is None:
+                return self.engine.hands[self.seat][-1]
+
+            if message.startswith('<D'):
+                self._answered()
+                return int(self.decoder.get_attribute_content(message, 'p'))
+
+    def see_meld(self, meld):
+        tag = '<N who="{}" m="{}" />'.format(self._relative_seat(meld.who), encode_meld(meld))
+        # bot discards after the meld confirmation
+        if meld.who == self.seat and meld.type in [Meld.PON, Meld.CHI]:
+            self._ask('discard_after_call', tag)
+        else:
+            self.connection.send(tag)
+
+    def see_riichi(self, seat, step):
+        tag = '<REACH who="{}" step="{}"'.format(self._relative_seat(seat), step)
+        if step == 2:
+            tag += ' ten="{}"'.format(self._format_scores(self.engine.scores))
+        self.connection.send(tag + ' />')
+
+    def see_dora_indicator(self, tile):
+        self.connection.send('<DORA hai="{}" />'.format(tile))
+
+    def see_round_result(self, result, is_last):
+        scores = self._rotate(self.engine.scores)
+        deltas = self._rotate(result['deltas'])
+        sc = ','.join(['{},{}'.format((x - y) // 100, y // 100) for x, y in zip(scores, deltas)])
+        ba = 'ba="{},{}"'.format(self.count_of_honba_sticks, self.count_of_riichi_sticks)
+
+        if result['type'] == AGARI:
+            tag = '<AGARI {} hai="{}" m="{}" machi="{}" ten="{},{},0" who="{}" fromWho="{}" sc="{}"'.format(
+                ba,
+                ','.join([str(x) for x in result['hand']]),
+                ','.join([str(encode_meld(x)) for x in result['melds']]),
+                result['win_tile'],
+                result['fu'],
+                result['cost'],
+                self._relative_seat(result['who']),
+                self._relative_seat(result['from_who']),
+                sc
+            )
+        else:
+            tag = '<RYUUKYOKU {} sc="{}"'.format(ba, sc)
+
+        if is_last:
+            uma = self._rotate(self.engine.uma)
+            tag += ' owari="{}"'.format(','.join(['{},{:.1f}'.format(x // 100, y) for x, y in zip(scores, uma)]))
+
+        self.connection.send(tag + ' />')
+
+    def end_game(self, engine):
+        self.connection.send('<PROF lobby="0" type="{}" add="" />'.format(self.game_type))
+        self.game_ended.set()
+
+    def _ask(self, name, message):
+        # bot can send more answers than we expect,
+        # for example meld answer after the win answer
+        self.connection.drain()
+        self._question = (name, time.perf_counter())
+        self.connection.send(message)
+
+    def _answered(self):
+        name, started_at = self._question
+        self.stats.add(name, self.name, time.perf_counter() - started_at)
+
+    def _read_answer(self):
+        if self.is_auto_play:
+            return None
+
+        message = self.connection.read(self.reply_timeout)
+        if message is None:
+            logger.warning('{} is not answering, server will play instead of him'.format(self.name))
+            self.is_auto_play = True
+        return message
+
+    def _wait_for(self, tag):
+        while True:
+            message = self._read_answer()
+            if message is None or message.startswith(tag):
+                return
+
+    def _relative_seat(self, seat):
+        return (seat - self.seat) % 4
+
+    def _absolute_seat(self, relative_seat):
+        return (relative_seat + self.seat) % 4
+
+    def _rotate(self, values):
+        """
+        :param values: list by absolute seats
+        :return: list by relative seats
+        """
+        return [values[self._absolute_seat(x)] for x in range(0, 4)]
+
+    def _format_scores(self, scores):
+        return ','.join([str(x // 100) for x in self._rotate(scores)])
+
+
+class RequestHandler(socketserver.BaseRequestHandler):
+    """
+    Authentication and game search for one bot
+    """
+
+    def handle(self):
+        connection = Connection(self.request)
+        timeout = self.server.reply_timeout
+
+        message = connection.read(timeout)
+        if not message or not message.startswith('<HELO'):
+            return
+
+        decoder = TenhouDecoder()
+        name = unquote(decoder.get_attribute_content(message, 'name') or 'NoName')
+        connection.send('<HELO uname="{}" auth="{}" />'.format(quote(name), AUTH_STRING))
+
+        message = connection.read(timeout)
+        if not message or decoder.get_attribute_content(message, 'val') != decoder.generate_auth_token(AUTH_STRING):
+            logger.warning('{} was not authenticated'.format(name))
+            return
+        connection.send('<LN />')
+
+        game_type = None
+        while game_type is None:
+            message = connection.read(timeout)
+            if message is None:
+                return
+
+            if message.startswith('<JOIN'):
+                lobby_and_type = decoder.get_attribute_content(message, 't').split(',')
+                game_type = int(lobby_and_type[1])
+
+        if game_type & SANMA:
+            logger.warning('{} is looking for sanma, it is not supported'.format(name))
+            return
+
+        agent = NetworkAgent(connection, name, game_type, timeout)
+        self.server.join(agent)
+        agent.game_ended.wait()
+
+        # bot is saying goodbye after the game
+        while message is not None and not message.startswith('<BYE'):
+            message = connection.read(timeout)
+
+
+class TenhouServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    # how much bots are playing at one table, other seats are taken by tsumogiri players
+    network_seats = 4
+    # seconds for each bot answer
+    reply_timeout = 10
+    # reply latency by decision and bot name
+    stats = None
+
+    count_of_games = 0
+    count_of_rounds = 0
+    count_of_invalid_actions = 0
+    count_of_auto_play_bots = 0
+    # it is set after each finished game
+    game_finished = None
+
+    # game type -> bots that are waiting for the game
+    _lobby = None
+    _lock = None
+    # seeds for games
+    _generator = None
+
+    def __init__(self, address, network_seats=4, reply_timeout=10, seed=None):
+        """
+        :param seed: the same seed gives the same games seeds
+        """
+        super().__init__(address, RequestHandler)
+        self.network_seats = network_seats
+        self.reply_timeout = reply_timeout
+        self.stats = LatencyStats()
+        self.game_finished = threading.Condition()
+        self._lobby = {}
+        self._lock = threading.Lock()
+        self._generator = random.Random(seed)
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def join(self, agent):
+        with self._lock:
+            waiting = self._lobby.setdefault(agent.game_type, [])
+            waiting.append(agent)
+            if len(waiting) < self.network_seats:
+                return
+
+            agents = waiting[:]
+            del waiting[:]
+            seed = self._generator.getrandbits(64)
+
+        agents += [TsumogiriAgent() for _ in range(0, 4 - len(agents))]
+        random.Random(seed).shuffle(agents)
+
+        thread = threading.Thread(target=self.play_game, args=(agents, agent.game_type, seed), daemon=True)
+        thread.start()
+
+    def play_game(self, agents, game_type, seed):
+        engine = GameEngine(
+            agents,
+            seed,
+            is_hanchan=bool(game_type & HANCHAN),
+            has_aka_dora=not game_type & NO_AKA_DORA,
+            has_open_tanyao=not game_type & NO_OPEN_TANYAO
+        )
+
+        try:
+            engine.play_game()
+        except Exception as e:
+            logger.exception('Game {} was crashed'.format(seed), exc_info=e)
+            for agent in agents:
+                if isinstance(agent, NetworkAgent):
+                    agent.game_ended.set()
+            return
+
+        logger.info('Game {} was finished: {}'.format(seed, engine.scores))
+
+        network_agents = [x for x in agents if isinstance(x, NetworkAgent)]
+        with self.game_finished:
+            self.count_of_games += 1
+            self.count_of_rounds += len(engine.results)
+            self.count_of_invalid_actions += sum([engine.invalid_actions[x.seat] for x in network_agents])
+            self.count_of_auto_play_bots += len([x for x in network_agents if x.is_auto_play])
+            for agent in network_agents:
+                self.stats.merge(agent.stats)
+            self.game_finished.notify_all()
+
+    def wait_for_games(self, count_of_games, timeout=None):
+        """
+        :return: False if games were not finished in timeout
+        """
+        with self.game_finished:
+            return self.game_finished.wait_for(lambda: self.count_of_games >= count_of_games, timeout)
+
+    def format_summary(self, seconds):
+        lines = [
+            'Games: {}, rounds: {}, seconds: {:.1f}'.format(self.count_of_games, self.count_of_rounds, seconds),
+            'Decisions: {}, per second: {:.1f}'.format(len(self.stats), len(self.stats) / max(seconds, 1)),
+            'Invalid actions: {}, bots were replaced by server: {}'.format(
+                self.count_of_invalid_actions,
+                self.count_of_auto_play_bots
+            ),
+            self.stats.format_summary(),
+        ]
+        return '\n'.join(lines)
+
+
+def main():
+    parser = OptionParser()
+
+    parser.add_option('-H', '--host',
+                      type='string',
+                      default='127.0.0.1',
+                      help='Host to listen. Default is 127.0.0.1')
+
+    parser.add_option('-p', '--port',
+                      type='int',
+                      default=10080,
+                      help='Port to listen. Set it as TENHOU_PORT for bots. Default is 10080')
+
+    parser.add_option('-s', '--seats',
+                      type='int',
+                      default=4,
+                      help='How much bots are playing at one table, '
+                           'other seats are taken by tsumogiri players. Default is 4')
+
+    parser.add_option('-g', '--games',
+                      type='int',
+                      default=0,
+                      help='Stop the server after this count of games. Default is 0, it means never stop')
+
+    parser.add_option('-t', '--timeout',
+                      type='int',
+                      default=10,
+                      help='Seconds for each bot answer. Default is 10')
+
+    parser.add_option('-r', '--seed',
+                      type='int',
+                      default=None,
+                      help='Seed for games seeds, the same seed gives the same walls and seats. Default is random')
+
+    opts, _ = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(threadName)s: %(message)s')
+
+    server = TenhouServer((opts.host, opts.port), network_seats=opts.seats, reply_timeout=opts.timeout,
+                          seed=opts.seed)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    logger.info('Server is listening on {}:{}'.format(opts.host, server.port))
+
+    start_time = time.monotonic()
+    try:
+        server.wait_for_games(opts.games or float('inf'))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    logger.info('Results:\n{}'.format(server.format_summary(time.monotonic() - start_time)))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,16 @@
 # -*- coding: utf-8 -*-
+import time
 import unittest
 
+from mahjong.tests_mixin import TestMixin
+
 from reproducer import TenhouLogReproducer, SocketMock
 from tenhou.client import TenhouClient
 from tenhou.decoder import TenhouDecoder, Meld
+from tenhou.delay import HumanLikeDelay
 
 
-class TenhouClientTestCase(unittest.TestCase):
+class TenhouClientTestCase(unittest.TestCase, TestMixin):
 
     def setUp(self):
         self.client = None
@@ -80,3 +84,107 @@ class TenhouClientTestCase(unittest.TestCase):
 
         # end of commands is correct way to end log reproducing
         self.assertTrue('End of commands' in str(context.exception))
+
+    def test_human_like_delay(self):
+        self.client = TenhouClient(SocketMock(None, 'Get: <LN/>'))
+        self.client.connect()
+        self.assertEqual(self.client.delay.seconds('discard'), 0)
+
+        delay = HumanLikeDelay({'discard': (1, 2), 'round_end': (7, 7)})
+        self.assertTrue(1 <= delay.seconds('discard') <= 2)
+        self.assertEqual(delay.seconds('not_existing_action'), 0)
+
+        # time spent on the decision is the part of the delay
+        self.assertTrue(delay.seconds('round_end', time.monotonic() - 3) <= 4)
+        self.assertEqual(delay.seconds('discard', time.monotonic() - 3), 0)
+
+    def test_split_messages(self):
+        socket_mock = SocketMock(None, 'Get: <LN/>')
+        # long message is split between packets
+        socket_mock.commands = ['<HELO uname="Name" ', 'auth="20170415-1111111" />\x00<LN', '/>\x00<Z />\x00']
+        self.client = TenhouClient(socket_mock)
+        self.client.connect()
+
+        messages = self.client.loop.run_until_complete(self.client._get_multiple_messages())
+        self.assertEqual(messages, ['<HELO uname="Name" auth="20170415-1111111" />'])
+
+        messages = self.client.loop.run_until_complete(self.client._get_multiple_messages())
+        self.assertEqual(messages, ['<LN/>', '<Z />'])
+        self.assertFalse(self.client.is_connection_closed)
+
+    def test_closed_connection(self):
+        socket_mock = SocketMock(None, 'Get: <LN/>')
+        socket_mock.commands = ['<HELO uname="Name" auth="20170415-1111111" />\x00', '<LN/>\x00', '']
+        self.client = TenhouClient(socket_mock)
+        self.client.connect()
+        self.assertTrue(self.client.authenticate())
+
+        self.client.start_game()
+        self.assertTrue(self.client.is_connection_closed)
+        self.assertFalse(self.client.game_is_continue)
+
+    def test_decision_deadline(self):
+        self.client = TenhouClient(SocketMock(None, 'Get: <LN/>'))
+        self.client.connect()
+        self.client.decision_timeout = 0.1
+
+        def slow_decision():
+            time.sleep(0.5)
+            return 'slow'
+
+        result = self.client.loop.run_until_complete(
+            self.client._make_decision(lambda x: x, lambda: 'fallback', time.monotonic(), 'fast')
+        )
+        self.assertEqual(result, 'fast')
+
+        result = self.client.loop.run_until_complete(
+            self.client._make_decision(slow_decision, lambda: 'fallback', time.monotonic())
+        )
+        self.assertEqual(result, 'fallback')
+
+        # there is no time left for the decision
+        result = self.client.loop.run_until_complete(
+            self.client._make_decision(lambda: 'fast', lambda: 'fallback', time.monotonic() - 1)
+        )
+        self.assertEqual(result, 'fallback')
+
+    def test_late_decision_does_not_change_ai_state(self):
+        self.client = TenhouClient(SocketMock(None, 'Get: <LN/>'))
+        self.client.connect()
+        self.client.decision_timeout = 0.1
+        ai = self.client.player.ai
+
+        def slow_decision():
+            time.sleep(0.3)
+            ai.in_defence = True
+            ai.previous_shanten = 0
+            return 'slow'
+
+        result = self.client.loop.run_until_complete(
+            self.client._make_decision(slow_decision, lambda: 'fallback', time.monotonic())
+        )
+        self.assertEqual(result, 'fallback')
+        self.assertIsNotNone(self.client.late_decision)
+
+        self.client.loop.run_until_complete(self.client._finish_late_decision())
+        self.assertIsNone(self.client.late_decision)
+        self.assertEqual(ai.in_defence, False)
+        self.assertEqual(ai.previous_shanten, 7)
+
+    def test_fallback_discard(self):
+        self.client = TenhouClient(SocketMock(None, 'Get: <LN/>'))
+        self.client.connect()
+
+        table = self.client.table
+        tiles = self._string_to_136_array(sou='123456', pin='12345', man='11')
+        table.player.init_hand(tiles)
+        drawn_tile = self._string_to_136_tile(honors='7')
+        table.player.draw_tile(drawn_tile)
+
+        # tsumogiri without riichi on the table
+        self.assertEqual(self.client._fallback_discard(drawn_tile), drawn_tile)
+
+        table.add_called_riichi(2)
+        table.add_discarded_tile(2, self._string_to_136_tile(pin='5'), False)
+        tile = self.client._fallback_discard(drawn_tile)
+        self.assertEqual(self._to_string([tile]), '5p')
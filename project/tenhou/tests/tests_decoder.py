@@ -200,3 +200,22 @@ class TenhouDecoderTestCase(unittest.TestCase):
 
         self.assertFalse(decoder.is_discarded_tile_message('<GO type="9" lobby="0" gpid=""/>'))
         self.assertFalse(decoder.is_discarded_tile_message('<FURITEN show="1" />'))
+
+    def test_get_attribute_content(self):
+        decoder = TenhouDecoder()
+        message = '<GO type="9" lobby="0" gpid=""/>'
+
+        self.assertEqual(decoder.get_attribute_content(message, 'type'), '9')
+        # empty attribute
+        self.assertEqual(decoder.get_attribute_content(message, 'gpid'), None)
+        self.assertEqual(decoder.get_attribute_content(message, 'oya'), None)
+        # attribute name was matched as suffix before
+        self.assertEqual(decoder.get_attribute_content(message, 'pe'), '9')
+
+        # cache should be updated for the new message
+        self.assertEqual(decoder.get_attribute_content('<GO type="169"/>', 'type'), '169')
+
+    def test_parse_attributes(self):
+        decoder = TenhouDecoder()
+        message = '<REACH who="1" step="1"/><REACH who="2" step="2"/>'
+        self.assertEqual(decoder.parse_attributes(message), {'who': '1', 'step': '1'})
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+
+from reproducer import compile_log_task, replay_log
+from tenhou.log_archive import LogArchive, import_logs
+
+LOG = ('<mjloggm ver="2.3"><GO type="169" lobby="0"/><TAIKYOKU oya="0"/>'
+       '<INIT seed="0,0,0,2,3,52" ten="250,250,250,250" oya="0" '
+       'hai0="0,4,8,12,16,20,24,28,32,36,40,44,48" hai1="1,5,9,13,17,21,25,29,33,37,41,45,49" '
+       'hai2="2,6,10,14,18,22,26,30,34,38,42,46,50" hai3="3,7,11,15,19,23,27,31,35,39,43,47,51"/>'
+       '<T100/><D100/><U101/><E101/><V102/><F102/><W103/><G103/>'
+       '<RYUUKYOKU ba="0,0" sc="250,0,250,0,250,0,250,0" owari="250,0,250,0,250,0,250,0" /></mjloggm>')
+
+
+class LogArchiveTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.logs_folder = os.path.join(self.folder, 'logs')
+        self.archive_path = os.path.join(self.folder, 'logs.archive')
+        os.mkdir(self.logs_folder)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_import_logs(self):
+        self._write_log('2017041516gm-0089-0000-23b4752d', LOG.encode('utf-8'))
+        # the same log, but gzipped
+        self._write_log('2017041516gm-0089-0000-00000000.mjlog', gzip.compress(LOG.encode('utf-8')))
+        self._write_log('2017041516gm-0089-0000-11111111', 'second log'.encode('utf-8'))
+
+        self.assertEqual(import_logs(self.logs_folder, self.archive_path), 3)
+
+        archive = LogArchive(self.archive_path)
+        self.assertEqual(archive.get('2017041516gm-0089-0000-23b4752d'), LOG)
+        self.assertEqual(archive.get('2017041516gm-0089-0000-00000000'), LOG)
+        self.assertEqual(archive.get('2017041516gm-0089-0000-11111111'), 'second log')
+        # the same content is stored once
+        self.assertEqual(len(archive.blobs), 2)
+        self.assertRaises(KeyError, archive.get, 'not-existing-log')
+        archive.close()
+
+        # new logs are added to the existing archive
+        shutil.rmtree(self.logs_folder)
+        os.mkdir(self.logs_folder)
+        self._write_log('2017041516gm-0089-0000-22222222', 'third log'.encode('utf-8'))
+        self.assertEqual(import_logs(self.logs_folder, self.archive_path), 4)
+
+        archive = LogArchive(self.archive_path)
+        self.assertEqual(archive.get('2017041516gm-0089-0000-23b4752d'), LOG)
+        self.assertEqual(archive.get('2017041516gm-0089-0000-22222222'), 'third log')
+        archive.close()
+
+    def test_replay_log_from_archive(self):
+        self._write_log('2017041516gm-0089-0000-23b4752d', LOG.encode('utf-8'))
+        import_logs(self.logs_folder, self.archive_path)
+
+        log_id, events, error = compile_log_task(('2017041516gm-0089-0000-23b4752d', self.archive_path))
+        self.assertIsNone(error)
+
+        log_id, total, results, error = replay_log((log_id, {}, events))
+        self.assertIsNone(error)
+        self.assertEqual(total['TOTAL'], 1)
+
+        # missing log shouldn't be downloaded
+        log_id, events, error = compile_log_task(('2017041516gm-0089-0000-33333333', self.archive_path))
+        self.assertIn('is not in the archive', error)
+
+    def test_empty_archive(self):
+        import_logs(self.logs_folder, self.archive_path)
+
+        # archive without logs is used as well, logs are not loaded from the folder or network
+        log_id, events, error = compile_log_task(('2017041516gm-0089-0000-23b4752d', self.archive_path))
+        self.assertIn('is not in the archive', error)
+
+    def _write_log(self, file_name, data):
+        with open(os.path.join(self.logs_folder, file_name), 'wb') as f:
+            f.write(data)
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+from tenhou.decoder import TenhouDecoder
+from tenhou.log_events import AGARI, DISCARD, DORA, DRAW, HAI, INIT, MELD, RIICHI, SCORE, compile_log, \
+    iter_events, replay_events
+
+LOG = ('<mjloggm ver="2.3"><GO type="169" lobby="0"/><TAIKYOKU oya="0"/>'
+       '<INIT seed="1,2,1,2,3,52" ten="240,250,250,250" oya="1" '
+       'hai0="0,4,8,12,16,20,24,28,32,36,40,44,48" hai1="1,5,9,13,17,21,25,29,33,37,41,45,49" '
+       'hai2="2,6,10,14,18,22,26,30,34,38,42,46,50" hai3="3,7,11,15,19,23,27,31,35,39,43,47,51"/>'
+       '<T100/><D100/><U101/><E101/><V102/><F102/><W103/><G103/>'
+       '<REACH who="1" step="1"/><N who="2" m="34314" /><DORA hai="110" />'
+       '<T104/><D104/><AGARI ba="0,0" who="1" fromWho="0" owari="250,0,250,0,250,0,250,0" /></mjloggm>')
+
+
+class LogEventsTestCase(unittest.TestCase):
+
+    def test_compile_log(self):
+        events = list(iter_events(compile_log(LOG)))
+
+        self.assertEqual([x[0] for x in events[:4]], [SCORE] * 4)
+        self.assertEqual(events[0][4], 240)
+        self.assertEqual([x[0] for x in events[4:56]], [HAI] * 52)
+        self.assertEqual(events[56], (INIT, 1, 52, 1, 2 << 8 | 1))
+
+        self.assertEqual(events[57], (DRAW, 0, 100, 0, 0))
+        self.assertEqual(events[58], (DISCARD, 0, 100, 0, 0))
+        self.assertEqual(events[65], (RIICHI, 1, 255, 1, 0))
+        self.assertEqual(events[66], (MELD, 2, 255, 0, 34314))
+        self.assertEqual(events[67], (DORA, 0, 110, 0, 0))
+        self.assertEqual(events[-1], (AGARI, 1, 255, 0, 0))
+
+    def test_decode_meld(self):
+        decoder = TenhouDecoder()
+        meld = decoder.decode_meld(2, 34314)
+        expected = decoder.parse_meld('<N who="2" m="34314" />')
+
+        self.assertEqual(meld.who, expected.who)
+        self.assertEqual(meld.type, expected.type)
+        self.assertEqual(meld.tiles, expected.tiles)
+        self.assertEqual(meld.called_tile, expected.called_tile)
+
+    def test_replay_events(self):
+        events = compile_log(LOG)
+
+        total, results = replay_events(events, player_position=0)
+        self.assertEqual(total['TOTAL'], 2)
+
+        total, results = replay_events(events, player_position=2)
+        self.assertEqual(total['TOTAL'], 1)
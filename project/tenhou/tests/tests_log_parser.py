@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+import mmap
+import random
+import tempfile
+import unittest
+
+from tenhou.log_parser import iter_rounds, iter_tags, parse_rounds_by_characters, remove_shuffle
+
+
+class LogParserTestCase(unittest.TestCase):
+
+    def test_iter_tags(self):
+        tags = list(iter_tags('<GO type="169"/>\n<T10/><D10/>tail'))
+        self.assertEqual(tags, ['<GO type="169"/>', '\n<T10/>', '<D10/>'])
+
+    def test_remove_shuffle(self):
+        tag = '<SHUFFLE seed="mt19937ar-sha512-n288-base64,lMD" ref=""/>'
+        self.assertEqual(remove_shuffle(tag), tag)
+
+        tag = '<INIT shuffle="abc,def" seed="0,0,0,2,3,52"/>'
+        self.assertEqual(remove_shuffle(tag), '<INIT  seed="0,0,0,2,3,52"/>')
+
+    def test_rounds_parity_with_characters_loop(self):
+        generator = random.Random(20170415)
+        for _ in range(0, 20):
+            log = self._make_log(generator)
+            expected = parse_rounds_by_characters(log)
+
+            self.assertEqual(list(iter_rounds(log)), expected)
+            self.assertEqual(list(iter_rounds(log.encode('utf-8'))), expected)
+            self.assertEqual(list(iter_rounds(memoryview(log.encode('utf-8')))), expected)
+
+        # not finished game
+        log = self._make_log(generator, is_finished=False)
+        self.assertEqual(list(iter_rounds(log)), parse_rounds_by_characters(log))
+
+    def test_rounds_from_memory_mapped_file(self):
+        log = self._make_log(random.Random(1))
+        with tempfile.TemporaryFile() as f:
+            f.write(log.encode('utf-8'))
+            f.flush()
+
+            content = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.assertEqual(list(iter_rounds(content)), parse_rounds_by_characters(log))
+            content.close()
+
+    def _make_log(self, generator, is_finished=True):
+        tags = ['<mjloggm ver="2.3">', '<SHUFFLE seed="mt19937ar" ref=""/>', '<GO type="169" lobby="0"/>',
+                '<UN n0="%4E%6F%4E%61%6D%65" dan="0,0,0,0"/>', '<TAIKYOKU oya="0"/>']
+
+        for round_number in range(0, generator.randint(1, 8)):
+            wall = list(range(0, 136))
+            generator.shuffle(wall)
+            hands = [','.join([str(x) for x in wall[i * 13:(i + 1) * 13]]) for i in range(0, 4)]
+            tags.append('<INIT shuffle="{}" seed="{},0,0,2,3,{}" ten="250,250,250,250" oya="0" '
+                        'hai0="{}" hai1="{}" hai2="{}" hai3="{}"/>'.format(generator.random(), round_number,
+                                                                           wall[-1], *hands))
+
+            for i in range(0, generator.randint(4, 60)):
+                tile = wall[52 + i]
+                tags.append('<{}{}/>'.format('TUVW'[i % 4], tile))
+                tags.append('<{}{}/>'.format('DEFG'[i % 4], tile))
+
+            tags.append('<RYUUKYOKU ba="0,0" sc="250,0,250,0,250,0,250,0" />')
+
+        if is_finished:
+            tags[-1] = tags[-1].replace(' />', ' owari="250,0,250,0,250,0,250,0" />')
+        tags.append('</mjloggm>')
+
+        return ''.join(tags)
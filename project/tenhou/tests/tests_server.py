@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+import threading
+import unittest
+
+from mahjong.meld import Meld
+
+from tenhou.client import TenhouClient
+from tenhou.decoder import TenhouDecoder
+from tenhou.server import TenhouServer, encode_meld
+from utils.settings_handler import settings
+
+
+class ServerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        # fixed seed gives the same game in each run
+        self.server = TenhouServer(('127.0.0.1', 0), network_seats=1, reply_timeout=10, seed=2)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_play_game(self):
+        values = {
+            'TENHOU_HOST': '127.0.0.1',
+            'TENHOU_PORT': self.server.port,
+            'USER_ID': 'LocalBot',
+            # tonpusen ari-ari
+            'GAME_TYPE': '1',
+            'HUMAN_LIKE_DELAY': {},
+        }
+
+        with settings.override(values):
+            client = TenhouClient()
+            client.connect()
+            self.assertTrue(client.authenticate())
+            client.start_game()
+
+        self.assertTrue(self.server.wait_for_games(1, timeout=10))
+        self.assertTrue(self.server.count_of_rounds >= 4)
+        self.assertEqual(self.server.count_of_invalid_actions, 0)
+        self.assertEqual(self.server.count_of_auto_play_bots, 0)
+        self.assertTrue(len(self.server.stats) > 0)
+
+        # final results were received by the client
+        self.assertFalse(client.game_is_continue)
+        self.assertNotEqual([x.uma for x in client.table.players], [0, 0, 0, 0])
+
+    def test_encode_meld(self):
+        decoder = TenhouDecoder()
+        melds = [
+            Meld(Meld.CHI, [21, 26, 30], True, 26, 1, 0),
+            Meld(Meld.PON, [100, 101, 103], True, 103, 2, 0),
+            Meld(Meld.KAN, [40, 41, 42, 43], False, 42, 3, 3),
+        ]
+
+        for meld in melds:
+            result = decoder.decode_meld(meld.who, encode_meld(meld))
+            self.assertEqual(result.type, meld.type)
+            self.assertEqual(result.tiles, meld.tiles)
+            self.assertEqual(result.called_tile, meld.called_tile)
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+import threading
+import unittest
+
+from utils.settings_handler import settings
+
+
+class SupervisorTestCase(unittest.TestCase):
+
+    def test_settings_override(self):
+        user_id = settings.USER_ID
+        results = {}
+
+        def read_settings(name, values):
+            with settings.override(values):
+                with settings.override({'LOBBY': '1111'}):
+                    results[name] = [settings.USER_ID, settings.GAME_TYPE, settings.LOBBY]
+                results[name].append(settings.LOBBY)
+
+        threads = [
+            threading.Thread(target=read_settings, args=('first', {'USER_ID': 'ID1', 'GAME_TYPE': '1'})),
+            threading.Thread(target=read_settings, args=('second', {'USER_ID': 'ID2', 'LOBBY': '2'})),
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results['first'], ['ID1', '1', '1111', settings.LOBBY])
+        self.assertEqual(results['second'], ['ID2', settings.GAME_TYPE, '1111', '2'])
+        # settings of other threads were not changed
+        self.assertEqual(settings.USER_ID, user_id)
+
+    def test_ai_class_override(self):
+        with settings.override({'AI_PACKAGE': 'first_version'}):
+            self.assertEqual(settings.AI_CLASS.__module__, 'game.ai.first_version.main')
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """
+    Bounded dictionary that drops least recently used items.
+    It counts hits and misses, so we can choose the size from logs
+    """
+    max_size = None
+    hits = 0
+    misses = 0
+
+    _items = None
+
+    def __init__(self, max_size):
+        """
+        :param max_size: count of stored items, zero disables the cache
+        """
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+
+    def get(self, key):
+        """
+        :return: cached value or None
+        """
+        value = self._items.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._items.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        if self.max_size <= 0:
+            return
+
+        self._items[key] = value
+        self._items.move_to_end(key)
+        if len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def clear(self):
+        """
+        Remove cached items, counters are not reset
+        """
+        self._items.clear()
+
+    @property
+    def hit_rate(self):
+        requests = self.hits + self.misses
+        return requests and self.hits / requests or 0
+
+    def info(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hit_rate, 3),
+            'size': len(self._items),
+            'max_size': self.max_size,
+        }
+
+    def __len__(self):
+        return len(self._items)
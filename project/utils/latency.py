@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+"""
+Latency histograms of AI decisions.
+
+They are enabled with LATENCY_STATS setting, saved to the logs folder after each game,
+and summary for all saved games can be printed with:
+    python -m utils.latency -d logs
+"""
+import glob
+import json
+import math
+import os
+import time
+from functools import wraps
+from optparse import OptionParser
+
+# each power of two is split to the few buckets, so percentiles are precise enough
+BUCKETS_PER_POWER_OF_TWO = 4
+FILE_EXTENSION = '.latency.json'
+
+
+def measure(name):
+    """
+    Record the method latency to the table stats.
+    It can be used only for methods of objects with player attribute
+    :param name: decision name for the stats
+    """
+    def decorator(function):
+        @wraps(function)
+        def wrapper(self, *args, **kwargs):
+            stats = self.player.table.latency
+            # stats are disabled
+            if stats is None:
+                return function(self, *args, **kwargs)
+
+            play_state = self.player.play_state
+            start = time.perf_counter()
+            try:
+                return function(self, *args, **kwargs)
+            finally:
+                stats.add(name, play_state, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def bucket_index(microseconds):
+    if microseconds < 1:
+        return 0
+    return int(math.log2(microseconds) * BUCKETS_PER_POWER_OF_TWO) + 1
+
+
+def bucket_upper_bound(index):
+    """
+    :return: microseconds
+    """
+    return 2 ** (index / BUCKETS_PER_POWER_OF_TWO)
+
+
+class Histogram(object):
+    count = 0
+    total = 0
+    max = 0
+    # bucket index -> count of calls
+    buckets = None
+
+    def __init__(self):
+        self.buckets = {}
+
+    def add(self, microseconds):
+        index = bucket_index(microseconds)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.total += microseconds
+        if microseconds > self.max:
+            self.max = microseconds
+
+    def merge(self, other):
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def percentile(self, percent):
+        """
+        :param percent: from 0 to 100
+        :return: microseconds, upper bound of the bucket
+        """
+        if not self.count:
+            return 0
+
+        target = self.count * percent / 100
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= target:
+                return min(bucket_upper_bound(index), self.max)
+
+        return self.max
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'total': self.total,
+            'max': self.max,
+            'buckets': {str(x): y for x, y in self.buckets.items()},
+        }
+
+    @staticmethod
+    def from_dict(data):
+        histogram = Histogram()
+        histogram.count = data['count']
+        histogram.total = data['total']
+        histogram.max = data['max']
+        histogram.buckets = {int(x): y for x, y in data['buckets'].items()}
+        return histogram
+
+
+class LatencyStats(object):
+    """
+    Histograms of the decisions latency by decision name and player play state
+    """
+    # (decision name, play state) -> Histogram
+    histograms = None
+
+    def __init__(self):
+        self.histograms = {}
+
+    def __len__(self):
+        return sum([x.count for x in self.histograms.values()])
+
+    def add(self, name, play_state, seconds):
+        key = (name, play_state)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        histogram.add(seconds * 1000000)
+
+    def merge(self, other):
+        for key, histogram in other.histograms.items():
+            if key not in self.histograms:
+                self.histograms[key] = Histogram()
+            self.histograms[key].merge(histogram)
+
+    def clear(self):
+        self.histograms = {}
+
+    def summary(self):
+        """
+        :return: list of (name, play state, count, p50, p99, max) sorted by name and state,
+        latency is in milliseconds
+        """
+        results = []
+        for (name, play_state), histogram in sorted(self.histograms.items()):
+            results.append((
+                name,
+                play_state,
+                histogram.count,
+                histogram.percentile(50) / 1000,
+                histogram.percentile(99) / 1000,
+                histogram.max / 1000,
+            ))
+        return results
+
+    def format_summary(self):
+        lines = ['{:<30} {:<22} {:>8} {:>10} {:>10} {:>10}'.format('decision', 'state', 'count',
+                                                                   'p50 ms', 'p99 ms', 'max ms')]
+        for name, play_state, count, p50, p99, max_value in self.summary():
+            lines.append('{:<30} {:<22} {:>8} {:>10.2f} {:>10.2f} {:>10.2f}'.format(name, play_state, count,
+                                                                                    p50, p99, max_value))
+        return '\n'.join(lines)
+
+    def dump(self, file_path):
+        data = [{'name': name, 'play_state': play_state, 'histogram': histogram.to_dict()}
+                for (name, play_state), histogram in self.histograms.items()]
+        with open(file_path, 'w') as f:
+            json.dump(data, f)
+
+    @staticmethod
+    def load(file_path):
+        stats = LatencyStats()
+        with open(file_path, 'r') as f:
+            for item in json.load(f):
+                stats.histograms[(item['name'], item['play_state'])] = Histogram.from_dict(item['histogram'])
+        return stats
+
+
+def load_all(directory):
+    """
+    :param directory: folder with saved stats
+    :return: LatencyStats with all games and count of games
+    """
+    stats = LatencyStats()
+    files = glob.glob(os.path.join(directory, '*' + FILE_EXTENSION))
+    for file_path in files:
+        stats.merge(LatencyStats.load(file_path))
+    return stats, len(files)
+
+
+def main():
+    parser = OptionParser()
+
+    parser.add_option('-d', '--directory',
+                      type='string',
+                      default=os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'logs'),
+                      help='Folder with saved latency stats. Default is the logs folder')
+
+    opts, _ = parser.parse_args()
+
+    stats, count_of_games = load_all(opts.directory)
+    print('Games: {}'.format(count_of_games))
+    print(stats.format_summary())
+
+
+if __name__ == '__main__':
+    main()
@@ -7,33 +7,61 @@ import hashlib
 
 from utils.settings_handler import settings
 
+LOGS_DIRECTORY = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'logs')
 
-def set_up_logging():
+
+def get_file_path(extension, thread_name=None):
     """
-    Logger for tenhou communication and AI output
+    Path in the logs folder for the bot files
+    :param extension: file extension with the dot
+    :param thread_name: it is added to the file name, to separate bots that are running in one process
     """
-    logs_directory = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'logs')
-    if not os.path.exists(logs_directory):
-        os.mkdir(logs_directory)
+    if not os.path.exists(LOGS_DIRECTORY):
+        os.makedirs(LOGS_DIRECTORY, exist_ok=True)
 
     # we shouldn't be afraid about collision
     # also, we need it to distinguish different bots logs (if they were run in the same time)
     name_hash = hashlib.sha1(settings.USER_ID.encode('utf-8')).hexdigest()[:5]
 
+    file_name = '{}_{}{}'.format(name_hash, datetime.datetime.now().strftime('%Y-%m-%d_%H_%M_%S'), extension)
+    if thread_name:
+        file_name = '{}_{}'.format(thread_name, file_name)
+
+    return os.path.join(LOGS_DIRECTORY, file_name)
+
+
+def set_up_logging(thread_name=None):
+    """
+    Logger for tenhou communication and AI output
+    :param thread_name: log only records from this thread,
+    it is used when few bots are playing in one process
+    """
     logger = logging.getLogger('tenhou')
     logger.setLevel(logging.INFO)
 
     ch = logging.StreamHandler()
     ch.setLevel(logging.INFO)
 
-    file_name = '{}_{}.log'.format(name_hash, datetime.datetime.now().strftime('%Y-%m-%d_%H_%M_%S'))
-    fh = logging.FileHandler(os.path.join(logs_directory, file_name), encoding='utf-8')
+    fh = logging.FileHandler(get_file_path('.log', thread_name), encoding='utf-8')
     fh.setLevel(logging.INFO)
 
     formatter = logging.Formatter('%(asctime)s %(levelname)s: %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
-    ch.setFormatter(formatter)
     fh.setFormatter(formatter)
 
+    if thread_name:
+        def is_thread_record(record):
+            # AI decision workers are named as thread_name_0
+            return record.threadName == thread_name or record.threadName.startswith(thread_name + '_')
+
+        ch.addFilter(is_thread_record)
+        fh.addFilter(is_thread_record)
+
+        # console output is shared by all bots
+        formatter = logging.Formatter('%(asctime)s %(threadName)s %(levelname)s: %(message)s',
+                                      datefmt='%Y-%m-%d %H:%M:%S')
+
+    ch.setFormatter(formatter)
+
     logger.addHandler(ch)
     logger.addHandler(fh)
 
@@ -41,3 +69,5 @@ def set_up_logging():
     logger.setLevel(logging.INFO)
     logger.addHandler(ch)
     logger.addHandler(fh)
+
+    return [ch, fh]
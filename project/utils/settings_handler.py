@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
 import importlib
+import threading
+from contextlib import contextmanager
 
 
 class SettingsSingleton(object):
@@ -9,6 +11,8 @@ class SettingsSingleton(object):
     After this we not should change the object
     """
     instance = None
+    # settings that were changed only for the current thread, see override()
+    thread_values = threading.local()
 
     def __init__(self):
         if not SettingsSingleton.instance:
@@ -16,14 +20,41 @@ class SettingsSingleton(object):
             self.load_ai_class()
 
     def __getattr__(self, name):
+        values = getattr(self.thread_values, 'values', None)
+        if values and name in values:
+            return values[name]
+
         return getattr(self.instance, name)
 
     def __setattr__(self, key, value):
         return setattr(self.instance, key, value)
 
     def load_ai_class(self):
-        module = importlib.import_module('game.ai.{}.main'.format(self.AI_PACKAGE))
-        self.AI_CLASS = getattr(module, 'ImplementationAI')
+        self.AI_CLASS = self.get_ai_class(self.AI_PACKAGE)
+
+    def get_ai_class(self, ai_package):
+        module = importlib.import_module('game.ai.{}.main'.format(ai_package))
+        return getattr(module, 'ImplementationAI')
+
+    @contextmanager
+    def override(self, values):
+        """
+        Change settings only for the current thread,
+        it allows to run few bots with different settings in one process
+        :param values: dict with settings names and values
+        """
+        previous_values = getattr(self.thread_values, 'values', None)
+
+        new_values = dict(previous_values or {})
+        new_values.update(values)
+        if 'AI_PACKAGE' in values:
+            new_values['AI_CLASS'] = self.get_ai_class(values['AI_PACKAGE'])
+
+        self.thread_values.values = new_values
+        try:
+            yield
+        finally:
+            self.thread_values.values = previous_values
 
 
 class Settings(object):